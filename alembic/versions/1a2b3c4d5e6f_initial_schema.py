@@ -0,0 +1,222 @@
+"""initial schema
+
+Revision ID: 1a2b3c4d5e6f
+Revises: 
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1a2b3c4d5e6f'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # схема до первых миграций в репозитории; существующие базы помечаются без выполнения:
+    # alembic stamp 1a2b3c4d5e6f
+    op.create_table('oauth_clients',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('client_id', sa.String(length=100), nullable=False),
+    sa.Column('client_secret', sa.String(length=255), nullable=True),
+    sa.Column('client_bot_token', sa.String(length=255), nullable=True),
+    sa.Column('redirect_url', sa.Text(), nullable=True),
+    sa.Column('grant_types', postgresql.ARRAY(sa.String()), server_default=sa.text("ARRAY['authorization_code']"), nullable=False),
+    sa.Column('scopes', postgresql.ARRAY(sa.String()), server_default=sa.text('ARRAY[]::TEXT[]'), nullable=False),
+    sa.Column('is_confidential', sa.Boolean(), nullable=False),
+    sa.Column('revoked', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('client_id')
+    )
+    op.create_table('roles',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('first_name', sa.String(length=255), nullable=True),
+    sa.Column('last_name', sa.String(length=255), nullable=True),
+    sa.Column('user_name', sa.String(length=255), nullable=False),
+    sa.Column('email', sa.String(length=255), nullable=True),
+    sa.Column('pass', sa.String(length=255), nullable=True),
+    sa.Column('role_id', sa.BigInteger(), nullable=True),
+    sa.Column('status', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['role_id'], ['roles.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('user_name')
+    )
+    op.create_table('coupon_user',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('promo_count', sa.BigInteger(), nullable=True),
+    sa.Column('status', sa.Boolean(), server_default=sa.text('true'), nullable=False),
+    sa.Column('token_hash', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('is_active', sa.Boolean(), server_default=sa.text('true'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_coupon_user_user_id'), 'coupon_user', ['user_id'], unique=False)
+    op.create_table('subtraction',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('card', sa.Boolean(), nullable=False),
+    sa.Column('service_code', sa.String(length=128), nullable=True),
+    sa.Column('amount_value', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('billing_period', sa.String(length=32), nullable=True),
+    sa.Column('next_run', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('status', sa.String(length=32), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=128), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('last_tried_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_subtraction_user_status_next', 'subtraction', ['user_id', 'status', 'next_run'], unique=False)
+    op.create_index(op.f('ix_subtraction_idempotency_key'), 'subtraction', ['idempotency_key'], unique=False)
+    op.create_index(op.f('ix_subtraction_next_run'), 'subtraction', ['next_run'], unique=False)
+    op.create_index(op.f('ix_subtraction_service_code'), 'subtraction', ['service_code'], unique=False)
+    op.create_index(op.f('ix_subtraction_status'), 'subtraction', ['status'], unique=False)
+    op.create_index(op.f('ix_subtraction_user_id'), 'subtraction', ['user_id'], unique=False)
+    op.create_table('user_providers',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('provider_user_id', sa.String(length=255), nullable=False),
+    sa.Column('username', sa.String(length=255), nullable=True),
+    sa.Column('first_name', sa.String(length=255), nullable=True),
+    sa.Column('last_name', sa.String(length=255), nullable=True),
+    sa.Column('photo_url', sa.Text(), nullable=True),
+    sa.Column('is_premium', sa.Boolean(), nullable=True),
+    sa.Column('auth_date', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('provider', 'provider_user_id', name='uq_provider_provider_user_id')
+    )
+    op.create_index(op.f('ix_user_providers_user_id'), 'user_providers', ['user_id'], unique=False)
+    op.create_table('wallets',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('balance', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('payments',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('wallet_id', sa.BigInteger(), nullable=False),
+    sa.Column('amount_value', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('status', sa.String(length=32), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=64), nullable=True),
+    sa.Column('yookassa_payment_id', sa.String(length=128), nullable=True),
+    sa.Column('confirmation_url', sa.String(), nullable=True),
+    sa.Column('confirmation_type', sa.String(length=32), nullable=True),
+    sa.Column('capture', sa.Boolean(), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('metadata_payments', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('closed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_payments_user_status', 'payments', ['user_id', 'status'], unique=False)
+    op.create_index(op.f('ix_payments_idempotency_key'), 'payments', ['idempotency_key'], unique=True)
+    op.create_index(op.f('ix_payments_user_id'), 'payments', ['user_id'], unique=False)
+    op.create_index(op.f('ix_payments_wallet_id'), 'payments', ['wallet_id'], unique=False)
+    op.create_index(op.f('ix_payments_yookassa_payment_id'), 'payments', ['yookassa_payment_id'], unique=False)
+    op.create_index('uq_payments_idempotency_not_null', 'payments', ['idempotency_key'], unique=True, postgresql_where=sa.text('idempotency_key IS NOT NULL'))
+    op.create_table('sessions',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=True),
+    sa.Column('client_id', sa.BigInteger(), nullable=True),
+    sa.Column('access_token', sa.Text(), nullable=True),
+    sa.Column('ip_address', sa.String(), nullable=True),
+    sa.Column('user_agent', sa.Text(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), server_default=sa.text('true'), nullable=False),
+    sa.Column('logged_out_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('provider_id', sa.BigInteger(), nullable=True),
+    sa.ForeignKeyConstraint(['client_id'], ['oauth_clients.id'], ),
+    sa.ForeignKeyConstraint(['provider_id'], ['user_providers.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sessions_provider_id'), 'sessions', ['provider_id'], unique=False)
+    op.create_index('sessions_client_id_index', 'sessions', ['client_id'], unique=False)
+    op.create_index('sessions_user_id_is_active_idx', 'sessions', ['user_id', 'is_active'], unique=False)
+    op.create_table('refresh_tokens',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('session_id', sa.BigInteger(), nullable=False),
+    sa.Column('token_hash', sa.String(length=255), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('revoked', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('used_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('token_hash')
+    )
+    op.create_index('refresh_tokens_session_id_index', 'refresh_tokens', ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('refresh_tokens_session_id_index', table_name='refresh_tokens')
+    op.drop_table('refresh_tokens')
+    op.drop_index(op.f('ix_sessions_provider_id'), table_name='sessions')
+    op.drop_index('sessions_client_id_index', table_name='sessions')
+    op.drop_index('sessions_user_id_is_active_idx', table_name='sessions')
+    op.drop_table('sessions')
+    op.drop_index('idx_payments_user_status', table_name='payments')
+    op.drop_index(op.f('ix_payments_idempotency_key'), table_name='payments')
+    op.drop_index(op.f('ix_payments_user_id'), table_name='payments')
+    op.drop_index(op.f('ix_payments_wallet_id'), table_name='payments')
+    op.drop_index(op.f('ix_payments_yookassa_payment_id'), table_name='payments')
+    op.drop_index('uq_payments_idempotency_not_null', table_name='payments', postgresql_where=sa.text('idempotency_key IS NOT NULL'))
+    op.drop_table('payments')
+    op.drop_table('wallets')
+    op.drop_index(op.f('ix_user_providers_user_id'), table_name='user_providers')
+    op.drop_table('user_providers')
+    op.drop_index('idx_subtraction_user_status_next', table_name='subtraction')
+    op.drop_index(op.f('ix_subtraction_idempotency_key'), table_name='subtraction')
+    op.drop_index(op.f('ix_subtraction_next_run'), table_name='subtraction')
+    op.drop_index(op.f('ix_subtraction_service_code'), table_name='subtraction')
+    op.drop_index(op.f('ix_subtraction_status'), table_name='subtraction')
+    op.drop_index(op.f('ix_subtraction_user_id'), table_name='subtraction')
+    op.drop_table('subtraction')
+    op.drop_index(op.f('ix_coupon_user_user_id'), table_name='coupon_user')
+    op.drop_table('coupon_user')
+    op.drop_table('users')
+    op.drop_table('roles')
+    op.drop_table('oauth_clients')
@@ -0,0 +1,77 @@
+"""coupon_user: unique partial index on active token_hash
+
+Revision ID: 3f1a9c2d7b10
+Revises: 1a2b3c4d5e6f
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import logging
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+logger = logging.getLogger("alembic")
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a9c2d7b10'
+down_revision: Union[str, Sequence[str], None] = '1a2b3c4d5e6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# активные купоны с одинаковым кодом, новые первыми
+DUPLICATES_SQL = """
+SELECT token_hash, array_agg(id ORDER BY created_at DESC, id DESC) AS ids
+FROM coupon_user
+WHERE is_active AND token_hash IS NOT NULL
+GROUP BY token_hash
+HAVING count(*) > 1
+ORDER BY token_hash
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # старые дубли активных кодов: коды уже выданы пользователям, поэтому переписывать их нельзя.
+    # По умолчанию миграция выводит дубли в ошибке и останавливается; с -x coupon_duplicates=deactivate
+    # самый новый купон каждого кода остаётся активным, остальные деактивируются (код не меняется)
+    bind = op.get_bind()
+    duplicates = bind.execute(sa.text(DUPLICATES_SQL)).all()
+    if duplicates:
+        report = "\n".join(
+            f"  token_hash={row.token_hash!r}: активные id {list(row.ids)}" for row in duplicates
+        )
+        mode = context.get_x_argument(as_dictionary=True).get("coupon_duplicates")
+        if mode != "deactivate":
+            raise RuntimeError(
+                f"coupon_user: {len(duplicates)} кодов активны у нескольких купонов:\n{report}\n"
+                "Разберите их вручную или запустите alembic -x coupon_duplicates=deactivate upgrade head "
+                "(активным останется самый новый купон каждого кода)"
+            )
+        logger.warning("coupon_user: деактивируются дубли активных кодов:\n%s", report)
+        op.execute(
+            """
+            UPDATE coupon_user AS c
+            SET is_active = false
+            FROM (
+                SELECT id,
+                       row_number() OVER (PARTITION BY token_hash ORDER BY created_at DESC, id DESC) AS rn
+                FROM coupon_user
+                WHERE is_active AND token_hash IS NOT NULL
+            ) AS d
+            WHERE c.id = d.id AND d.rn > 1
+            """
+        )
+
+    # CONCURRENTLY не блокирует запись в таблицу, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_coupon_user_active_token_hash "
+            "ON coupon_user (token_hash) WHERE is_active"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_coupon_user_active_token_hash")
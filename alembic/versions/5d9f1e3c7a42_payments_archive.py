@@ -0,0 +1,39 @@
+"""payments_archive for retention of stale payments
+
+Revision ID: 5d9f1e3c7a42
+Revises: 8c4e2b7a9d31
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d9f1e3c7a42'
+down_revision: Union[str, Sequence[str], None] = '8c4e2b7a9d31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # те же колонки, что у payments (без ограничений и внешних ключей) + archived_at последней:
+    # retention переносит строки через INSERT ... SELECT payments.*, now().
+    # Новые колонки payments нужно добавлять и сюда, перед archived_at.
+    op.execute("CREATE TABLE IF NOT EXISTS payments_archive (LIKE payments INCLUDING DEFAULTS)")
+    op.add_column(
+        'payments_archive',
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.create_index('idx_payments_archive_user_id', 'payments_archive', ['user_id'])
+    op.create_index('idx_payments_archive_created_at', 'payments_archive', ['created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_payments_archive_created_at', table_name='payments_archive')
+    op.drop_index('idx_payments_archive_user_id', table_name='payments_archive')
+    op.drop_table('payments_archive')
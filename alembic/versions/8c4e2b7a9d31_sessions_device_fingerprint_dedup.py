@@ -0,0 +1,64 @@
+"""sessions: device_fingerprint and unique active session per device
+
+Revision ID: 8c4e2b7a9d31
+Revises: 3f1a9c2d7b10
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e2b7a9d31'
+down_revision: Union[str, Sequence[str], None] = '3f1a9c2d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('sessions', sa.Column('device_fingerprint', sa.String(length=64), nullable=True))
+
+    # отпечаток считается так же, как в SessionRepository: sha256 от user_agent ('' если его нет)
+    op.execute(
+        """
+        UPDATE sessions
+        SET device_fingerprint = encode(sha256(convert_to(coalesce(user_agent, ''), 'UTF8')), 'hex')
+        WHERE is_active
+        """
+    )
+
+    # из активных дублей остаётся самая свежая сессия, остальные закрываются
+    op.execute(
+        """
+        UPDATE sessions AS s
+        SET is_active = false, logged_out_at = now()
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY user_id, client_id, device_fingerprint
+                       ORDER BY last_used_at DESC, id DESC
+                   ) AS rn
+            FROM sessions
+            WHERE is_active
+        ) AS d
+        WHERE s.id = d.id AND d.rn > 1
+        """
+    )
+
+    # CONCURRENTLY не блокирует запись в таблицу, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_sessions_active_device "
+            "ON sessions (user_id, client_id, device_fingerprint) WHERE is_active"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_sessions_active_device")
+    op.drop_column('sessions', 'device_fingerprint')
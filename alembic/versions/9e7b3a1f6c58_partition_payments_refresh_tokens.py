@@ -0,0 +1,165 @@
+"""payments, refresh_tokens: monthly range partitions by created_at
+
+Revision ID: 9e7b3a1f6c58
+Revises: 5d9f1e3c7a42
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+import datetime as dt
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e7b3a1f6c58'
+down_revision: Union[str, Sequence[str], None] = '5d9f1e3c7a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# сколько месяцев партиций создать сразу; дальше их создаёт tasks.maintain_partitions
+MONTHS_AHEAD = 3
+
+# ограничения и индексы новой (партиционированной) таблицы — как в моделях
+PAYMENTS_DDL = [
+    "ALTER TABLE payments ADD CONSTRAINT payments_pkey PRIMARY KEY (id, created_at)",
+    "ALTER TABLE payments ADD CONSTRAINT payments_user_id_fkey "
+    "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+    "ALTER TABLE payments ADD CONSTRAINT payments_wallet_id_fkey "
+    "FOREIGN KEY (wallet_id) REFERENCES wallets (id) ON DELETE CASCADE",
+    "CREATE INDEX idx_payments_user_status ON payments (user_id, status)",
+    "CREATE INDEX idx_payments_user_created ON payments (user_id, created_at)",
+    "CREATE UNIQUE INDEX uq_payments_idempotency_not_null ON payments (idempotency_key, created_at) "
+    "WHERE idempotency_key IS NOT NULL",
+    "CREATE INDEX ix_payments_user_id ON payments (user_id)",
+    "CREATE INDEX ix_payments_wallet_id ON payments (wallet_id)",
+    "CREATE INDEX ix_payments_idempotency_key ON payments (idempotency_key)",
+    "CREATE INDEX ix_payments_yookassa_payment_id ON payments (yookassa_payment_id)",
+]
+
+REFRESH_TOKENS_DDL = [
+    "ALTER TABLE refresh_tokens ADD CONSTRAINT refresh_tokens_pkey PRIMARY KEY (id, created_at)",
+    "ALTER TABLE refresh_tokens ADD CONSTRAINT refresh_tokens_session_id_fkey "
+    "FOREIGN KEY (session_id) REFERENCES sessions (id)",
+    "CREATE INDEX refresh_tokens_session_id_index ON refresh_tokens (session_id)",
+    "CREATE INDEX ix_refresh_tokens_token_hash ON refresh_tokens (token_hash)",
+]
+
+# индексы старой таблицы получают суффикс, чтобы освободить имена для новой;
+# у индексов ограничений (pkey, unique) вместе с индексом переименовывается и ограничение
+RENAME_INDEXES_SQL = """
+DO $$
+DECLARE r record;
+BEGIN
+    FOR r IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = '{table}'::regclass
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', r.relname, left(r.relname, 55) || '_old');
+    END LOOP;
+END $$;
+"""
+
+
+def _add_months(day: dt.date, months: int) -> dt.date:
+    index = day.year * 12 + day.month - 1 + months
+    return dt.date(index // 12, index % 12 + 1, 1)
+
+
+def _move_sequence(source: str, target: str) -> None:
+    # последовательность id принадлежит исходной таблице — иначе удалится вместе с ней
+    # (отсоединённая и удалённая старая партиция, DROP при даунгрейде)
+    op.execute(
+        f"""
+        DO $$
+        DECLARE seq text := pg_get_serial_sequence('{source}', 'id');
+        BEGIN
+            IF seq IS NOT NULL THEN
+                EXECUTE format('ALTER SEQUENCE %s OWNED BY {target}.id', seq);
+            END IF;
+        END $$;
+        """
+    )
+
+
+def _partition(table: str, ddl: list) -> None:
+    legacy = f"{table}_legacy"
+    # существующие строки не копируются: старая таблица целиком становится партицией
+    # (MINVALUE, начало следующего месяца), новые месяцы — отдельные партиции
+    boundary = _add_months(dt.datetime.now(dt.timezone.utc).date().replace(day=1), 1)
+
+    op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    op.execute(RENAME_INDEXES_SQL.format(table=legacy))
+
+    op.execute(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+    for statement in ddl:
+        op.execute(statement)
+    _move_sequence(legacy, table)
+
+    # CHECK с той же границей позволяет ATTACH без полного сканирования под блокировкой
+    op.execute(
+        f"ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_range_check "
+        f"CHECK (created_at IS NOT NULL AND created_at < '{boundary.isoformat()} 00:00:00+00') NOT VALID"
+    )
+    op.execute(f"ALTER TABLE {legacy} VALIDATE CONSTRAINT {legacy}_range_check")
+    op.execute(
+        f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()} 00:00:00+00')"
+    )
+    op.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {legacy}_range_check")
+
+    for offset in range(MONTHS_AHEAD):
+        month = _add_months(boundary, offset)
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+            f"TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+        )
+    # страховка: если партиция месяца не создана заранее, вставка не упадёт
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # выполняется в окно обслуживания: переименование и ATTACH берут эксклюзивные блокировки,
+    # а ATTACH строит на старой таблице индексы, которых у неё не было (PK и unique с created_at)
+    _partition("payments", PAYMENTS_DDL)
+    _partition("refresh_tokens", REFRESH_TOKENS_DDL)
+
+
+def _unpartition(table: str, ddl: list) -> None:
+    op.execute(f"CREATE TABLE {table}_plain (LIKE {table} INCLUDING DEFAULTS)")
+    op.execute(f"INSERT INTO {table}_plain SELECT * FROM {table}")
+    _move_sequence(table, f"{table}_plain")
+    op.execute(f"DROP TABLE {table} CASCADE")
+    op.execute(f"ALTER TABLE {table}_plain RENAME TO {table}")
+    for statement in ddl:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # данные копируются в обычные таблицы; отсоединённые ранее партиции не возвращаются
+    _unpartition("payments", [
+        "ALTER TABLE payments ADD CONSTRAINT payments_pkey PRIMARY KEY (id)",
+        "ALTER TABLE payments ADD CONSTRAINT payments_user_id_fkey "
+        "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE",
+        "ALTER TABLE payments ADD CONSTRAINT payments_wallet_id_fkey "
+        "FOREIGN KEY (wallet_id) REFERENCES wallets (id) ON DELETE CASCADE",
+        "ALTER TABLE payments ADD CONSTRAINT payments_idempotency_key_key UNIQUE (idempotency_key)",
+        "CREATE INDEX idx_payments_user_status ON payments (user_id, status)",
+        "CREATE UNIQUE INDEX uq_payments_idempotency_not_null ON payments (idempotency_key) "
+        "WHERE idempotency_key IS NOT NULL",
+        "CREATE INDEX ix_payments_user_id ON payments (user_id)",
+        "CREATE INDEX ix_payments_wallet_id ON payments (wallet_id)",
+        "CREATE INDEX ix_payments_idempotency_key ON payments (idempotency_key)",
+        "CREATE INDEX ix_payments_yookassa_payment_id ON payments (yookassa_payment_id)",
+    ])
+    _unpartition("refresh_tokens", [
+        "ALTER TABLE refresh_tokens ADD CONSTRAINT refresh_tokens_pkey PRIMARY KEY (id)",
+        "ALTER TABLE refresh_tokens ADD CONSTRAINT refresh_tokens_session_id_fkey "
+        "FOREIGN KEY (session_id) REFERENCES sessions (id)",
+        "ALTER TABLE refresh_tokens ADD CONSTRAINT refresh_tokens_token_hash_key UNIQUE (token_hash)",
+        "CREATE INDEX refresh_tokens_session_id_index ON refresh_tokens (session_id)",
+    ])
@@ -0,0 +1,62 @@
+"""wallet_entries: append-only ledger behind wallets.balance
+
+Revision ID: b7d2e4f81a93
+Revises: 9e7b3a1f6c58
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e4f81a93'
+down_revision: Union[str, Sequence[str], None] = '9e7b3a1f6c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # текущие wallets.balance становятся снимками — переносить историю не нужно
+    op.create_table(
+        'wallet_entries',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('wallet_id', sa.BigInteger(), nullable=False),
+        sa.Column('amount', sa.Numeric(12, 2), nullable=False),
+        sa.Column('reason', sa.String(length=32), nullable=True),
+        sa.Column('idempotency_key', sa.String(length=128), nullable=True),
+        sa.Column('compacted', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['wallet_id'], ['wallets.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('wallet_id', 'idempotency_key', name='uq_wallet_entries_wallet_idempotency'),
+    )
+    op.create_index(
+        'ix_wallet_entries_pending',
+        'wallet_entries',
+        ['wallet_id'],
+        postgresql_include=['amount'],
+        postgresql_where=sa.text('NOT compacted'),
+    )
+    op.create_index('ix_wallet_entries_wallet_created', 'wallet_entries', ['wallet_id', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # несвёрнутые записи переносятся в баланс, иначе они потеряются вместе с таблицей
+    op.execute(
+        """
+        UPDATE wallets w SET balance = w.balance + t.amount, updated_at = now()
+        FROM (
+            SELECT wallet_id, sum(amount) AS amount FROM wallet_entries
+            WHERE NOT compacted GROUP BY wallet_id
+        ) t
+        WHERE w.id = t.wallet_id
+        """
+    )
+    op.drop_index('ix_wallet_entries_wallet_created', table_name='wallet_entries')
+    op.drop_index('ix_wallet_entries_pending', table_name='wallet_entries')
+    op.drop_table('wallet_entries')
@@ -0,0 +1,48 @@
+"""payment_idempotency: unique idempotency keys for partitioned payments
+
+Revision ID: c4e8a2f1d6b3
+Revises: b7d2e4f81a93
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2f1d6b3'
+down_revision: Union[str, Sequence[str], None] = 'b7d2e4f81a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # уникальный индекс партиционированной payments включает created_at и не запрещает
+    # повтор ключа — настоящая уникальность в отдельной непартиционированной таблице
+    op.create_table(
+        'payment_idempotency',
+        sa.Column('idempotency_key', sa.String(length=64), nullable=False),
+        sa.Column('payment_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('payment_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('idempotency_key'),
+    )
+    # ключи существующих платежей; при повторе ключа занимает его самый ранний платёж
+    op.execute(
+        """
+        INSERT INTO payment_idempotency (idempotency_key, payment_id, payment_created_at, created_at)
+        SELECT DISTINCT ON (idempotency_key) idempotency_key, id, created_at, created_at
+        FROM payments
+        WHERE idempotency_key IS NOT NULL
+        ORDER BY idempotency_key, created_at, id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('payment_idempotency')
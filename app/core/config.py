@@ -1,9 +1,9 @@
 import logging
 from pathlib import Path
+from typing import Optional, Dict, Any, List
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
-from yookassa import Webhook
 
 # 🔧 Настройка логгера
 logger = logging.getLogger("settings")
@@ -39,10 +39,40 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
 
+    # Redis приложения (cooldown, лимиты, кэш); по умолчанию — брокер celery
+    REDIS_URL: Optional[str] = None
+    REDIS_SOCKET_TIMEOUT: float = 1.0
+
     CHATGPT_API: str
+    # Адрес Responses API (переопределяется стендом нагрузочного тестирования)
+    OPENAI_API_URL: str = "https://api.openai.com/v1/responses"
+    # Шлюз запросов к OpenAI (app/core/outbound.py). Лимиты действуют в пределах процесса:
+    # общий предел = значение × число процессов (воркеры uvicorn + celery воркер очереди gpt),
+    # поэтому при масштабировании значения нужно делить на число процессов
+    OPENAI_MAX_CONCURRENCY: int = 20
+    OPENAI_MAX_PER_USER: int = 2
+    OPENAI_QUEUE_SIZE: int = 100
+    # Сколько секунд запрос может ждать слота, прежде чем получить 503
+    OPENAI_QUEUE_TIMEOUT: float = 10.0
+    # JSON: {"<oauth_clients.id>": <приоритет>}, 0 — самый высокий
+    OPENAI_PRIORITY_CLIENTS: Dict[int, int] = {}
+    OPENAI_DEFAULT_PRIORITY: int = 1
+    # Кэш одинаковых запросов к GPT (app/handlers/gpt/cache.py), по умолчанию выключен
+    GPT_CACHE_ENABLED: bool = False
+    GPT_CACHE_TTL_SECONDS: int = 24 * 3600
+    GPT_CACHE_MAX_ENTRIES: int = 10000
+    GPT_CACHE_MAX_ENTRY_BYTES: int = 256 * 1024
+    # Сколько держится блокировка single-flight между воркерами (не меньше времени ответа OpenAI)
+    GPT_CACHE_LOCK_SECONDS: float = 130.0
+    # Фоновые GPT задачи (очередь celery gpt)
+    GPT_JOB_MAX_ACTIVE_PER_USER: int = 3
+    GPT_JOB_TTL_SECONDS: int = 3600
+    GPT_JOB_POLL_INTERVAL: float = 1.0
 
     SECRET_KEY: str
     SHOP_ID: str
+    # Адрес API YooKassa, по умолчанию — из SDK
+    YOOKASSA_API_URL: Optional[str] = None
 
     # === Настройки (лучше читать из переменных окружения) ===
     SMTP_HOST: str
@@ -52,12 +82,106 @@ class Settings(BaseSettings):
     FROM_ADDRESS: str
     CONFIRMATION_BASE_URL: str
 
+    # Очередь исходящих писем (app/core/mail_outbox.py)
+    MAIL_OUTBOX_ENABLED: bool = True
+    MAIL_POOL_SIZE: int = 2
+    MAIL_BATCH_SIZE: int = 20
+    MAIL_POLL_INTERVAL: float = 0.5
+    MAIL_MAX_ATTEMPTS: int = 6
+    MAIL_RETRY_BASE_SECONDS: float = 10.0
+    MAIL_RETRY_MAX_SECONDS: float = 1800.0
+    # Соединение, простаивавшее дольше, переоткрывается (серверы рвут idle соединения)
+    MAIL_IDLE_SECONDS: float = 60.0
+    # Сколько ждать свободного соединения пула; по истечении письмо уходит в повторы
+    MAIL_ACQUIRE_TIMEOUT_SECONDS: float = 30.0
+
     # Секрет для подписи токенов (обязательно заменить на безопасный секрет)
     TOKEN_SECRET: str
     TOKEN_SALT: str
-
-
-
+    # Предыдущие секреты (JSON список) — подписи ими ещё принимаются после ротации TOKEN_SECRET
+    TOKEN_SECRET_FALLBACKS: List[str] = []
+
+    # Access токены с подписанными claims (v1.*): проверка без БД, отзыв через Redis
+    ACCESS_TOKEN_STATELESS: bool = False
+    # Срок жизни подписанного access токена; продлевается через /session/refresh_token
+    ACCESS_TOKEN_TTL_SECONDS: int = 86400
+    # Максимум токенов в одном запросе /session/access_token/batch
+    SESSION_INTROSPECTION_BATCH_MAX: int = 500
+
+    # Отложенная запись last_used_at сессий: отметки копятся в памяти и пишутся пачкой
+    SESSION_ACTIVITY_ENABLED: bool = True
+    SESSION_ACTIVITY_FLUSH_SECONDS: float = 5.0
+    # Закрывать сессии без активности дольше N секунд (0 — не закрывать)
+    SESSION_IDLE_TIMEOUT_SECONDS: int = 0
+    SESSION_IDLE_SWEEP_SECONDS: float = 60.0
+    # Максимум активных сессий пользователя; при входе сверх лимита закрываются самые давние (0 — без лимита)
+    SESSION_MAX_ACTIVE_PER_USER: int = 20
+
+    # Очистка старых данных (celery beat, tasks.run_retention): размер пачки и пауза между пачками
+    RETENTION_BATCH_SIZE: int = 1000
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.2
+    # Не ждать чужие блокировки дольше этого — пачка повторится позже
+    RETENTION_LOCK_TIMEOUT_MS: int = 2000
+    RETENTION_MAX_BATCHES_PER_TABLE: int = 500
+    # Сроки хранения, дни
+    RETENTION_SESSIONS_DAYS: int = 30
+    RETENTION_REFRESH_TOKENS_DAYS: int = 7
+    RETENTION_COUPONS_DAYS: int = 180
+    RETENTION_PAYMENTS_DAYS: int = 90
+    # Незавершённые платежи, которые чистятся; archive — перенос в payments_archive, delete — удаление
+    RETENTION_PAYMENT_STATUSES: List[str] = ["INIT", "failed"]
+    RETENTION_PAYMENTS_MODE: str = "archive"
+
+    # Платежи, зависшие в INIT (tasks.recover_init_payments): разбирать строки старше N секунд,
+    # не найденные у провайдера дольше PAYMENT_INIT_GIVEUP_SECONDS — помечать failed
+    PAYMENT_INIT_STALE_SECONDS: int = 300
+    PAYMENT_INIT_GIVEUP_SECONDS: int = 3600
+    PAYMENT_INIT_RECOVERY_BATCH: int = 100
+
+    # Свёртка журнала wallet_entries в wallets.balance (tasks.compact_wallet_ledger): записей за транзакцию
+    WALLET_COMPACT_BATCH_SIZE: int = 5000
+    WALLET_COMPACT_MAX_BATCHES: int = 100
+
+    # Помесячные партиции payments/refresh_tokens (tasks.maintain_partitions): сколько месяцев создавать заранее
+    PARTITION_MONTHS_AHEAD: int = 3
+    # Отсоединять партиции старше N месяцев (0 — никогда); payments остаются таблицами, refresh_tokens удаляются
+    PARTITION_PAYMENTS_DETACH_MONTHS: int = 0
+    PARTITION_REFRESH_TOKENS_DETACH_MONTHS: int = 2
+
+    # Порт HTTP сервера метрик Prometheus для celery worker (0 — не запускать)
+    CELERY_METRICS_PORT: int = 0
+
+    # Профилировщик SQL по запросам (включать на стендах/при разборе регрессий)
+    SQL_PROFILER_ENABLED: bool = False
+    # Сколько раз одинаковый запрос должен повториться, чтобы считать его N+1
+    SQL_PROFILER_REPEAT_THRESHOLD: int = 5
+
+    # Размер пачки при массовой выдаче купонов (строк на один INSERT)
+    COUPON_BULK_CHUNK_SIZE: int = 1000
+    # Период между выдачей купонов одному пользователю, сек (неделя)
+    COUPON_COOLDOWN_SECONDS: int = 7 * 24 * 3600
+    # Минимальный интервал между запросами смены email, сек
+    EMAIL_CHANGE_COOLDOWN_SECONDS: int = 60
+
+    # Лимиты на дорогие эндпоинты (app/core/rate_limit.py)
+    RATE_LIMIT_ENABLED: bool = True
+    # JSON: {"POST /auth/login": {"capacity": 10, "per_seconds": 60, "key": "ip"}, "POST /x": null}
+    RATE_LIMIT_RULES: Dict[str, Optional[Dict[str, Any]]] = {}
+    # Сколько секунд не обращаться к Redis после ошибки (лимит считается в памяти)
+    RATE_LIMIT_REDIS_RETRY_SECONDS: float = 5.0
+    # Кэш соответствия токен -> пользователь и oauth_client -> клиент для ключей лимитов, сек
+    RATE_LIMIT_SUBJECT_CACHE_SECONDS: float = 60.0
+
+    # Заголовок Idempotency-Key для изменяющих эндпоинтов (app/core/idempotency.py)
+    IDEMPOTENCY_ENABLED: bool = True
+    # JSON: {"POST /gpt/jobs": true, "POST /coupon/used_coupon": false}
+    # сохраняются только JSON ответы: потоковые (NDJSON, SSE) отдаются как есть, без защиты от повторов
+    IDEMPOTENCY_ROUTES: Dict[str, bool] = {}
+    # Сколько хранить ответ для повторов; сколько держать блокировку выполняющегося запроса
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_LOCK_SECONDS: int = 60
+    # Сколько повтор ждёт завершения первого запроса, прежде чем получить 409
+    IDEMPOTENCY_WAIT_SECONDS: float = 5.0
 
     class Config:
         env_file = ENV_PATH  # чтобы pydantic тоже читал из .env
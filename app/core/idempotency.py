@@ -0,0 +1,205 @@
+# app/core/idempotency.py
+"""
+Заголовок Idempotency-Key для изменяющих эндпоинтов.
+
+Первый запрос с ключом берёт блокировку в Redis (SET NX) и выполняется; его ответ (статус,
+тип содержимого и тело) сохраняется на IDEMPOTENCY_TTL_SECONDS. Повтор с тем же ключом получает
+сохранённый ответ с заголовком Idempotent-Replayed: true, не выполняя обработчик заново. Пока
+первый запрос не завершён, повтор ждёт до IDEMPOTENCY_WAIT_SECONDS, затем получает 409.
+Тот же ключ с другим телом/параметрами — 422.
+
+Ключ действует в пределах маршрута и пользователя: повтор с новым токеном после refresh
+получает тот же ответ. Неизвестный токен — в пределах самого токена, без токена — адреса клиента.
+Ответы 5xx, «временные» 4xx (401, 403, 408, 409, 429) и не-JSON ответы (потоки NDJSON, SSE)
+не сохраняются — запрос можно повторить с тем же ключом. Если Redis недоступен, запрос выполняется без защиты от повторов.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+from redis.exceptions import RedisError
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from app.core.config import settings
+from app.core.rate_limit import subjects
+from app.core.redis import get_redis
+
+logger = logging.getLogger("uvicorn")
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# маршруты "МЕТОД путь" (без root_path); дополняются/отключаются через settings.IDEMPOTENCY_ROUTES
+DEFAULT_ROUTES: Set[str] = {
+    "POST /payment/create_payment",
+    "POST /payment/create_payment_single",
+    "POST /payment/update_wallet",
+    "POST /payment/update_wallet_oauth",
+    "POST /coupon/create_coupon",
+    "POST /coupon/used_coupon",
+    "POST /coupon/used_any_coupon",
+}
+
+# ответ зависит от состояния клиента/сервера, а не от запроса — повтор должен выполняться заново
+NOT_STORED_STATUSES = {401, 403, 408, 409, 429}
+
+# снимает блокировку, только если она всё ещё наша (могла истечь и достаться другому запросу)
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def load_routes() -> Set[str]:
+    routes = set(DEFAULT_ROUTES)
+    for route, enabled in settings.IDEMPOTENCY_ROUTES.items():
+        if enabled:
+            routes.add(route)
+        else:
+            routes.discard(route)
+    return routes
+
+
+async def _scope(request: Request) -> str:
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        # id пользователя — из того же кэша, что у лимитера
+        user_id = await subjects.user_id(auth[7:])
+        if user_id is not None:
+            return f"u:{user_id}"
+        # токен хэшируем: в Redis не должно попадать само значение
+        return "t:" + hashlib.sha256(auth[7:].encode()).hexdigest()[:32]
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.url.query.encode())
+    digest.update(b"\n")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _is_json(response: Response) -> bool:
+    media_type = (response.headers.get("content-type") or "").split(";", 1)[0].strip().lower()
+    return media_type == "application/json" or media_type.endswith("+json")
+
+
+def _error(status_code: int, detail: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"detail": detail}, headers=headers)
+
+
+class IdempotencyGuard:
+    def __init__(self, routes: Set[str]):
+        self.routes = routes
+        self._release = None
+
+    def match(self, request: Request) -> Optional[str]:
+        path = request.url.path
+        root_path = request.scope.get("root_path") or ""
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        route = f"{request.method} {path.rstrip('/') or '/'}"
+        return route if route in self.routes else None
+
+    @staticmethod
+    def _replay(record: dict) -> Response:
+        response = Response(
+            content=base64.b64decode(record["body"]),
+            status_code=record["status"],
+            media_type=record.get("media_type"),
+        )
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+    async def _store(self, result_key: str, fingerprint: str, response: Response) -> Response:
+        if not _is_json(response):
+            # потоковый ответ не буферизуем: клиент получает его по мере генерации
+            return response
+        # тело ответа читается целиком, чтобы сохранить его и отдать клиенту
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        if response.status_code < 500 and response.status_code not in NOT_STORED_STATUSES:
+            record = {
+                "fp": fingerprint,
+                "status": response.status_code,
+                "media_type": response.headers.get("content-type"),
+                "body": base64.b64encode(body).decode(),
+            }
+            try:
+                await get_redis().set(result_key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+            except RedisError as e:
+                logger.warning("Idempotency-Key: ответ не сохранён: %s", e)
+        return Response(content=body, status_code=response.status_code, headers=dict(response.headers))
+
+    async def _wait(self, result_key: str, lock_key: str) -> Optional[dict]:
+        """Ждёт завершения первого запроса; None — не дождались"""
+        redis = get_redis()
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+            raw = await redis.get(result_key)
+            if raw:
+                return json.loads(raw)
+            if not await redis.exists(lock_key):
+                # первый запрос завершился без сохранённого ответа (5xx, 401 ...)
+                return None
+        return None
+
+    async def dispatch(self, request: Request, call_next) -> Response:
+        route = self.match(request)
+        key = request.headers.get(HEADER)
+        if route is None or key is None:
+            return await call_next(request)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(400, f"Некорректный {HEADER}: от 1 до {MAX_KEY_LENGTH} символов")
+
+        body = await request.body()
+        fingerprint = _fingerprint(request, body)
+        scope_hash = hashlib.sha256(f"{route}|{await _scope(request)}|{key}".encode()).hexdigest()
+        result_key = f"idempotency:{scope_hash}"
+        lock_key = f"{result_key}:lock"
+        token = f"{uuid.uuid4().hex}:{fingerprint}"
+
+        try:
+            redis = get_redis()
+            raw = await redis.get(result_key)
+            if raw is None:
+                acquired = await redis.set(lock_key, token, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS)
+                if not acquired:
+                    holder = await redis.get(lock_key) or ""
+                    if holder and not holder.endswith(f":{fingerprint}"):
+                        return _error(422, f"{HEADER} уже использован с другими параметрами запроса")
+                    record = await self._wait(result_key, lock_key)
+                    if record is None:
+                        return _error(409, "Запрос с этим ключом ещё выполняется", {"Retry-After": "1"})
+                    raw = json.dumps(record)
+        except RedisError as e:
+            logger.warning("Idempotency-Key: Redis недоступен, запрос выполняется без защиты: %s", e)
+            return await call_next(request)
+
+        if raw is not None:
+            record = json.loads(raw)
+            if record.get("fp") != fingerprint:
+                return _error(422, f"{HEADER} уже использован с другими параметрами запроса")
+            return self._replay(record)
+
+        try:
+            response = await call_next(request)
+            return await self._store(result_key, fingerprint, response)
+        finally:
+            try:
+                if self._release is None:
+                    self._release = get_redis().register_script(_RELEASE_LUA)
+                await self._release(keys=[lock_key], args=[token])
+            except RedisError as e:
+                # блокировка истечёт сама через IDEMPOTENCY_LOCK_SECONDS
+                logger.warning("Idempotency-Key: блокировка не снята: %s", e)
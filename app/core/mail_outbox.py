@@ -0,0 +1,224 @@
+# app/core/mail_outbox.py
+"""
+Очередь исходящих писем в Redis и фоновый отправитель.
+
+Эндпоинты только кладут письмо в очередь (LPUSH) и сразу отвечают. Воркер, запущенный
+в lifespan приложения, забирает письма пачками и рассылает их через небольшой пул уже
+авторизованных SMTP соединений. Неудачные отправки уходят в ZSET повторов с экспоненциальной
+задержкой; после MAIL_MAX_ATTEMPTS или при постоянной ошибке (5xx) — в список dead.
+
+Гарантия — «не более одного раза» при падении процесса посреди отправки пачки: письма
+подтверждения можно запросить повторно, а дубли хуже потерь.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from email.message import EmailMessage
+from typing import Optional, List, Dict, Any
+
+import aiosmtplib
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger("uvicorn")
+
+OUTBOX_KEY = "mail:outbox"
+RETRY_KEY = "mail:retry"
+DEAD_KEY = "mail:dead"
+
+# переносит наступившие повторы из ZSET обратно в очередь одной атомарной операцией
+_PROMOTE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, item in ipairs(due) do
+    redis.call('ZREM', KEYS[1], item)
+    redis.call('LPUSH', KEYS[2], item)
+end
+return #due
+"""
+
+
+async def enqueue_email(to_address: str, subject: str, plain_text: str, html_text: Optional[str] = None) -> str:
+    """Кладёт письмо в очередь и возвращает его id"""
+    message_id = uuid.uuid4().hex
+    item = {
+        "id": message_id,
+        "to": to_address,
+        "subject": subject,
+        "plain": plain_text,
+        "html": html_text,
+        "attempts": 0,
+        "created_at": time.time(),
+    }
+    await get_redis().lpush(OUTBOX_KEY, json.dumps(item, ensure_ascii=False))
+    return message_id
+
+
+def build_message(item: Dict[str, Any]) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"] = settings.FROM_ADDRESS
+    msg["To"] = item["to"]
+    msg["Subject"] = item["subject"]
+    msg.set_content(item["plain"])
+    if item.get("html"):
+        msg.add_alternative(item["html"], subtype="html")
+    return msg
+
+
+class SMTPPool:
+    """
+    Небольшой пул авторизованных SMTP соединений, переживающих между пачками.
+
+    Число выданных и открывающихся соединений ограничивает семафор: слот освобождается при
+    release/broken и при неудачном подключении, поэтому ожидающие не зависают, когда
+    соединение закрыто или не открылось.
+    """
+
+    def __init__(self, size: int):
+        self._slots = asyncio.Semaphore(size)
+        self._idle: asyncio.Queue = asyncio.Queue()
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        port = int(settings.SMTP_PORT)
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=port,
+            use_tls=port == 465,        # 465 — SSL сразу, иначе STARTTLS, если сервер его поддерживает
+            timeout=60,
+        )
+        await smtp.connect()
+        await smtp.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        return smtp
+
+    async def acquire(self) -> aiosmtplib.SMTP:
+        # asyncio.TimeoutError — обычная неудача отправки, письмо уйдёт в повторы
+        await asyncio.wait_for(self._slots.acquire(), timeout=settings.MAIL_ACQUIRE_TIMEOUT_SECONDS)
+        try:
+            while not self._idle.empty():
+                smtp, last_used = self._idle.get_nowait()
+                # долго простаивавшее соединение сервер мог уже закрыть
+                if smtp.is_connected and time.monotonic() - last_used < settings.MAIL_IDLE_SECONDS:
+                    return smtp
+                await self._quit(smtp)
+            return await self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, smtp: aiosmtplib.SMTP) -> None:
+        self._idle.put_nowait((smtp, time.monotonic()))
+        self._slots.release()
+
+    @staticmethod
+    async def _quit(smtp: aiosmtplib.SMTP) -> None:
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def broken(self, smtp: aiosmtplib.SMTP) -> None:
+        try:
+            await self._quit(smtp)
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            smtp, _ = self._idle.get_nowait()
+            await self._quit(smtp)
+
+
+def _is_permanent(error: Exception) -> bool:
+    # 5xx — адрес отклонён/письмо не принимается, повтор не поможет
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and 500 <= code < 600 and not isinstance(error, aiosmtplib.SMTPAuthenticationError)
+
+
+class MailOutboxWorker:
+    def __init__(self):
+        self._pool = SMTPPool(settings.MAIL_POOL_SIZE)
+        self._promote = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def _send_one(self, item: Dict[str, Any]) -> None:
+        smtp = await self._pool.acquire()
+        try:
+            await smtp.send_message(build_message(item))
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, OSError):
+            await self._pool.broken(smtp)
+            raise
+        except Exception:
+            # после ответа сервера с ошибкой соединение остаётся рабочим
+            self._pool.release(smtp)
+            raise
+        self._pool.release(smtp)
+
+    async def _handle_failure(self, item: Dict[str, Any], error: Exception) -> None:
+        item["attempts"] = item.get("attempts", 0) + 1
+        item["last_error"] = f"{type(error).__name__}: {error}"
+        redis = get_redis()
+        if _is_permanent(error) or item["attempts"] >= settings.MAIL_MAX_ATTEMPTS:
+            logger.error("Письмо %s на %s не отправлено: %s", item.get("id"), item.get("to"), item["last_error"])
+            await redis.lpush(DEAD_KEY, json.dumps(item, ensure_ascii=False))
+            return
+        delay = min(settings.MAIL_RETRY_BASE_SECONDS * 2 ** (item["attempts"] - 1), settings.MAIL_RETRY_MAX_SECONDS)
+        delay *= random.uniform(0.8, 1.2)
+        logger.warning("Письмо %s: попытка %s неудачна (%s), повтор через %.0f с",
+                       item.get("id"), item["attempts"], item["last_error"], delay)
+        await redis.zadd(RETRY_KEY, {json.dumps(item, ensure_ascii=False): time.time() + delay})
+
+    async def _take_batch(self) -> List[str]:
+        redis = get_redis()
+        if self._promote is None:
+            self._promote = redis.register_script(_PROMOTE_LUA)
+        await self._promote(keys=[RETRY_KEY, OUTBOX_KEY], args=[time.time(), settings.MAIL_BATCH_SIZE])
+
+        # без блокирующего BRPOP: общий клиент работает с коротким socket_timeout
+        return await redis.rpop(OUTBOX_KEY, settings.MAIL_BATCH_SIZE) or []
+
+    async def _process(self, batch: List[str]) -> None:
+        async def _one(raw: str):
+            item = json.loads(raw)
+            try:
+                await self._send_one(item)
+            except Exception as e:
+                await self._handle_failure(item, e)
+
+        await asyncio.gather(*(_one(raw) for raw in batch))
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                batch = await self._take_batch()
+                if batch:
+                    await self._process(batch)
+                else:
+                    await asyncio.sleep(settings.MAIL_POLL_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except RedisError as e:
+                logger.warning("Очередь писем: Redis недоступен: %s", e)
+                await asyncio.sleep(5)
+            except Exception:
+                logger.exception("Очередь писем: ошибка обработки пачки")
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run(), name="mail-outbox")
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._pool.close()
@@ -0,0 +1,189 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Бакеты подобраны под наши реальные времена: от быстрых SELECT до ответов OpenAI (до 120 с)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+OUTBOUND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+BATCH_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# --- HTTP ---
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP запроса по шаблону маршрута",
+    ["method", "route", "status"],
+    buckets=HTTP_BUCKETS,
+)
+
+# --- БД ---
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Время ожидания свободного соединения из пула",
+    buckets=DB_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Количество соединений, выданных из пула",
+    multiprocess_mode="livesum",
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL запроса по типу операции",
+    ["operation"],
+    buckets=DB_BUCKETS,
+)
+
+# --- Внешние сервисы (YooKassa, OpenAI) ---
+OUTBOUND_DURATION = Histogram(
+    "outbound_request_duration_seconds",
+    "Время запроса во внешний сервис",
+    ["service", "operation"],
+    buckets=OUTBOUND_BUCKETS,
+)
+OUTBOUND_ERRORS = Counter(
+    "outbound_request_errors_total",
+    "Ошибки запросов во внешний сервис",
+    ["service", "operation", "reason"],
+)
+OUTBOUND_QUEUE_WAIT = Histogram(
+    "outbound_queue_wait_seconds",
+    "Время ожидания слота в шлюзе внешних запросов",
+    ["service"],
+    buckets=HTTP_BUCKETS,
+)
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    "outbound_queue_depth",
+    "Запросы, ожидающие слота в шлюзе",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+OUTBOUND_IN_FLIGHT = Gauge(
+    "outbound_in_flight",
+    "Запросы, выполняющиеся во внешнем сервисе",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+OUTBOUND_REJECTED = Counter(
+    "outbound_rejected_total",
+    "Запросы, отклонённые шлюзом (очередь заполнена / истёк срок ожидания)",
+    ["service", "reason"],
+)
+
+# --- Celery billing ---
+BILLING_BATCH_DURATION = Histogram(
+    "billing_batch_duration_seconds",
+    "Время обработки одной пачки списаний",
+    buckets=BATCH_BUCKETS,
+)
+BILLING_SUBTRACTIONS = Counter(
+    "billing_subtractions_total",
+    "Результаты обработки списаний",
+    ["result"],
+)
+
+# --- Очистка старых данных (retention) ---
+RETENTION_ROWS = Counter(
+    "retention_rows_total",
+    "Строки, удалённые или перенесённые в архив задачей retention",
+    ["table", "action"],
+)
+RETENTION_LOCK_TIMEOUTS = Counter(
+    "retention_lock_timeouts_total",
+    "Пачки retention, не дождавшиеся блокировки (lock_timeout)",
+    ["table"],
+)
+
+_SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+def _registry() -> CollectorRegistry:
+    """
+    При запуске в несколько процессов (uvicorn --workers, celery prefork) метрики
+    собираются из каталога PROMETHEUS_MULTIPROC_DIR, иначе — из реестра процесса.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    from prometheus_client import REGISTRY
+    return REGISTRY
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Возвращает тело ответа /metrics и его content-type"""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> None:
+    """Отдельный HTTP сервер метрик (для процессов без FastAPI, например celery worker)"""
+    start_http_server(port, registry=_registry())
+
+
+def observe_outbound_error(service: str, operation: str, reason: str) -> None:
+    OUTBOUND_ERRORS.labels(service, operation, reason).inc()
+
+
+@contextmanager
+def track_outbound(service: str, operation: str):
+    """Замеряет время внешнего вызова, исключения считаются ошибками по имени класса"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        observe_outbound_error(service, operation, type(e).__name__)
+        raise
+    finally:
+        OUTBOUND_DURATION.labels(service, operation).observe(time.perf_counter() - start)
+
+
+def _sql_operation(statement: str) -> str:
+    head = statement.lstrip().split(None, 1)
+    operation = head[0].upper() if head else ""
+    return operation if operation in _SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Вешает на движок события для метрик пула и времени запросов"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        DB_QUERY_DURATION.labels(_sql_operation(statement)).observe(time.perf_counter() - starts.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        # при ошибке after_cursor_execute не вызывается — чистим стек замеров
+        conn = exception_context.connection
+        if conn is not None:
+            starts = conn.info.get("metrics_query_start")
+            if starts:
+                starts.pop()
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
@@ -0,0 +1,174 @@
+# app/core/outbound.py
+"""
+Шлюз исходящих запросов к дорогим внешним сервисам (OpenAI).
+
+Ограничивает число одновременных запросов на процесс и на пользователя (счётчики в памяти
+процесса: при N воркерах предел к сервису — N × OPENAI_MAX_CONCURRENCY). Запросы сверх
+лимита ждут в ограниченной очереди с приоритетами (меньше — важнее) и дедлайном ожидания.
+Если очередь заполнена или дедлайн истёк, шлюз отказывает сразу (GatewayRejected), а не
+копит долгие соединения. Все запросы идут через одну aiohttp сессию с пулом соединений
+вместо новой сессии на каждый вызов.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Hashable
+
+from app.core.config import settings
+from app.core.metrics import OUTBOUND_QUEUE_WAIT, OUTBOUND_QUEUE_DEPTH, OUTBOUND_IN_FLIGHT, OUTBOUND_REJECTED
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+class GatewayRejected(Exception):
+    def __init__(self, service: str, reason: str, retry_after: int = 1):
+        super().__init__(f"{service}: {reason}")
+        self.service = service
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class OutboundGateway:
+    def __init__(self, service: str, max_concurrency: int, max_per_key: int, max_queue: int, max_wait: float):
+        self.service = service
+        self.max_concurrency = max_concurrency
+        self.max_per_key = max_per_key
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._active = 0
+        self._waiters: List[list] = []  # куча [priority, seq, future]
+        self._seq = itertools.count()
+        self._per_key: Dict[Hashable, list] = {}  # key -> [Semaphore, ссылок]
+
+    def _reject(self, reason: str) -> GatewayRejected:
+        OUTBOUND_REJECTED.labels(self.service, reason).inc()
+        return GatewayRejected(self.service, reason, retry_after=max(1, int(self.max_wait)))
+
+    # --- лимит на пользователя ---
+
+    def _key_semaphore(self, key: Hashable) -> asyncio.Semaphore:
+        entry = self._per_key.get(key)
+        if entry is None:
+            entry = self._per_key[key] = [asyncio.Semaphore(self.max_per_key), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _key_release(self, key: Hashable, acquired: bool) -> None:
+        entry = self._per_key[key]
+        if acquired:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._per_key[key]
+
+    # --- глобальный лимит с очередью ---
+
+    def _update_depth(self) -> None:
+        OUTBOUND_QUEUE_DEPTH.labels(self.service).set(len(self._waiters))
+
+    async def _acquire(self, priority: int, deadline: float) -> None:
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), fut]
+        heapq.heappush(self._waiters, entry)
+        self._update_depth()
+        try:
+            async with asyncio.timeout_at(deadline):
+                await fut
+        except (TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # слот передали одновременно с отменой — возвращаем его следующему
+                self._release()
+            else:
+                fut.cancel()
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._update_depth()
+            if isinstance(e, TimeoutError):
+                raise self._reject("deadline") from None
+            raise
+
+    def _release(self) -> None:
+        # слот передаётся первому ожидающему, счётчик активных не меняется
+        while self._waiters:
+            fut = heapq.heappop(self._waiters)[2]
+            if not fut.done():
+                fut.set_result(None)
+                self._update_depth()
+                return
+        self._update_depth()
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable, priority: int = 1, max_wait: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.max_wait if max_wait is None else max_wait)
+        start = time.perf_counter()
+
+        key_sem = self._key_semaphore(key)
+        key_acquired = False
+        try:
+            try:
+                async with asyncio.timeout_at(deadline):
+                    await key_sem.acquire()
+                key_acquired = True
+            except TimeoutError:
+                raise self._reject("per_key_deadline") from None
+
+            await self._acquire(priority, deadline)
+            OUTBOUND_QUEUE_WAIT.labels(self.service).observe(time.perf_counter() - start)
+            OUTBOUND_IN_FLIGHT.labels(self.service).inc()
+            try:
+                yield
+            finally:
+                OUTBOUND_IN_FLIGHT.labels(self.service).dec()
+                self._release()
+        finally:
+            self._key_release(key, key_acquired)
+
+
+OPENAI_GATEWAY = OutboundGateway(
+    service="openai",
+    max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+    max_per_key=settings.OPENAI_MAX_PER_USER,
+    max_queue=settings.OPENAI_QUEUE_SIZE,
+    max_wait=settings.OPENAI_QUEUE_TIMEOUT,
+)
+
+
+def openai_priority(client_id: Optional[int]) -> int:
+    """Приоритет по OAuth клиенту сессии (oauth_clients.id), 0 — самый высокий"""
+    return settings.OPENAI_PRIORITY_CLIENTS.get(client_id, settings.OPENAI_DEFAULT_PRIORITY)
+
+
+_http_session: Optional["aiohttp.ClientSession"] = None
+
+
+def get_http_session() -> "aiohttp.ClientSession":
+    """Общая aiohttp сессия процесса; лимит соединений совпадает с лимитом шлюза"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        # импорт при первом запросе — aiohttp не нужен для старта приложения
+        import aiohttp
+
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.OPENAI_MAX_CONCURRENCY, ttl_dns_cache=300),
+        )
+    return _http_session
+
+
+async def close_http_session() -> None:
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
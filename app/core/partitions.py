@@ -0,0 +1,192 @@
+# app/core/partitions.py
+"""
+Обслуживание помесячных партиций payments и refresh_tokens (celery beat, tasks.maintain_partitions).
+
+Партиции называются <таблица>_pYYYYMM и покрывают [1-е число месяца, 1-е число следующего) в UTC.
+Задача заранее создаёт партиции на PARTITION_MONTHS_AHEAD месяцев вперёд — вставка не должна
+попадать в DEFAULT партицию. Если строки всё же попали в DEFAULT (партиция не была создана
+вовремя), создать партицию на их диапазон нельзя — задача переносит их: DETACH DEFAULT, создание
+партиции, перенос строк, ATTACH DEFAULT обратно, одной транзакцией. Ошибки создания логируются
+как error, и задача завершается исключением.
+
+Старые партиции отсоединяются (DETACH): payments остаются отдельными таблицами-архивами,
+refresh_tokens удаляются. Партиция <таблица>_legacy с данными до перехода на партиционирование
+задачей не трогается.
+"""
+import datetime as dt
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger("uvicorn")
+
+
+@dataclass
+class PartitionPolicy:
+    table: str
+    # отсоединять партиции старше N месяцев (0 — никогда)
+    detach_after_months: int
+    # удалять отсоединённые партиции; иначе они остаются отдельными таблицами
+    drop_detached: bool
+
+
+def default_policies() -> List[PartitionPolicy]:
+    return [
+        PartitionPolicy("payments", settings.PARTITION_PAYMENTS_DETACH_MONTHS, drop_detached=False),
+        PartitionPolicy("refresh_tokens", settings.PARTITION_REFRESH_TOKENS_DETACH_MONTHS, drop_detached=True),
+    ]
+
+
+def month_start(day: dt.date) -> dt.date:
+    return day.replace(day=1)
+
+
+def add_months(day: dt.date, months: int) -> dt.date:
+    index = day.year * 12 + day.month - 1 + months
+    return dt.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: dt.date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+async def _execute(*statements: str) -> None:
+    """Выполняет команды одной транзакцией с lock_timeout"""
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            await db.execute(text(f"SET LOCAL lock_timeout = {int(settings.RETENTION_LOCK_TIMEOUT_MS)}"))
+            for sql in statements:
+                await db.execute(text(sql))
+
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+
+async def _default_has_rows(table: str, lower: str, upper: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {default_partition_name(table)} "
+            f"WHERE created_at >= '{lower}' AND created_at < '{upper}')"
+        ))
+        return bool(result.scalar())
+
+
+_UPPER_BOUND_RE = re.compile(r"TO \('(\d{4})-(\d{2})-(\d{2})")
+
+
+async def _list_partitions(table: str) -> Dict[str, str]:
+    """{имя партиции: границы FOR VALUES ...}"""
+    async with AsyncSessionLocal() as db, db.begin():
+        # границы выводятся в часовом поясе сессии, а партиции считаются в UTC
+        await db.execute(text("SET LOCAL TIME ZONE 'UTC'"))
+        result = await db.execute(
+            text(
+                "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = CAST(:table AS regclass)"
+            ),
+            {"table": table},
+        )
+        return {row[0]: row[1] for row in result.all()}
+
+
+class PartitionError(RuntimeError):
+    pass
+
+
+async def ensure_partitions(table: str, today: dt.date) -> List[str]:
+    """
+    Создаёт недостающие партиции с текущего месяца на PARTITION_MONTHS_AHEAD вперёд; строки
+    диапазона, уже лежащие в DEFAULT партиции, переносятся в новую. PartitionError — если
+    какую-то партицию создать не удалось (остальные при этом создаются)
+    """
+    existing = await _list_partitions(table)
+    created, failed = [], []
+    current = month_start(today)
+    # месяцы до перехода на партиции покрывает <table>_legacy — с них не начинаем
+    legacy_bound = _UPPER_BOUND_RE.search(existing.get(f"{table}_legacy") or "")
+    if legacy_bound:
+        current = max(current, dt.date(*(int(part) for part in legacy_bound.groups())))
+    default = default_partition_name(table)
+    for offset in range(settings.PARTITION_MONTHS_AHEAD + 1):
+        month = add_months(current, offset)
+        name = partition_name(table, month)
+        if name in existing:
+            continue
+        lower = f"{month.isoformat()} 00:00:00+00"
+        upper = f"{add_months(month, 1).isoformat()} 00:00:00+00"
+        create = f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        try:
+            if default in existing and await _default_has_rows(table, lower, upper):
+                # с такими строками в DEFAULT партицию на диапазон создать нельзя
+                logger.error("partitions %s: строки за %s попали в %s — переносятся в %s",
+                             table, month, default, name)
+                await _execute(
+                    f"ALTER TABLE {table} DETACH PARTITION {default}",
+                    create,
+                    f"INSERT INTO {table} SELECT * FROM {default} "
+                    f"WHERE created_at >= '{lower}' AND created_at < '{upper}'",
+                    f"DELETE FROM {default} WHERE created_at >= '{lower}' AND created_at < '{upper}'",
+                    f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT",
+                )
+            else:
+                await _execute(create)
+            created.append(name)
+        except Exception as e:
+            logger.error("partitions %s: не удалось создать %s: %s", table, name, e)
+            failed.append(name)
+    if failed:
+        raise PartitionError(f"{table}: не созданы партиции {failed} (создано {created})")
+    return created
+
+
+async def detach_old_partitions(policy: PartitionPolicy, today: dt.date) -> List[str]:
+    if not policy.detach_after_months:
+        return []
+    cutoff = add_months(month_start(today), -policy.detach_after_months)
+    pattern = re.compile(rf"^{re.escape(policy.table)}_p(\d{{4}})(\d{{2}})$")
+    detached = []
+    for name in sorted(await _list_partitions(policy.table)):
+        match = pattern.match(name)
+        if not match:
+            continue
+        month = dt.date(int(match.group(1)), int(match.group(2)), 1)
+        # партиция целиком старше границы
+        if add_months(month, 1) > cutoff:
+            continue
+        try:
+            await _execute(f"ALTER TABLE {policy.table} DETACH PARTITION {name}")
+            if policy.drop_detached:
+                await _execute(f"DROP TABLE {name}")
+            detached.append(name)
+        except Exception as e:
+            logger.warning("partitions %s: не удалось отсоединить %s: %s", policy.table, name, e)
+    return detached
+
+
+async def maintain_partitions(today: dt.date = None) -> List[Dict[str, Any]]:
+    today = today or dt.datetime.now(dt.timezone.utc).date()
+    reports = []
+    errors = []
+    for policy in default_policies():
+        try:
+            created = await ensure_partitions(policy.table, today)
+        except PartitionError as e:
+            # отсоединение старых партиций от этого не зависит — ошибку поднимаем в конце
+            errors.append(str(e))
+            created = []
+        detached = await detach_old_partitions(policy, today)
+        logger.info("partitions %s: создано %s, отсоединено %s (%s)", policy.table, created, detached,
+                    "удалены" if policy.drop_detached else "оставлены таблицами")
+        reports.append({"table": policy.table, "created": created, "detached": detached,
+                        "dropped": policy.drop_detached and bool(detached)})
+    if errors:
+        raise PartitionError("; ".join(errors))
+    return reports
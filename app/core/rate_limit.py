@@ -0,0 +1,262 @@
+# app/core/rate_limit.py
+"""
+Распределённый лимитер запросов (token bucket) для дорогих эндпоинтов.
+
+Ведро хранится в Redis и обновляется атомарным Lua скриптом — лимит общий для всех
+воркеров. Если Redis недоступен, лимит считается в памяти процесса (на воркер), а Redis
+не опрашивается RATE_LIMIT_REDIS_RETRY_SECONDS, чтобы не ждать таймаут на каждом запросе.
+"""
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.db.session import AsyncSessionLocal
+from app.method.access_token import is_stateless_token, verify_access_token
+from app.models.sessions.models import Session as SessionModel, OAuthClient
+
+logger = logging.getLogger("uvicorn")
+
+# KEYS[1] — ключ ведра; ARGV: ёмкость, пополнение токенов в секунду, стоимость запроса.
+# Время берётся из Redis, чтобы расхождение часов воркеров не влияло на лимит.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+@dataclass(frozen=True)
+class RateRule:
+    capacity: int          # размер всплеска
+    per_seconds: float     # за сколько секунд ведро наполняется целиком
+    key: str = "user"      # user | ip | client
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+
+@dataclass
+class RateDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int             # секунд до полного восстановления
+    retry_after: int       # секунд до следующего разрешённого запроса (0 — можно сейчас)
+
+    def headers(self) -> Dict[str, str]:
+        h = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            h["Retry-After"] = str(self.retry_after)
+        return h
+
+
+# Правила по умолчанию: "МЕТОД путь" (без root_path) → правило.
+# Переопределяются/дополняются через settings.RATE_LIMIT_RULES.
+DEFAULT_RULES: Dict[str, RateRule] = {
+    "POST /gpt/create_gtp_prompt": RateRule(capacity=10, per_seconds=60, key="user"),
+    "POST /gpt/jobs": RateRule(capacity=10, per_seconds=60, key="user"),
+    "POST /payment/create_payment": RateRule(capacity=5, per_seconds=60, key="user"),
+    "POST /payment/create_payment_single": RateRule(capacity=5, per_seconds=60, key="user"),
+    "POST /auth/login": RateRule(capacity=10, per_seconds=60, key="ip"),
+    "POST /auth/register_provider": RateRule(capacity=20, per_seconds=60, key="client"),
+}
+
+
+def load_rules() -> Dict[str, RateRule]:
+    rules = dict(DEFAULT_RULES)
+    for route, raw in settings.RATE_LIMIT_RULES.items():
+        if raw is None:
+            rules.pop(route, None)  # null в конфиге отключает правило по умолчанию
+        else:
+            rules[route] = RateRule(**raw)
+    return rules
+
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+class _SubjectResolver:
+    """
+    Определяет, чей это запрос: id пользователя из токена и id существующего OAuth клиента.
+    Ключ ведра не должен зависеть от того, что клиент может свободно менять: новый токен после
+    повторного входа или произвольный oauth_client в query. Результаты (и отрицательные тоже)
+    кэшируются в памяти процесса на RATE_LIMIT_SUBJECT_CACHE_SECONDS.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self._cache: "OrderedDict[str, Tuple[float, Optional[int]]]" = OrderedDict()
+        self._max_keys = max_keys
+
+    async def _cached(self, key: str, load) -> Optional[int]:
+        now = time.monotonic()
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] > now:
+            self._cache.move_to_end(key)
+            return hit[1]
+        try:
+            value = await load()
+        except Exception as e:
+            # БД недоступна — ограничиваем по адресу, результат не кэшируем
+            logger.warning("Лимитер: не удалось определить субъект запроса: %s", e)
+            return None
+        self._cache[key] = (now + settings.RATE_LIMIT_SUBJECT_CACHE_SECONDS, value)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._max_keys:
+            self._cache.popitem(last=False)
+        return value
+
+    async def user_id(self, token: str) -> Optional[int]:
+        if is_stateless_token(token):
+            # подписанный токен: id пользователя берётся из claims без обращения к БД
+            claims = verify_access_token(token)
+            return int(claims["uid"]) if claims and claims.get("uid") is not None else None
+
+        async def _load() -> Optional[int]:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(SessionModel.user_id)
+                    .where((SessionModel.access_token == token) & (SessionModel.is_active.is_(True)))
+                    .limit(1)
+                )
+                return result.scalar_one_or_none()
+
+        return await self._cached("t:" + hashlib.sha256(token.encode()).hexdigest(), _load)
+
+    async def client_id(self, client: str) -> Optional[int]:
+        async def _load() -> Optional[int]:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(OAuthClient.id)
+                    .where((OAuthClient.client_id == client) & (OAuthClient.revoked.is_not(True)))
+                    .limit(1)
+                )
+                return result.scalar_one_or_none()
+
+        return await self._cached("c:" + client, _load)
+
+
+# общий на процесс: кэш используют и лимитер, и Idempotency-Key (app/core/idempotency.py)
+subjects = _SubjectResolver()
+
+
+async def _subject(request: Request, rule: RateRule, resolver: _SubjectResolver) -> str:
+    if rule.key == "user":
+        auth = request.headers.get("authorization", "")
+        if auth.lower().startswith("bearer "):
+            user_id = await resolver.user_id(auth[7:])
+            if user_id is not None:
+                return f"u:{user_id}"
+    elif rule.key == "client":
+        client = request.query_params.get("oauth_client")
+        if client:
+            client_id = await resolver.client_id(client[:100])
+            if client_id is not None:
+                return f"c:{client_id}"
+    # без токена/клиента или с неизвестными — ограничиваем по адресу
+    return "ip:" + _client_ip(request)
+
+
+class _LocalBuckets:
+    """Запасной лимитер в памяти процесса с тем же алгоритмом"""
+
+    def __init__(self, max_keys: int = 10000):
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._max_keys = max_keys
+
+    def take(self, key: str, rule: RateRule, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(key, (float(rule.capacity), now))
+        tokens = min(rule.capacity, tokens + max(0.0, now - ts) * rule.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class RateLimiter:
+    def __init__(self, rules: Dict[str, RateRule]):
+        self.rules = rules
+        self._script = None
+        self._local = _LocalBuckets()
+        self._subjects = subjects
+        self._redis_down_until = 0.0
+
+    def match(self, request: Request) -> Optional[Tuple[str, RateRule]]:
+        path = request.url.path
+        root_path = request.scope.get("root_path") or ""
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        route = f"{request.method} {path.rstrip('/') or '/'}"
+        rule = self.rules.get(route)
+        return (route, rule) if rule else None
+
+    async def _take_redis(self, key: str, rule: RateRule) -> Tuple[bool, float]:
+        if self._script is None:
+            self._script = get_redis().register_script(TOKEN_BUCKET_LUA)
+        allowed, tokens = await self._script(keys=[key], args=[rule.capacity, rule.rate, 1])
+        return bool(int(allowed)), float(tokens)
+
+    async def check(self, request: Request) -> Optional[RateDecision]:
+        matched = self.match(request)
+        if matched is None:
+            return None
+        route, rule = matched
+        key = f"ratelimit:{route}:{await _subject(request, rule, self._subjects)}"
+
+        allowed = tokens = None
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                allowed, tokens = await self._take_redis(key, rule)
+            except RedisError as e:
+                self._redis_down_until = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY_SECONDS
+                logger.warning("Redis недоступен, лимиты считаются в памяти процесса: %s", e)
+        if allowed is None:
+            allowed, tokens = self._local.take(key, rule)
+
+        return RateDecision(
+            allowed=allowed,
+            limit=rule.capacity,
+            remaining=int(tokens),
+            reset=math.ceil((rule.capacity - tokens) / rule.rate),
+            retry_after=0 if allowed else max(1, math.ceil((1 - tokens) / rule.rate)),
+        )
@@ -0,0 +1,32 @@
+# app/core/redis.py
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+_client: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Общий клиент Redis процесса (пул соединений внутри). Создаётся лениво при первом
+    обращении, чтобы импорт модулей не требовал доступного Redis.
+    """
+    global _client
+    if _client is None:
+        _client = aioredis.from_url(
+            settings.REDIS_URL or settings.CELERY_BROKER_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,243 @@
+# app/core/retention.py
+"""
+Очистка старых данных по политикам на таблицу (запускается celery beat, tasks.run_retention).
+
+Каждая политика удаляет (или переносит в архив) строки небольшими пачками по первичному
+ключу: пачка — отдельная короткая транзакция с lock_timeout, между пачками пауза. Так очистка
+не держит долгих блокировок и не забивает диск WAL, а горячие индексы остаются небольшими.
+Пачка, не дождавшаяся блокировки, пропускается и повторяется; после нескольких подряд
+таблица откладывается до следующего запуска.
+"""
+import asyncio
+import datetime as dt
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import bindparam, text, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+from app.core.metrics import RETENTION_ROWS, RETENTION_LOCK_TIMEOUTS
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger("uvicorn")
+
+# lock_not_available
+LOCK_TIMEOUT_PGCODE = "55P03"
+MAX_LOCK_TIMEOUTS_IN_ROW = 3
+
+# Каждый запрос берёт пачку ключей после :last_key, обрабатывает её и возвращает
+# (число строк, последний ключ пачки); last_key = NULL — кандидатов больше нет.
+# max() для uuid в PostgreSQL нет, поэтому последний ключ — через ORDER BY ... LIMIT 1.
+
+_REFRESH_TOKENS_SQL = """
+WITH batch AS (
+    SELECT id FROM refresh_tokens
+    WHERE id > :last_key
+      AND ((revoked AND created_at < :cutoff) OR expires_at < :cutoff)
+    ORDER BY id
+    LIMIT :batch_size
+), del AS (
+    DELETE FROM refresh_tokens t USING batch b WHERE t.id = b.id RETURNING t.id
+)
+SELECT (SELECT count(*) FROM del) AS affected,
+       (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_key
+"""
+
+# refresh токены сессии удаляются тем же запросом — иначе не даст внешний ключ
+_SESSIONS_SQL = """
+WITH batch AS (
+    SELECT id FROM sessions
+    WHERE id > :last_key AND NOT is_active AND last_used_at < :cutoff
+    ORDER BY id
+    LIMIT :batch_size
+), tokens AS (
+    DELETE FROM refresh_tokens t USING batch b WHERE t.session_id = b.id RETURNING t.id
+), del AS (
+    DELETE FROM sessions s USING batch b WHERE s.id = b.id RETURNING s.id
+)
+SELECT (SELECT count(*) FROM del) AS affected,
+       (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_key
+"""
+
+_COUPONS_SQL = """
+WITH batch AS (
+    SELECT id FROM coupon_user
+    WHERE id > :last_key AND NOT is_active AND created_at < :cutoff
+    ORDER BY id
+    LIMIT :batch_size
+), del AS (
+    DELETE FROM coupon_user c USING batch b WHERE c.id = b.id RETURNING c.id
+)
+SELECT (SELECT count(*) FROM del) AS affected,
+       (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_key
+"""
+
+_PAYMENTS_BATCH = """
+WITH batch AS (
+    SELECT id FROM payments
+    WHERE id > :last_key AND status = ANY(:statuses) AND created_at < :cutoff
+    ORDER BY id
+    LIMIT :batch_size
+)"""
+
+_PAYMENTS_DELETE_SQL = _PAYMENTS_BATCH + """, del AS (
+    DELETE FROM payments p USING batch b WHERE p.id = b.id RETURNING p.id
+)
+SELECT (SELECT count(*) FROM del) AS affected,
+       (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_key
+"""
+
+# колонки payments_archive повторяют payments, archived_at — последняя
+_PAYMENTS_ARCHIVE_SQL = _PAYMENTS_BATCH + """, moved AS (
+    DELETE FROM payments p USING batch b WHERE p.id = b.id RETURNING p.*
+), archived AS (
+    INSERT INTO payments_archive SELECT m.*, now() FROM moved m RETURNING 1
+)
+SELECT (SELECT count(*) FROM archived) AS affected,
+       (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_key
+"""
+
+# ключи идемпотентности платежей, чьих платежей в payments уже нет (удалены, в архиве,
+# в отсоединённой партиции); проверка по первичному ключу payments (id, created_at)
+_PAYMENT_IDEMPOTENCY_SQL = """
+WITH batch AS (
+    SELECT k.idempotency_key FROM payment_idempotency k
+    WHERE k.idempotency_key > :last_key AND k.created_at < :cutoff
+      AND NOT EXISTS (
+          SELECT 1 FROM payments p WHERE p.id = k.payment_id AND p.created_at = k.payment_created_at
+      )
+    ORDER BY k.idempotency_key
+    LIMIT :batch_size
+), del AS (
+    DELETE FROM payment_idempotency t USING batch b
+    WHERE t.idempotency_key = b.idempotency_key RETURNING t.idempotency_key
+)
+SELECT (SELECT count(*) FROM del) AS affected,
+       (SELECT idempotency_key FROM batch ORDER BY idempotency_key DESC LIMIT 1) AS last_key
+"""
+
+
+@dataclass
+class RetentionPolicy:
+    table: str
+    sql: str
+    action: str                       # deleted / archived — для отчёта и метрик
+    start_key: Any
+    cutoff: Callable[[], dt.datetime]
+    params: Callable[[], Dict[str, Any]] = dict
+
+
+@dataclass
+class TableReport:
+    table: str
+    action: str
+    rows: int = 0
+    batches: int = 0
+    lock_timeouts: int = 0
+    seconds: float = 0.0
+    completed: bool = False
+    errors: List[str] = field(default_factory=list)
+
+
+def _days_ago(days: int) -> Callable[[], dt.datetime]:
+    return lambda: dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=days)
+
+
+def default_policies() -> List[RetentionPolicy]:
+    archive = settings.RETENTION_PAYMENTS_MODE == "archive"
+    return [
+        # сначала refresh токены — потом сессии удаляются с меньшим числом зависимых строк
+        RetentionPolicy("refresh_tokens", _REFRESH_TOKENS_SQL, "deleted", 0,
+                        _days_ago(settings.RETENTION_REFRESH_TOKENS_DAYS)),
+        RetentionPolicy("sessions", _SESSIONS_SQL, "deleted", 0, _days_ago(settings.RETENTION_SESSIONS_DAYS)),
+        RetentionPolicy("coupon_user", _COUPONS_SQL, "deleted", 0, _days_ago(settings.RETENTION_COUPONS_DAYS)),
+        RetentionPolicy(
+            "payments",
+            _PAYMENTS_ARCHIVE_SQL if archive else _PAYMENTS_DELETE_SQL,
+            "archived" if archive else "deleted",
+            uuid.UUID(int=0),
+            _days_ago(settings.RETENTION_PAYMENTS_DAYS),
+            lambda: {"statuses": list(settings.RETENTION_PAYMENT_STATUSES)},
+        ),
+        # после payments — чтобы в этот же запуск освободить ключи удалённых платежей
+        RetentionPolicy("payment_idempotency", _PAYMENT_IDEMPOTENCY_SQL, "deleted", "",
+                        _days_ago(settings.RETENTION_PAYMENTS_DAYS)),
+    ]
+
+
+def _is_lock_timeout(error: DBAPIError) -> bool:
+    orig = getattr(error, "orig", None)
+    return (getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)) == LOCK_TIMEOUT_PGCODE
+
+
+async def _run_batch(policy: RetentionPolicy, params: Dict[str, Any]):
+    statement = text(policy.sql)
+    if "statuses" in params:
+        statement = statement.bindparams(bindparam("statuses", type_=ARRAY(String)))
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            # SET LOCAL не принимает параметры — значение из настроек, приводим к int
+            await db.execute(text(f"SET LOCAL lock_timeout = {int(settings.RETENTION_LOCK_TIMEOUT_MS)}"))
+            result = await db.execute(statement, params)
+            return result.one()
+
+
+async def run_policy(policy: RetentionPolicy) -> TableReport:
+    report = TableReport(table=policy.table, action=policy.action)
+    started = time.perf_counter()
+    # срок считается один раз на запуск, чтобы граница не сдвигалась между пачками
+    params = {"cutoff": policy.cutoff(), "batch_size": settings.RETENTION_BATCH_SIZE, **policy.params()}
+    last_key = policy.start_key
+    lock_timeouts_in_row = 0
+
+    while report.batches < settings.RETENTION_MAX_BATCHES_PER_TABLE:
+        try:
+            affected, next_key = await _run_batch(policy, {**params, "last_key": last_key})
+        except DBAPIError as e:
+            if not _is_lock_timeout(e):
+                raise
+            report.lock_timeouts += 1
+            RETENTION_LOCK_TIMEOUTS.labels(policy.table).inc()
+            lock_timeouts_in_row += 1
+            if lock_timeouts_in_row >= MAX_LOCK_TIMEOUTS_IN_ROW:
+                logger.warning("retention %s: таблица занята, отложено до следующего запуска", policy.table)
+                break
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS * 10)
+            continue
+
+        lock_timeouts_in_row = 0
+        if next_key is None:
+            report.completed = True
+            break
+        report.batches += 1
+        report.rows += affected
+        RETENTION_ROWS.labels(policy.table, policy.action).inc(affected)
+        last_key = next_key
+        # пауза без открытой транзакции и соединения — даём место рабочей нагрузке
+        await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+
+    report.seconds = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def run_retention(policies: List[RetentionPolicy] = None) -> List[Dict[str, Any]]:
+    reports = []
+    for policy in policies or default_policies():
+        try:
+            report = await run_policy(policy)
+        except Exception as e:
+            # ошибка одной таблицы не останавливает очистку остальных
+            logger.exception("retention %s: ошибка", policy.table)
+            report = TableReport(table=policy.table, action=policy.action, errors=[f"{type(e).__name__}: {e}"])
+        logger.info(
+            "retention %s: %s %s строк за %s пачек, lock timeout: %s, %.1f с%s",
+            report.table, report.action, report.rows, report.batches, report.lock_timeouts, report.seconds,
+            "" if report.completed else " (не завершено)",
+        )
+        reports.append(report.__dict__)
+    return reports
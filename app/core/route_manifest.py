@@ -0,0 +1,55 @@
+# app/core/route_manifest.py
+"""
+Манифест роутеров: список модулей {package}.{name}.router, которые подключает приложение.
+
+Генерируется при сборке образа (RUN python -m app.core.route_manifest) — на старте
+не нужно обходить пакеты через pkgutil/find_spec. Если файла нет (локальный запуск,
+--reload), список строится сканированием каталога без импорта модулей.
+"""
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger("uvicorn")
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+MANIFEST_PATH = BASE_DIR / "app" / "routes_manifest.json"
+
+
+def _package_dir(package_name: str) -> Path:
+    return BASE_DIR.joinpath(*package_name.split("."))
+
+
+def discover_route_modules(package_name: str) -> List[str]:
+    """Подпакеты, в которых есть router.py — только по файловой системе, без импортов"""
+    root = _package_dir(package_name)
+    modules = []
+    for child in sorted(root.iterdir()):
+        if child.is_dir() and (child / "__init__.py").exists() and (child / "router.py").exists():
+            modules.append(f"{package_name}.{child.name}.router")
+    return modules
+
+
+def load_route_manifest(package_name: str) -> Optional[List[str]]:
+    try:
+        data = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning("Манифест роутеров повреждён (%s), используется сканирование", e)
+        return None
+    return data.get(package_name)
+
+
+def write_route_manifest(package_names: List[str]) -> dict:
+    data = {name: discover_route_modules(name) for name in package_names}
+    MANIFEST_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    return data
+
+
+if __name__ == "__main__":
+    packages = sys.argv[1:] or ["app.handlers"]
+    result = write_route_manifest(packages)
+    print(f"{MANIFEST_PATH}: {sum(len(v) for v in result.values())} роутеров")
@@ -0,0 +1,91 @@
+import re
+import time
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"\$\d+|%\(\w+\)s|(?<!:):(?!:)\w+|\?")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+
+
+@dataclass
+class QueryProfile:
+    """Статистика SQL запросов, выполненных в рамках одного HTTP запроса"""
+    count: int = 0
+    total_time: float = 0.0
+    fingerprints: Counter = field(default_factory=Counter)
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Отпечатки, которые выполнялись threshold и более раз — кандидаты в N+1"""
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold]
+
+
+# движки, на которые уже повешены события профилировщика
+_installed_engines: "weakref.WeakSet" = weakref.WeakSet()
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("sql_query_profile", default=None)
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Нормализует SQL: литералы и параметры заменяются на ?, списки IN схлопываются,
+    пробелы сжимаются. Одинаковые по форме запросы дают одинаковый отпечаток.
+    """
+    fp = _STRING_RE.sub("?", statement)
+    fp = _PARAM_RE.sub("?", fp)
+    fp = _NUMBER_RE.sub("?", fp)
+    fp = _WHITESPACE_RE.sub(" ", fp).strip()
+    return _IN_LIST_RE.sub("IN (?)", fp)
+
+
+def start_profile() -> Tuple[QueryProfile, object]:
+    profile = QueryProfile()
+    token = _current_profile.set(profile)
+    return profile, token
+
+
+def stop_profile(token) -> None:
+    _current_profile.reset(token)
+
+
+def install_sql_profiler(engine: AsyncEngine) -> None:
+    """
+    Вешает на движок события, которые приписывают запросы текущему профилю.
+    Контекст запроса доходит до событий, так как greenlet SQLAlchemy наследует contextvars.
+    Повторный вызов для того же движка ничего не делает — иначе запросы считались бы дважды.
+    """
+    sync_engine = engine.sync_engine
+    if sync_engine in _installed_engines:
+        return
+    _installed_engines.add(sync_engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        starts = conn.info.get("profiler_query_start")
+        if profile is None or not starts:
+            return
+        profile.count += 1
+        profile.total_time += time.perf_counter() - starts.pop()
+        profile.fingerprints[fingerprint(statement)] += 1
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None:
+            starts = conn.info.get("profiler_query_start")
+            if starts:
+                starts.pop()
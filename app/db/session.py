@@ -1,8 +1,13 @@
 # app/db/session.py
+import time
 from typing import AsyncGenerator
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
 from app.core.config import settings
+from app.core.metrics import DB_POOL_CHECKOUT_SECONDS, instrument_engine
+from app.core.sql_profiler import install_sql_profiler
 
 DATABASE_URL = (
     f"{settings.DB_TYPE}+{settings.DB_ENGINE}://"
@@ -10,8 +15,23 @@ DATABASE_URL = (
     f"{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 )
 
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """Стандартный пул async движка, который замеряет ожидание свободного соединения"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+
 # создаём асинхронный движок
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+engine = create_async_engine(DATABASE_URL, echo=True, future=True, poolclass=InstrumentedAsyncPool)
+instrument_engine(engine)
+if settings.SQL_PROFILER_ENABLED:
+    install_sql_profiler(engine)
 
 # фабрика асинхронных сессий
 AsyncSessionLocal = async_sessionmaker(
@@ -25,5 +45,3 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
         # session автоматически закроется и await'ится при выходе
-
-
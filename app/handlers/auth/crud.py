@@ -68,6 +68,22 @@ class UserRepository(AsyncUserRepository):
 
         return self._to_dto(user) if user else None
 
+    async def confirm_email(self, user_id: int, email: str) -> Optional[OutUser]:
+        """
+        Применяет подтверждённый email одним UPDATE ... RETURNING. Строка не меняется,
+        если адрес уже установлен (повторный переход по ссылке) — тогда вернётся None.
+        """
+        stmt = (
+            update(UserModel)
+            .where((UserModel.id == user_id) & (UserModel.email.is_distinct_from(email)))
+            .values(email=email)
+            .returning(UserModel)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        user = result.scalar_one_or_none()
+        return self._to_dto(user) if user else None
+
     async def create_user(self, user_in: UserCreate) -> OutUser:
         m = UserModel()
         m.user_name = user_in.user_name
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
 from typing import Optional
 
+# роли с правами администратора (RoleService.is_admin, интроспекция токенов)
+ADMIN_ROLES = ("Admin", "Manager")
+
 @dataclass
 class UserAuthData:
     id: int
@@ -42,6 +42,9 @@ class AsyncUserRepository(Protocol):
     async def update_user(self, user_data: UserUpdate) -> Optional[OutUser]:
         ...
 
+    async def confirm_email(self, user_id: int, email: str) -> Optional[OutUser]:
+        ...
+
     async def create_user_provide(self, user_in: UserCreateProvide) -> OutUser:
         ...
 
@@ -108,6 +111,9 @@ class AsyncAuthService(Protocol):
     async def update_user_data(self, data: UserUpdate) -> Optional[OutUser]:
         ...
 
+    async def confirm_email_change(self, user_id: int, email: str) -> Optional[OutUser]:
+        ...
+
 
 class AsyncRoleService(Protocol):
     """Сервис авторизации/аутентификации. - вспомогательный"""
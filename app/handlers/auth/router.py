@@ -1,6 +1,9 @@
 from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException, Depends, Request, Body, Form
+from redis.exceptions import RedisError
+
+from app.core.config import settings
 
 from app.handlers.auth.dependencies import AuthServiceDep
 from app.handlers.auth.schemas import LogInUser, UserCreate, AuthResponse, RoleUser, AuthResponseProvide, PaginateUser, \
@@ -8,6 +11,8 @@ from app.handlers.auth.schemas import LogInUser, UserCreate, AuthResponse, RoleU
 from app.handlers.providers.schemas import ProviderLoginRequest
 from app.handlers.session.dependencies import SessionServiceDep
 from app.handlers.session.schemas import CheckSessionAccessToken
+from app.main import logger
+from app.method.cooldown import acquire_cooldown, release_cooldown, cooldown_retry_after
 from app.method.get_token import get_token
 from app.method.smtp import confirm_token, send_confirmation_email_for_change
 
@@ -25,18 +30,20 @@ async def hub():
 
 @router.get("/confirm_email")
 async def confirm_email(token: str,
-                        uid: str,
-                        auth_service: AuthServiceDep):
-    email = confirm_token(token, expiration=3600)  # 1 час жизни токена
-    if email is None:
+                        auth_service: AuthServiceDep,
+                        uid: Optional[str] = None):
+    data = confirm_token(token, expiration=3600)  # 1 час жизни токена
+    if data is None:
         raise HTTPException(status_code=400, detail="Неверный или просроченный токен")
 
-    data = UserUpdate(
-        user_id=int(uid),
-        email=email
-    )
+    # uid берётся из подписи; параметр ссылки нужен только для токенов старого формата
+    user_id = data["uid"] if data["uid"] is not None else (int(uid) if uid else None)
+    if user_id is None or (uid and int(uid) != user_id):
+        raise HTTPException(status_code=400, detail="Неверный или просроченный токен")
 
-    return await auth_service.update_user_data(data=data)
+    result = await auth_service.confirm_email_change(user_id=user_id, email=data["email"])
+    # None — адрес уже подтверждён этой же ссылкой
+    return result if result is not None else {"status": "already_confirmed"}
 
 
 @router.post("/login", response_model=AuthResponse)
@@ -289,7 +296,28 @@ async def update_user_email(
         access_token=access_token,
     )
     await session_service.validate_access_token_session(csat)
-    return await send_confirmation_email_for_change(user_id=str(user_data.user_id) ,new_email=user_data.email)
+
+    # не чаще одного письма за EMAIL_CHANGE_COOLDOWN_SECONDS на пользователя
+    try:
+        if await acquire_cooldown("email_change", user_data.user_id, settings.EMAIL_CHANGE_COOLDOWN_SECONDS):
+            retry_after = await cooldown_retry_after("email_change", user_data.user_id)
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком частые запросы смены email",
+                headers={"Retry-After": str(retry_after)},
+            )
+    except RedisError as e:
+        logger.warning("Redis недоступен, смена email без ограничения частоты: %s", e)
+
+    try:
+        return await send_confirmation_email_for_change(user_id=str(user_data.user_id), new_email=user_data.email)
+    except Exception:
+        # письмо не ушло — даём повторить сразу
+        try:
+            await release_cooldown("email_change", user_data.user_id)
+        except RedisError:
+            pass
+        raise
 
 
 @router.delete("/{user_id}",response_model=Optional[OutUser])
@@ -8,7 +8,7 @@ import asyncpg
 
 from app.core.abs.unit_of_work import IUnitOfWorkAuth
 from app.core.config import settings
-from app.handlers.auth.dto import UserAuthData
+from app.handlers.auth.dto import UserAuthData, ADMIN_ROLES
 from app.handlers.auth.interfaces import AsyncAuthService, AsyncRoleService
 from app.handlers.auth.schemas import PaginateUser, LogInUser, RoleUser, AuthResponse, OutUser, Token, UserCreate, \
     UserCreateProvide, \
@@ -451,6 +451,24 @@ class SqlAlchemyAuth(AsyncAuthService):
         result = await self.uow.user_repo.update_user(data)
         return result
 
+    async def confirm_email_change(self, user_id: int, email: str) -> Optional[OutUser]:
+        try:
+            async with self.uow:
+                return await self.uow.user_repo.confirm_email(user_id=user_id, email=email)
+        except IntegrityError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Этот email уже привязан к другому аккаунту"
+            )
+        except HTTPException:
+            # просто пробрасываем дальше, чтобы не превращать в 500
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Внутренняя ошибка сервера: {str(e)}"
+            )
+
     @transactional()
     async def update_role(self, role_id: int, check_data: CheckSessionAccessToken) -> Optional[OutUser]:
         await self.role_service.is_admin(check_data.user_id)
@@ -479,7 +497,7 @@ class SqlAlchemyRole(AsyncRoleService):
                 if not role:
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Role not found")
 
-                if role.name not in ['Admin', 'Manager']:
+                if role.name not in ADMIN_ROLES:
                     return False
 
                 return True
@@ -10,9 +10,10 @@ from typing import TYPE_CHECKING, Optional, List
 from app.handlers.coupon.schemas import OutCoupon, CreateCoupon
 from app.handlers.coupon.interfaces import AsyncCouponService, AsyncCouponRepository
 from app.main import logger
-from app.models import CouponUser
+from app.models import CouponUser, User
 
-from sqlalchemy import select, update, func
+from sqlalchemy import select, update, func, bindparam, any_, BigInteger
+from sqlalchemy.dialects.postgresql import insert, ARRAY
 
 
 class CouponRepository(AsyncCouponRepository):
@@ -63,29 +64,38 @@ class CouponRepository(AsyncCouponRepository):
             return None
         return [await self._to_dto(r) for r in sessions]
 
+    async def get_last_created_at(self, user_id: int) -> Optional[dt]:
+        """Время выдачи последнего активного купона пользователя (без загрузки строк)"""
+        q = select(func.max(CouponUser.created_at)).where(
+            (CouponUser.user_id == user_id) & (CouponUser.is_active == True)
+        )
+        result = await self.db.execute(q)
+        return result.scalar_one_or_none()
+
     async def get_info_by_coupon_id(self, id: int) -> Optional[OutCoupon]:
         result = await self.db.get(CouponUser, id)
         return await self._to_dto(result) if result else None
 
     async def get_by_token_hash(self, token: str) -> Optional[OutCoupon]:
-        q = (
-            select(CouponUser)
-            .where(
-                (CouponUser.token_hash == token) & (CouponUser.is_active == True)
-            )
-            .order_by(CouponUser.created_at.desc())
-            .limit(1)
+        # активный код уникален (uq_coupon_user_active_token_hash) — точечный поиск по индексу
+        q = select(CouponUser).where(
+            (CouponUser.token_hash == token) & (CouponUser.is_active == True)
         )
         result = await self.db.execute(q)
-        result = result.scalars().first()
+        result = result.scalar_one_or_none()
         return await self._to_dto(result) if result else None
 
     async def used_coupon(self, user_id: int, token: str) -> Optional[OutCoupon]:
+        """
+        Погашение одним запросом: UPDATE находит активный купон по уникальному частичному индексу
+        и сразу гасит его. Повторное/параллельное погашение вернёт None — строка уже неактивна.
+        """
         stmt = (
             update(CouponUser)
             .where(
-                (CouponUser.user_id == user_id) & (CouponUser.token_hash == token) & (CouponUser.is_active == True)
+                (CouponUser.token_hash == token) & (CouponUser.is_active == True) & (CouponUser.user_id == user_id)
             )
+            .execution_options(synchronize_session=False)
         )
 
         stmt = stmt.values(is_active=False).returning(CouponUser)
@@ -95,6 +105,45 @@ class CouponRepository(AsyncCouponRepository):
 
         return await self._to_dto(result) if result else None
 
+    async def get_existing_codes(self, codes: List[str]) -> set[str]:
+        """Какие из переданных кодов уже заняты активными купонами — одним запросом на пачку"""
+        if not codes:
+            return set()
+        q = select(CouponUser.token_hash).where(
+            (CouponUser.token_hash.in_(codes)) & (CouponUser.is_active == True)
+        )
+        result = await self.db.execute(q)
+        return set(result.scalars().all())
+
+    async def bulk_insert_coupons(self, rows: List[dict]) -> int:
+        """
+        Многострочный INSERT ... ON CONFLICT DO NOTHING одной командой на пачку.
+        Возвращает число реально вставленных строк (конфликтующие коды пропускаются).
+        """
+        if not rows:
+            return 0
+        stmt = insert(CouponUser).values(rows).on_conflict_do_nothing().returning(CouponUser.id)
+        result = await self.db.execute(stmt)
+        return len(result.scalars().all())
+
+    async def get_user_ids_after(self, last_id: int, limit: int, role_id: Optional[int] = None) -> List[int]:
+        """Следующая пачка id активных пользователей (keyset по первичному ключу, без OFFSET)"""
+        q = select(User.id).where((User.id > last_id) & (User.status == True))
+        if role_id is not None:
+            q = q.where(User.role_id == role_id)
+        q = q.order_by(User.id).limit(limit)
+        result = await self.db.execute(q)
+        return list(result.scalars().all())
+
+    async def get_missing_user_ids(self, user_ids: List[int]) -> List[int]:
+        """id из списка, которых нет в users (один запрос с параметром-массивом)"""
+        if not user_ids:
+            return []
+        ids = bindparam("user_ids", list(user_ids), type_=ARRAY(BigInteger))
+        result = await self.db.execute(select(User.id).where(User.id == any_(ids)))
+        found = set(result.scalars().all())
+        return [user_id for user_id in user_ids if user_id not in found]
+
     async def count_coupon(self) -> int:
         count_q = select(func.count(CouponUser.id))
         count_result = await self.db.execute(count_q)
@@ -1,4 +1,5 @@
-from typing import Protocol, List, Optional, Dict, Any
+from datetime import datetime
+from typing import Protocol, List, Optional, Dict, Any, AsyncIterator
 from app.handlers.auth.schemas import (
     RoleUser,
     OutUser,
@@ -6,7 +7,8 @@ from app.handlers.auth.schemas import (
     LogInUser,
     AuthResponse, AuthResponseProvide, UserCreateProvide
 )
-from app.handlers.coupon.schemas import CreateCoupon, OutCoupon, CreateCouponService, PaginateOutCoupon
+from app.handlers.coupon.schemas import CreateCoupon, OutCoupon, CreateCouponService, PaginateOutCoupon, \
+    BulkIssueCoupon, BulkIssueProgress
 from app.handlers.session.schemas import CheckSessionAccessToken
 
 
@@ -18,6 +20,9 @@ class AsyncCouponRepository(Protocol):
     async def get_by_user_id(self, user_id: int) -> Optional[List[OutCoupon]]:
         ...
 
+    async def get_last_created_at(self, user_id: int) -> Optional[datetime]:
+        ...
+
     async def get_info_by_coupon_id(self, id: int) -> Optional[OutCoupon]:
         ...
 
@@ -27,6 +32,18 @@ class AsyncCouponRepository(Protocol):
     async def used_coupon(self, user_id: int, token: str) -> Optional[OutCoupon]:
         ...
 
+    async def get_existing_codes(self, codes: List[str]) -> set[str]:
+        ...
+
+    async def bulk_insert_coupons(self, rows: List[dict]) -> int:
+        ...
+
+    async def get_user_ids_after(self, last_id: int, limit: int, role_id: Optional[int] = None) -> List[int]:
+        ...
+
+    async def get_missing_user_ids(self, user_ids: List[int]) -> List[int]:
+        ...
+
     async def count_coupon(self) -> int:
         ...
 
@@ -67,3 +84,9 @@ class AsyncCouponService(Protocol):
     ) -> PaginateOutCoupon:
         ...
 
+    async def bulk_issue(
+        self,
+        data: BulkIssueCoupon,
+        check_data: CheckSessionAccessToken,
+    ) -> AsyncIterator[BulkIssueProgress]:
+        ...
@@ -2,9 +2,10 @@ import datetime
 from typing import Optional, List
 
 from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 
 from app.handlers.coupon.dependencies import couponServiceDep
-from app.handlers.coupon.schemas import OutCoupon, CreateCouponService, PaginateOutCoupon
+from app.handlers.coupon.schemas import OutCoupon, CreateCouponService, PaginateOutCoupon, BulkIssueCoupon
 from app.handlers.session.schemas import CheckSessionAccessToken
 from app.method.get_token import get_token
 
@@ -262,3 +263,42 @@ async def get_by_token_hash(
     )
 
     return await coupon_service.get_by_token_hash(token=token, check_data=csat)
+
+
+@router.post("/bulk_issue")
+async def bulk_issue(
+        data: BulkIssueCoupon,
+        admin_user_id: int,
+        request: Request,
+        coupon_service: couponServiceDep,
+        access_token: str = Depends(get_token)
+):
+    """
+    Массовая выдача купонов (только для администратора). Получатели — список userIds
+    или все активные пользователи (опционально с фильтром по roleId). Ответ — NDJSON поток,
+    по строке прогресса на каждую вставленную пачку, последняя строка с done=true
+    :param data:
+    :param admin_user_id:
+    :param request:
+    :param coupon_service:
+    :param access_token:
+    :return:
+    """
+    # Получаем IP и User-Agent из запроса
+    ip = request.client.host
+    user_agent = request.headers.get("user-agent", "")
+
+    csat = CheckSessionAccessToken(
+        user_id=admin_user_id,
+        ip_address=ip,
+        user_agent=user_agent,
+        access_token=access_token
+    )
+
+    progress = await coupon_service.bulk_issue(data=data, check_data=csat)
+
+    async def _ndjson():
+        async for item in progress:
+            yield item.model_dump_json(by_alias=True, exclude_none=True) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
@@ -26,6 +26,17 @@ class CreateCouponService(BaseModel):
         validate_by_name = True
 
 
+class BulkIssueCoupon(BaseModel):
+    name: str = Field(..., alias="name")
+    # явный список получателей; если не задан — все активные пользователи (с фильтром по роли)
+    user_ids: Optional[List[int]] = Field(None, alias="userIds")
+    role_id: Optional[int] = Field(None, alias="roleId")
+    chunk_size: Optional[int] = Field(None, alias="chunkSize", ge=1)
+
+    class Config:
+        validate_by_name = True
+
+
 # ---- Response / Output ----
 class OutCoupon(BaseModel):
     id: int = Field(..., alias="id")
@@ -46,3 +57,14 @@ class PaginateOutCoupon(BaseModel):
     count: int = Field(...)
     limit: int = Field(...)
     offset: int = Field(...)
+
+
+class BulkIssueProgress(BaseModel):
+    processed: int = Field(..., alias="processed")
+    inserted: int = Field(..., alias="inserted")
+    skipped: int = Field(..., alias="skipped")
+    done: bool = Field(False, alias="done")
+    error: Optional[str] = Field(None, alias="error")
+
+    class Config:
+        populate_by_name = True
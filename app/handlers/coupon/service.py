@@ -1,19 +1,25 @@
 import hashlib
-from typing import Optional, List
+from typing import Optional, List, AsyncIterator
 import time
 from datetime import datetime, timedelta, UTC
 
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
 from app.handlers.auth.interfaces import AsyncRoleService
-from app.handlers.coupon.interfaces import AsyncCouponService
+from app.handlers.coupon.interfaces import AsyncCouponService, AsyncCouponRepository
 from app.handlers.coupon.UOW import SqlAlchemyUnitOfWork
-from app.handlers.coupon.schemas import CreateCoupon, OutCoupon, CreateCouponService, PaginateOutCoupon
+from app.handlers.coupon.schemas import CreateCoupon, OutCoupon, CreateCouponService, PaginateOutCoupon, \
+    BulkIssueCoupon, BulkIssueProgress
 from fastapi import HTTPException, status
+from redis.exceptions import RedisError
 from sqlalchemy.exc import IntegrityError
 from app.core.abs.unit_of_work import IUnitOfWorkWallet, IUnitOfWorkCoupon
 from app.handlers.session.dependencies import SessionServiceDep
 from app.handlers.session.schemas import CheckSessionAccessToken
+from app.main import logger
+from app.method.cooldown import acquire_cooldown, set_cooldown, release_cooldown
 from app.method.decorator import transactional
-from app.method.generator_promo import PromoGenerator
+from app.method.generator_promo import PROMO_GENERATOR
 
 
 class SqlAlchemyCoupon(AsyncCouponService):
@@ -22,20 +28,69 @@ class SqlAlchemyCoupon(AsyncCouponService):
         self.session_service = session_service
         self.role_service = role_service
 
+    async def _generate_unique(self, n: int, max_rounds: int = 5,
+                               repo: Optional[AsyncCouponRepository] = None) -> List[dict]:
+        """
+        Генерирует n купонов с кодами, которых нет ни в пачке, ни среди активных купонов в БД.
+        На каждый раунд — один запрос IN (...) по всей пачке, коллизии догенерируются.
+        """
+        repo = repo or self.uow.coupon_repo
+        result: List[dict] = []
+        seen: set[str] = set()
+        for _ in range(max_rounds):
+            batch = [c for c in PROMO_GENERATOR.generate_batch(n - len(result)) if c["code"] not in seen]
+            taken = await repo.get_existing_codes([c["code"] for c in batch])
+            for c in batch:
+                if c["code"] in taken or c["code"] in seen:
+                    continue
+                seen.add(c["code"])
+                result.append(c)
+            if len(result) >= n:
+                return result
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Не удалось сгенерировать уникальные коды купонов"
+        )
+
+    async def _check_coupon_cooldown(self, user_id: int) -> Optional[datetime]:
+        """
+        Недельный лимит: одна команда Redis на запрос. БД читается, только когда cooldown
+        свободен (то есть перед реальной выдачей) — чтобы пережить очистку Redis.
+        При недоступном Redis проверка целиком уходит в БД.
+        """
+        seconds = settings.COUPON_COOLDOWN_SECONDS
+        try:
+            started = await acquire_cooldown("coupon", user_id, seconds)
+        except RedisError as e:
+            logger.warning("Redis недоступен, лимит купонов проверяется по БД: %s", e)
+            started = None
+            redis_ok = False
+        else:
+            redis_ok = True
+        if started is not None:
+            return started
+
+        last = await self.uow.coupon_repo.get_last_created_at(user_id)
+        if last and last > (datetime.now(UTC) - timedelta(seconds=seconds)):
+            if redis_ok:
+                await set_cooldown("coupon", user_id, last, seconds)
+            return last
+        return None
+
     async def create_coupon(self, coupon_data: CreateCouponService, check_data: CheckSessionAccessToken) -> Optional[
                                                                                                                 OutCoupon] | datetime:
+        cooldown_taken = False
         try:
             async with self.uow:
 
                 await self.session_service.validate_access_token_session(check_data)
 
-                valid = await self.uow.coupon_repo.get_by_user_id(user_id=coupon_data.user_id)
-
-                if valid and valid[0].created_at > (datetime.now(UTC) - timedelta(weeks=1)):
-                    return valid[0].created_at
+                limited = await self._check_coupon_cooldown(coupon_data.user_id)
+                if limited is not None:
+                    return limited
+                cooldown_taken = True
 
-                gen = PromoGenerator()
-                res = await gen.generate()
+                res = (await self._generate_unique(1))[0]
 
                 is_fixed = res['type'] == "fixed"
 
@@ -56,17 +111,32 @@ class SqlAlchemyCoupon(AsyncCouponService):
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail=f"Данные не прошли создания"
                     )
+
+                await self.uow.commit()
+                cooldown_taken = False
                 return result
         except HTTPException:
+            await self._release_coupon_cooldown(coupon_data.user_id, cooldown_taken)
             # просто пробрасываем дальше, чтобы не превращать в 500
             raise
         except Exception as e:
+            await self._release_coupon_cooldown(coupon_data.user_id, cooldown_taken)
             # Откатываем транзакцию при любой другой ошибке
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Внутренняя ошибка сервера: {str(e)}"
             )
 
+    @staticmethod
+    async def _release_coupon_cooldown(user_id: int, taken: bool) -> None:
+        # купон не выдан — не сжигаем пользователю неделю
+        if not taken:
+            return
+        try:
+            await release_cooldown("coupon", user_id)
+        except RedisError:
+            pass
+
     async def used_coupon(self, token: str, check_data: CheckSessionAccessToken) -> Optional[OutCoupon]:
         try:
             async with self.uow:
@@ -204,3 +274,81 @@ class SqlAlchemyCoupon(AsyncCouponService):
 
         return result
 
+    async def bulk_issue(self, data: BulkIssueCoupon,
+                         check_data: CheckSessionAccessToken) -> AsyncIterator[BulkIssueProgress]:
+        """
+        Массовая выдача купонов. Права и сессия проверяются сразу (ошибки уходят обычным ответом),
+        сама выдача — генератор прогресса, который отдаётся потоком.
+        """
+        try:
+            async with self.uow:
+                await self.session_service.validate_access_token_session(check_data)
+                if not await self.role_service.is_admin(check_data.user_id):
+                    raise HTTPException(
+                        status_code=status.HTTP_403_FORBIDDEN,
+                        detail="нет прав"
+                    )
+                # неизвестный id оборвал бы поток на внешнем ключе после части выданных купонов
+                if data.user_ids:
+                    missing = await self.uow.coupon_repo.get_missing_user_ids(list(dict.fromkeys(data.user_ids)))
+                    if missing:
+                        raise HTTPException(
+                            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail={"message": "Пользователи не найдены", "userIds": missing[:100]}
+                        )
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Внутренняя ошибка сервера: {str(e)}"
+            )
+
+        # 8 колонок на строку, у asyncpg лимит 32767 параметров на запрос
+        chunk_size = min(data.chunk_size or settings.COUPON_BULK_CHUNK_SIZE, 4000)
+        return self._bulk_issue_stream(data, chunk_size)
+
+    async def _bulk_issue_stream(self, data: BulkIssueCoupon, chunk_size: int) -> AsyncIterator[BulkIssueProgress]:
+        # сессия запроса к началу стриминга уже закрыта — каждая пачка идёт в своей транзакции,
+        # поэтому при обрыве уже выданные купоны сохраняются, а прогресс честный
+        processed = inserted = 0
+        last_id = 0
+        explicit = list(dict.fromkeys(data.user_ids)) if data.user_ids is not None else None
+
+        try:
+            while True:
+                async with SqlAlchemyUnitOfWork(AsyncSessionLocal) as uow:
+                    if explicit is not None:
+                        user_ids = explicit[processed:processed + chunk_size]
+                    else:
+                        user_ids = await uow.coupon_repo.get_user_ids_after(last_id, chunk_size, data.role_id)
+                    if not user_ids:
+                        break
+
+                    codes = await self._generate_unique(len(user_ids), repo=uow.coupon_repo)
+                    now = datetime.now(UTC)
+                    rows = [
+                        {
+                            "user_id": user_id,
+                            "name": data.name,
+                            "description": str(code["value"]),
+                            "promo_count": code["type"] == "fixed",
+                            "status": True,
+                            "token_hash": code["code"],
+                            "is_active": True,
+                            "created_at": now,
+                        }
+                        for user_id, code in zip(user_ids, codes)
+                    ]
+                    inserted += await uow.coupon_repo.bulk_insert_coupons(rows)
+
+                processed += len(user_ids)
+                last_id = user_ids[-1]
+                yield BulkIssueProgress(processed=processed, inserted=inserted, skipped=processed - inserted)
+        except Exception as e:
+            # заголовки уже отправлены — сообщаем об ошибке последней строкой потока
+            yield BulkIssueProgress(processed=processed, inserted=inserted, skipped=processed - inserted,
+                                    done=True, error=f"Внутренняя ошибка сервера: {str(e)}")
+            return
+
+        yield BulkIssueProgress(processed=processed, inserted=inserted, skipped=processed - inserted, done=True)
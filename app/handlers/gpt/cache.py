@@ -0,0 +1,169 @@
+# app/handlers/gpt/cache.py
+"""
+Кэш ответов OpenAI по содержимому запроса.
+
+Ключ — sha256 нормализованных (model, prompt, image_url). В Redis хранится только
+status + тело ответа, с TTL; слишком большие ответы не кэшируются, число записей
+ограничено (старые вытесняются по индексу в ZSET).
+
+Single-flight: одинаковые запросы внутри процесса ждут один future, между воркерами —
+короткую блокировку в Redis; остальные дожидаются, пока ответ появится в кэше.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger("uvicorn")
+
+PREFIX = "gptcache"
+INDEX_KEY = f"{PREFIX}:index"
+
+# удаление блокировки только своим токеном
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_SPACES_RE = re.compile(r"[ \t]+")
+
+
+def cache_key(model: str, system_prompt: Optional[str], image_url: Optional[str]) -> str:
+    """Ключ не зависит от регистра модели, концов строк и повторных пробелов в промпте"""
+    prompt = (system_prompt or "").replace("\r\n", "\n").strip()
+    prompt = _SPACES_RE.sub(" ", prompt)
+    normalized = {
+        "model": (model or "").strip().lower(),
+        "prompt": prompt,
+        "image_url": (image_url or "").strip() or None,
+    }
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cacheable(result: Dict[str, Any]) -> bool:
+    return not result.get("error") and result.get("status") == 200
+
+
+class GPTResponseCache:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._release_script = None
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await get_redis().get(f"{PREFIX}:{key}")
+        return json.loads(raw) if raw else None
+
+    async def _set(self, key: str, result: Dict[str, Any]) -> None:
+        raw = json.dumps({"status": result["status"], "response": result["response"]}, ensure_ascii=False)
+        if len(raw.encode("utf-8")) > settings.GPT_CACHE_MAX_ENTRY_BYTES:
+            return
+        redis = get_redis()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(f"{PREFIX}:{key}", raw, ex=settings.GPT_CACHE_TTL_SECONDS)
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+            # записи старше TTL уже истекли сами, из индекса убираем их и лишние по лимиту
+            pipe.zremrangebyscore(INDEX_KEY, 0, time.time() - settings.GPT_CACHE_TTL_SECONDS)
+            pipe.zrange(INDEX_KEY, 0, -settings.GPT_CACHE_MAX_ENTRIES - 1)
+            pipe.zremrangebyrank(INDEX_KEY, 0, -settings.GPT_CACHE_MAX_ENTRIES - 1)
+            results = await pipe.execute()
+        evicted = results[3]
+        if evicted:
+            await redis.delete(*(f"{PREFIX}:{k}" for k in evicted))
+
+    async def _release_lock(self, lock_key: str, token: str) -> None:
+        if self._release_script is None:
+            self._release_script = get_redis().register_script(_RELEASE_LUA)
+        await self._release_script(keys=[lock_key], args=[token])
+
+    async def _compute_locked(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) \
+            -> Tuple[Dict[str, Any], str]:
+        redis = get_redis()
+        lock_key = f"{PREFIX}:lock:{key}"
+        token = uuid.uuid4().hex
+        locked = False
+        try:
+            locked = bool(await redis.set(lock_key, token, nx=True, px=int(settings.GPT_CACHE_LOCK_SECONDS * 1000)))
+            if not locked:
+                # тот же запрос уже выполняет другой воркер — ждём его ответ в кэше
+                deadline = time.monotonic() + settings.GPT_CACHE_LOCK_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.2)
+                    cached = await self._get(key)
+                    if cached:
+                        return cached, "coalesced"
+                    if not await redis.exists(lock_key):
+                        break
+        except RedisError as e:
+            logger.warning("Redis недоступен, кэш GPT пропущен: %s", e)
+            return await compute(), "bypass"
+
+        try:
+            result = await compute()
+            if _cacheable(result):
+                try:
+                    await self._set(key, result)
+                except RedisError as e:
+                    logger.warning("Не удалось сохранить ответ GPT в кэш: %s", e)
+            return result, "miss"
+        finally:
+            if locked:
+                try:
+                    await self._release_lock(lock_key, token)
+                except RedisError:
+                    pass  # истечёт по TTL
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) \
+            -> Tuple[Dict[str, Any], str]:
+        """
+        :return: (ответ, состояние кэша): hit — из кэша, coalesced — общий ответ с параллельным
+                 одинаковым запросом, miss — новый запрос к OpenAI, bypass — Redis недоступен
+        """
+        try:
+            cached = await self._get(key)
+        except RedisError as e:
+            logger.warning("Redis недоступен, кэш GPT пропущен: %s", e)
+            return await compute(), "bypass"
+        if cached:
+            return cached, "hit"
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # wait не пробрасывает отмену чужого запроса — только отмену текущего
+            await asyncio.wait([inflight])
+            if not inflight.cancelled():
+                result, _ = inflight.result()
+                return dict(result), "coalesced"
+            # запрос-владелец отменён клиентом — выполняем сами
+            return await self.get_or_compute(key, compute)
+
+        fut = asyncio.get_running_loop().create_future()
+        # исключение забирается здесь, чтобы не было предупреждения, если ждущих нет
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = fut
+        try:
+            result, state = await self._compute_locked(key, compute)
+            fut.set_result((result, state))
+            return result, state
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+GPT_CACHE = GPTResponseCache()
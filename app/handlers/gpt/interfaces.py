@@ -1,4 +1,4 @@
-from typing import Protocol, List, Optional, Dict, Any
+from typing import Protocol, List, Optional, Dict, Any, AsyncIterator
 from app.handlers.auth.schemas import (
     RoleUser,
     OutUser,
@@ -7,17 +7,27 @@ from app.handlers.auth.schemas import (
     AuthResponse, AuthResponseProvide, UserCreateProvide
 )
 from app.handlers.coupon.schemas import CreateCoupon, OutCoupon, CreateCouponService
-from app.handlers.gpt.schemas import OutGPTkey
+from app.handlers.gpt.schemas import OutGPTkey, OutGPTJob
 from app.handlers.session.schemas import CheckSessionAccessToken
 
 
 class AsyncGPTService(Protocol):
 
     async def create_gtp_promt(self, model: str, system_prompt: str, image_url: Optional[str],
-                               check_data: CheckSessionAccessToken) \
+                               check_data: CheckSessionAccessToken, use_cache: bool = True) \
             -> dict:
         ...
 
     async def get_property_key(self, oauth_client: str, check_data: CheckSessionAccessToken) \
             -> OutGPTkey:
         ...
+
+    async def submit_gpt_job(self, model: str, system_prompt: str, image_url: Optional[str],
+                             check_data: CheckSessionAccessToken, use_cache: bool = True) -> OutGPTJob:
+        ...
+
+    async def get_gpt_job(self, job_id: str, check_data: CheckSessionAccessToken) -> OutGPTJob:
+        ...
+
+    async def gpt_job_events(self, job_id: str, check_data: CheckSessionAccessToken) -> AsyncIterator[str]:
+        ...
@@ -0,0 +1,57 @@
+# app/handlers/gpt/jobs.py
+"""
+Учёт фоновых GPT задач в Redis: владелец задачи и число активных задач пользователя.
+Сами результаты хранит result backend celery.
+"""
+from typing import Optional
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+PREFIX = "gptjob"
+
+# celery state → статус для клиента
+JOB_STATUSES = {
+    "PENDING": "queued",
+    "RECEIVED": "queued",
+    "RETRY": "queued",
+    "STARTED": "running",
+    "SUCCESS": "done",
+    "FAILURE": "failed",
+    "REVOKED": "failed",
+}
+
+
+def _active_key(user_id: int) -> str:
+    return f"{PREFIX}:active:{user_id}"
+
+
+async def reserve_job_slot(user_id: int) -> bool:
+    """Увеличивает счётчик активных задач пользователя, если лимит не превышен"""
+    redis = get_redis()
+    key = _active_key(user_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.incr(key)
+        # счётчик не переживёт зависшие задачи дольше срока жизни задачи
+        pipe.expire(key, settings.GPT_JOB_TTL_SECONDS)
+        active, _ = await pipe.execute()
+    if active > settings.GPT_JOB_MAX_ACTIVE_PER_USER:
+        await redis.decr(key)
+        return False
+    return True
+
+
+async def release_job_slot(user_id: int) -> None:
+    redis = get_redis()
+    key = _active_key(user_id)
+    if await redis.decr(key) <= 0:
+        await redis.delete(key)
+
+
+async def remember_job(job_id: str, user_id: int) -> None:
+    await get_redis().set(f"{PREFIX}:owner:{job_id}", user_id, ex=settings.GPT_JOB_TTL_SECONDS)
+
+
+async def job_owner(job_id: str) -> Optional[int]:
+    owner = await get_redis().get(f"{PREFIX}:owner:{job_id}")
+    return int(owner) if owner else None
@@ -0,0 +1,141 @@
+# app/handlers/gpt/openai_client.py
+"""
+Запрос к OpenAI Responses API — общий для синхронного эндпоинта и celery задач (очередь gpt).
+Проверка доступа здесь не выполняется — её делает вызывающая сторона.
+"""
+import json
+from functools import lru_cache
+from typing import Optional, Dict, Any, Tuple
+
+from app.core.config import settings
+from app.core.metrics import track_outbound, observe_outbound_error
+from app.core.outbound import OPENAI_GATEWAY, get_http_session, openai_priority
+from app.handlers.gpt.cache import GPT_CACHE, cache_key
+
+# Прокси
+PROXY_URL = settings.proxy_url or None
+# Таймаут на весь запрос, секунды
+TIMEOUT_SECONDS = 120
+
+
+@lru_cache(maxsize=1)
+def _proxy_auth():
+    # aiohttp импортируется при первом запросе, а не при загрузке роутера
+    from aiohttp import BasicAuth
+    return BasicAuth(settings.proxy_username, settings.proxy_password) if settings.proxy_username else None
+
+
+def build_request(model: str, system_prompt: str, image_url: Optional[str]) \
+        -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    url = settings.OPENAI_API_URL
+
+    api_key = settings.CHATGPT_API
+
+    if not api_key:
+        raise RuntimeError("OPENAI API key not set (Settings.CHATGPT_API)")
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+
+    input_content = []
+
+    if system_prompt:
+        input_content.append({"type": "input_text", "text": system_prompt})
+
+    if image_url:
+        input_content.append({"type": "input_image", "image_url": image_url, "detail": "high"})
+
+    payload = {
+        "model": model,
+        "input": [
+            {
+                "role": "user",
+                "content": input_content
+            }
+        ],
+        "max_output_tokens": 4096
+    }
+    return url, headers, payload
+
+
+def request_info(url: str, headers: Dict[str, str], payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "request": {
+            "url": url,
+            "headers": {k: ("REDACTED" if k.lower() == "authorization" else v) for k, v in headers.items()},
+            "json": payload,
+        },
+        "proxy": PROXY_URL,
+        "proxy_auth": _proxy_auth(),
+    }
+
+
+async def request_openai(model: str, system_prompt: str, image_url: Optional[str],
+                         user_id: int, client_id: Optional[int]) -> Dict[str, Any]:
+    """
+    Один запрос к OpenAI через шлюз (app/core/outbound.py).
+    GatewayRejected пробрасывается — вызывающий решает, отдать 503 или повторить позже.
+    """
+    import aiohttp
+
+    url, headers, payload = build_request(model, system_prompt, image_url)
+
+    try:
+        # слот шлюза: ограничение параллельных запросов и очередь по приоритету клиента
+        async with OPENAI_GATEWAY.slot(user_id, openai_priority(client_id)):
+            # --- ВАЖНО: proxy передаётся именно здесь, напрямую в post ---
+            with track_outbound("openai", "responses"):
+                async with get_http_session().post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    proxy=PROXY_URL,
+                    proxy_auth=_proxy_auth(),
+                    timeout=aiohttp.ClientTimeout(total=TIMEOUT_SECONDS),
+                ) as resp:
+                    status = resp.status
+                    text = await resp.text()
+                    if status >= 400:
+                        observe_outbound_error("openai", "responses", f"http_{status}")
+                    try:
+                        body = json.loads(text)
+                    except ValueError:
+                        body = {"text": text}
+
+                    return {
+                        "status": status,
+                        "response": body,
+                        **request_info(url, headers, payload),
+                        "error": status >= 400
+                    }
+
+    except aiohttp.ClientError as e:
+        return {
+            "status": None,
+            "response": None,
+            "error": True,
+            "error_message": f"aiohttp.ClientError: {e}",
+            **request_info(url, headers, payload),
+        }
+
+
+async def complete_prompt(model: str, system_prompt: str, image_url: Optional[str],
+                          user_id: int, client_id: Optional[int], use_cache: bool = True) -> Dict[str, Any]:
+    """Запрос с учётом кэша ответов; поле cache: hit / coalesced / miss / bypass"""
+    async def _request() -> Dict[str, Any]:
+        return await request_openai(model, system_prompt, image_url, user_id, client_id)
+
+    if not (settings.GPT_CACHE_ENABLED and use_cache):
+        result = await _request()
+        result["cache"] = "bypass"
+        return result
+
+    result, cache_state = await GPT_CACHE.get_or_compute(cache_key(model, system_prompt, image_url), _request)
+    if "request" not in result:
+        # из Redis приходит только status + response, остальное собираем как для живого ответа
+        url, headers, payload = build_request(model, system_prompt, image_url)
+        result = {**result, **request_info(url, headers, payload), "error": False}
+    result["cache"] = cache_state
+    return result
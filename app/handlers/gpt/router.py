@@ -2,10 +2,11 @@
 from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Depends,  Request
+from fastapi.responses import StreamingResponse
 
 
 from app.handlers.gpt.dependencies import gptServiceDep
-from app.handlers.gpt.schemas import GPTCreate, OutGPTkey
+from app.handlers.gpt.schemas import GPTCreate, OutGPTkey, OutGPTJob
 from app.handlers.session.schemas import CheckSessionAccessToken
 from app.method.get_token import get_token
 
@@ -27,15 +28,18 @@ async def create_gtp_prompt(
         request: Request,
         gpt_service: gptServiceDep,
         image_url: Optional[str] = None,
+        use_cache: bool = True,
         access_token: str = Depends(get_token)
 ):
     """
     Создание gpt-промпта, принимает данные для генерации и id пользователя, собирает ip и user-agent,
-    формирует данные проверки сессии, передаёт их в сервис gpt и возвращает результат операции
+    формирует данные проверки сессии, передаёт их в сервис gpt и возвращает результат операции.
+    Поле cache в ответе: hit / coalesced / miss / bypass (use_cache=false — всегда свежий ответ)
     :param data:
     :param request:
     :param gpt_service:
     :param image_url:
+    :param use_cache:
     :param access_token:
     :return:
     """
@@ -51,7 +55,7 @@ async def create_gtp_prompt(
     )
 
     return await gpt_service.create_gtp_promt(model=data.model, system_prompt=data.system_prompt, image_url=image_url,
-                                              check_data=csat)
+                                              check_data=csat, use_cache=use_cache)
 
 
 @router.get("/get_property_key", response_model=OutGPTkey)
@@ -84,3 +88,101 @@ async def create_gtp_prompt(
     )
 
     return await gpt_service.get_property_key(oauth_client=oauth_client, check_data=csat)
+
+
+@router.post("/jobs", response_model=OutGPTJob, status_code=202)
+async def submit_gpt_job(
+        data: GPTCreate,
+        request: Request,
+        gpt_service: gptServiceDep,
+        image_url: Optional[str] = None,
+        use_cache: bool = True,
+        access_token: str = Depends(get_token)
+):
+    """
+    Фоновый gpt-запрос: ставит задачу в очередь gpt и сразу возвращает её id.
+    Результат — через GET /gpt/jobs/{job_id} или поток событий /gpt/jobs/{job_id}/events
+    :param data:
+    :param request:
+    :param gpt_service:
+    :param image_url:
+    :param use_cache:
+    :param access_token:
+    :return:
+    """
+    # Получаем IP и User-Agent из запроса
+    ip = request.client.host
+    user_agent = request.headers.get("user-agent", "")
+
+    csat = CheckSessionAccessToken(
+        user_id=data.user_id,
+        ip_address=ip,
+        user_agent=user_agent,
+        access_token=access_token
+    )
+
+    return await gpt_service.submit_gpt_job(model=data.model, system_prompt=data.system_prompt, image_url=image_url,
+                                            check_data=csat, use_cache=use_cache)
+
+
+@router.get("/jobs/{job_id}", response_model=OutGPTJob, response_model_exclude_none=True)
+async def get_gpt_job(
+        job_id: str,
+        user_id: int,
+        request: Request,
+        gpt_service: gptServiceDep,
+        access_token: str = Depends(get_token)
+):
+    """
+    Статус фоновой gpt-задачи (queued / running / done / failed) и результат, если готов
+    :param job_id:
+    :param user_id:
+    :param request:
+    :param gpt_service:
+    :param access_token:
+    :return:
+    """
+    # Получаем IP и User-Agent из запроса
+    ip = request.client.host
+    user_agent = request.headers.get("user-agent", "")
+
+    csat = CheckSessionAccessToken(
+        user_id=user_id,
+        ip_address=ip,
+        user_agent=user_agent,
+        access_token=access_token
+    )
+
+    return await gpt_service.get_gpt_job(job_id=job_id, check_data=csat)
+
+
+@router.get("/jobs/{job_id}/events")
+async def gpt_job_events(
+        job_id: str,
+        user_id: int,
+        request: Request,
+        gpt_service: gptServiceDep,
+        access_token: str = Depends(get_token)
+):
+    """
+    Server-Sent Events по фоновой gpt-задаче: status при смене статуса, затем result или error
+    :param job_id:
+    :param user_id:
+    :param request:
+    :param gpt_service:
+    :param access_token:
+    :return:
+    """
+    # Получаем IP и User-Agent из запроса
+    ip = request.client.host
+    user_agent = request.headers.get("user-agent", "")
+
+    csat = CheckSessionAccessToken(
+        user_id=user_id,
+        ip_address=ip,
+        user_agent=user_agent,
+        access_token=access_token
+    )
+
+    events = await gpt_service.gpt_job_events(job_id=job_id, check_data=csat)
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, EmailStr, Field
 
 from app.handlers.providers.schemas import ProviderOut, ProviderLoginRequest
@@ -25,3 +25,12 @@ class OutGPTkey(BaseModel):
     class Config:
         validate_by_name = True
 
+
+class OutGPTJob(BaseModel):
+    job_id: str = Field(..., alias="jobId")
+    status: str = Field(..., alias="status")  # queued / running / done / failed
+    result: Optional[Dict[str, Any]] = Field(None, alias="result")
+    error: Optional[str] = Field(None, alias="error")
+
+    class Config:
+        validate_by_name = True
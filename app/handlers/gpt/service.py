@@ -1,15 +1,22 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator
+import asyncio
 import json
-import aiohttp
-from aiohttp import BasicAuth, ClientTimeout
+import time
+import uuid
+from celery.result import AsyncResult
+from redis.exceptions import RedisError
 from app.core.config import settings
+from app.core.outbound import GatewayRejected
 from app.handlers.auth.interfaces import AsyncRoleService
-from app.handlers.gpt.schemas import OutGPTkey
+from app.handlers.gpt.jobs import JOB_STATUSES, reserve_job_slot, release_job_slot, remember_job, job_owner
+from app.handlers.gpt.openai_client import complete_prompt
+from app.handlers.gpt.schemas import OutGPTkey, OutGPTJob
 from app.handlers.session.dependencies import SessionServiceDep, OauthClientServiceDep
 from app.handlers.session.schemas import CheckSessionAccessToken
 from app.handlers.gpt.interfaces import AsyncGPTService
 from app.method.aes import encrypt
 from fastapi import HTTPException, status
+from task_celery.celery_config import celery
 
 
 class SqlAlchemyGPT(AsyncGPTService):
@@ -18,100 +25,29 @@ class SqlAlchemyGPT(AsyncGPTService):
         self.session_service = session_service
         self.oauth_client_service = oauth_client_service
 
-        # Прокси и аутентификация
-        self.proxy_url = settings.proxy_url
-        self.proxy_auth = BasicAuth(settings.proxy_username, settings.proxy_password) \
-            if settings.proxy_username else None
-        # Таймаут на весь запрос
-        self.timeout = ClientTimeout(total=120)
-
     async def create_gtp_promt(
         self,
         model: str,
         system_prompt: str,
         image_url: Optional[str],
-        check_data: CheckSessionAccessToken
+        check_data: CheckSessionAccessToken,
+        use_cache: bool = True,
     ) -> Dict[str, Any]:
 
         # 1) Проверки доступа
         #await self.role_service.is_admin(check_data.user_id)
-        await self.session_service.validate_access_token_session(check_data)
-        # 2) Данные для запроса OpenAI
-        url = "https://api.openai.com/v1/responses"
-
-        api_key = settings.CHATGPT_API
-
-        if not api_key:
-            raise RuntimeError("OPENAI API key not set (Settings.CHATGPT_API)")
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-
-        input_content = []
-
-        if system_prompt:
-            input_content.append({"type": "input_text", "text": system_prompt})
-
-        if image_url:
-            input_content.append({"type": "input_image", "image_url": image_url, "detail": "high"})
-
-        payload = {
-            "model": model,
-            "input": [
-                {
-                    "role": "user",
-                    "content": input_content
-                }
-            ],
-            "max_output_tokens": 4096
-        }
+        session = await self.session_service.validate_access_token_session(check_data)
 
         try:
-            # --- ВАЖНО: proxy передаётся именно здесь, напрямую в post ---
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.post(
-                    url,
-                    headers=headers,
-                    json=payload,
-                    proxy=self.proxy_url,
-                    proxy_auth=self.proxy_auth
-                ) as resp:
-                    status = resp.status
-                    text = await resp.text()
-                    try:
-                        body = json.loads(text)
-                    except ValueError:
-                        body = {"text": text}
-
-                    return {
-                        "status": status,
-                        "response": body,
-                        "request": {
-                            "url": url,
-                            "headers": {k: ("REDACTED" if k.lower() == "authorization" else v) for k, v in headers.items()},
-                            "json": payload,
-                        },
-                        "proxy": self.proxy_url,
-                        "proxy_auth": self.proxy_auth,
-                        "error": status >= 400
-                    }
-
-        except aiohttp.ClientError as e:
-            return {
-                "status": None,
-                "response": None,
-                "error": True,
-                "error_message": f"aiohttp.ClientError: {e}",
-                "request": {
-                    "url": url,
-                    "headers": {k: ("REDACTED" if k.lower() == "authorization" else v) for k, v in headers.items()},
-                    "json": payload,
-                },
-                "proxy": self.proxy_url,
-                "proxy_auth": self.proxy_auth,
-            }
+            return await complete_prompt(model, system_prompt, image_url, check_data.user_id, session.client_id,
+                                         use_cache)
+
+        except GatewayRejected as e:
+            raise HTTPException(
+                status_code=503,
+                detail="Сервис перегружен, повторите позже",
+                headers={"Retry-After": str(e.retry_after)},
+            )
 
         except Exception as e:
             return {
@@ -121,6 +57,106 @@ class SqlAlchemyGPT(AsyncGPTService):
                 "error_message": f"Unexpected error: {e}",
             }
 
+    async def submit_gpt_job(self, model: str, system_prompt: str, image_url: Optional[str],
+                             check_data: CheckSessionAccessToken, use_cache: bool = True) -> OutGPTJob:
+        """Ставит запрос в очередь celery gpt и сразу возвращает id задачи"""
+        session = await self.session_service.validate_access_token_session(check_data)
+
+        try:
+            reserved = await reserve_job_slot(check_data.user_id)
+        except RedisError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Очередь задач недоступна"
+            )
+        if not reserved:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Не более {settings.GPT_JOB_MAX_ACTIVE_PER_USER} активных задач на пользователя"
+            )
+
+        job_id = uuid.uuid4().hex
+        try:
+            await remember_job(job_id, check_data.user_id)
+            # публикация в брокер синхронная — не держим на ней event loop
+            await asyncio.to_thread(
+                celery.send_task,
+                "tasks.run_gpt_prompt",
+                kwargs={
+                    "model": model,
+                    "system_prompt": system_prompt,
+                    "image_url": image_url,
+                    "user_id": check_data.user_id,
+                    "client_id": session.client_id,
+                    "use_cache": use_cache,
+                },
+                task_id=job_id,
+                queue="gpt",
+            )
+        except Exception as e:
+            try:
+                await release_job_slot(check_data.user_id)
+            except RedisError:
+                pass
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Внутренняя ошибка сервера: {str(e)}"
+            )
+
+        return OutGPTJob(job_id=job_id, status="queued")
+
+    async def _job_state(self, job_id: str) -> OutGPTJob:
+        res = AsyncResult(job_id, app=celery)
+        # обращения к result backend синхронные
+        state = await asyncio.to_thread(lambda: res.state)
+        job_status = JOB_STATUSES.get(state, "queued")
+        if job_status == "done":
+            return OutGPTJob(job_id=job_id, status=job_status, result=await asyncio.to_thread(lambda: res.result))
+        if job_status == "failed":
+            return OutGPTJob(job_id=job_id, status=job_status, error=str(await asyncio.to_thread(lambda: res.result)))
+        return OutGPTJob(job_id=job_id, status=job_status)
+
+    async def _check_job_owner(self, job_id: str, check_data: CheckSessionAccessToken) -> None:
+        await self.session_service.validate_access_token_session(check_data)
+        try:
+            owner = await job_owner(job_id)
+        except RedisError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Очередь задач недоступна"
+            )
+        if owner != check_data.user_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Задача не найдена"
+            )
+
+    async def get_gpt_job(self, job_id: str, check_data: CheckSessionAccessToken) -> OutGPTJob:
+        await self._check_job_owner(job_id, check_data)
+        return await self._job_state(job_id)
+
+    async def gpt_job_events(self, job_id: str, check_data: CheckSessionAccessToken) -> AsyncIterator[str]:
+        """
+        Проверка доступа выполняется сразу, дальше — генератор SSE: событие status при
+        каждой смене статуса и завершающее событие result/error
+        """
+        await self._check_job_owner(job_id, check_data)
+        return self._job_events_stream(job_id)
+
+    async def _job_events_stream(self, job_id: str) -> AsyncIterator[str]:
+        last_status = None
+        deadline = time.monotonic() + settings.GPT_JOB_TTL_SECONDS
+        while time.monotonic() < deadline:
+            job = await self._job_state(job_id)
+            if job.status != last_status:
+                last_status = job.status
+                yield f"event: status\ndata: {json.dumps({'status': job.status})}\n\n"
+            if job.status in ("done", "failed"):
+                event = "result" if job.status == "done" else "error"
+                yield f"event: {event}\ndata: {job.model_dump_json(by_alias=True, exclude_none=True)}\n\n"
+                return
+            await asyncio.sleep(settings.GPT_JOB_POLL_INTERVAL)
+
     async def get_property_key(self, oauth_client: str, check_data: CheckSessionAccessToken) \
             -> OutGPTkey:
         try:
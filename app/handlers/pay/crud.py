@@ -4,11 +4,12 @@ from typing import Optional, List
 from zoneinfo import ZoneInfo
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func
+from sqlalchemy import select, update, func, literal, text, Numeric, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from app.handlers.pay.interfaces import AsyncSubtractionRepository, AsyncPaymentRepository
 from app.handlers.pay.schemas import OutWallets, CreatePaymentsService, CreatePaymentsOut, UpdatePayments, PaymentsOut, \
     CreateWallets, UpdateWalletsService, UpdateWallets, CreatePayments
-from app.models import Wallet, Payments, Subtraction
+from app.models import Wallet, WalletEntry, Payments, PaymentIdempotency, Subtraction
 from task_celery.pay_task.schemas import SubtractionBase, SubtractionUpdate, SubtractionRead, SubtractionList, \
     SubtractionCreate
 
@@ -20,7 +21,7 @@ class WalletRepository(AsyncSubtractionRepository):
         self.db = db
 
     @staticmethod
-    def _to_dto(m: "Wallet") -> OutWallets:
+    def _to_dto(m: "Wallet", balance: Optional[Decimal] = None) -> OutWallets:
         if m is None:
             raise TypeError("_to_dto получил None")
         if isinstance(m, type):
@@ -28,10 +29,24 @@ class WalletRepository(AsyncSubtractionRepository):
         return OutWallets(
             id=m.id,
             user_id=m.user_id,
-            balance=m.balance,
+            balance=m.balance if balance is None else balance,
             updated_at=m.updated_at,
         )
 
+    @staticmethod
+    def _with_balance():
+        # снимок + несвёрнутые записи журнала (частичный индекс ix_wallet_entries_pending)
+        pending = (
+            select(func.coalesce(func.sum(WalletEntry.amount), 0))
+            .where(
+                (WalletEntry.wallet_id == Wallet.id) &
+                (WalletEntry.compacted.is_(False))
+            )
+            .correlate(Wallet)
+            .scalar_subquery()
+        )
+        return select(Wallet, (Wallet.balance + pending).label("current_balance"))
+
     async def create_wallet_user(self, create_data: CreateWallets) -> OutWallets:
         m = Wallet()
         m.user_id = create_data.user_id
@@ -40,35 +55,82 @@ class WalletRepository(AsyncSubtractionRepository):
         return self._to_dto(m)
 
     async def update_wallets_user(self, update_data: UpdateWallets) -> OutWallets:
-        stmt = (
-            update(Wallet)
-            .where(
-                Wallet.id == update_data.id,
+        """
+        Изменение баланса — запись в wallet_entries, строка wallets не блокируется.
+        Запись с уже использованным (wallet_id, idempotency_key) не добавляется; в обоих случаях
+        возвращается кошелёк с текущим балансом и applied (добавлена ли запись), None — если кошелька нет.
+        """
+        source = (
+            select(
+                Wallet.id,
+                literal(update_data.amount, Numeric(12, 2)),
+                literal(update_data.reason, String(32)),
+                literal(update_data.idempotency_key, String(128)),
             )
-            .values(
-                balance=Wallet.balance + update_data.amount,
-                updated_at=func.now()
-            )
-            .returning(Wallet)
+            .where(Wallet.id == update_data.id)
         )
-        result = await self.db.execute(stmt)
-        result = result.scalar_one_or_none()
-
-        return self._to_dto(result) if result else None
+        stmt = (
+            pg_insert(WalletEntry)
+            .from_select(["wallet_id", "amount", "reason", "idempotency_key"], source)
+            .on_conflict_do_nothing(index_elements=["wallet_id", "idempotency_key"])
+            .returning(WalletEntry.id)
+        )
+        inserted = (await self.db.execute(stmt)).scalar_one_or_none()
+
+        wallet = await self.get_wallet_by_id(update_data.id)
+        if wallet is not None:
+            wallet.applied = inserted is not None
+        return wallet
+
+    async def compact_entries(self, batch_size: int) -> int:
+        """
+        Сворачивает до batch_size несвёрнутых записей в wallets.balance одним запросом.
+        Незакоммиченные записи не видны и останутся на следующий проход, поэтому
+        баланс не теряет и не задваивает суммы. Возвращает число свёрнутых записей.
+        """
+        result = await self.db.execute(
+            text(
+                """
+                WITH picked AS (
+                    SELECT id FROM wallet_entries
+                    WHERE NOT compacted
+                    ORDER BY id
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                ), moved AS (
+                    UPDATE wallet_entries e SET compacted = true
+                    FROM picked WHERE e.id = picked.id
+                    RETURNING e.wallet_id, e.amount
+                ), totals AS (
+                    SELECT wallet_id, sum(amount) AS amount, count(*) AS entries
+                    FROM moved GROUP BY wallet_id
+                ), applied AS (
+                    UPDATE wallets w SET balance = w.balance + t.amount, updated_at = now()
+                    FROM totals t WHERE w.id = t.wallet_id
+                    RETURNING t.entries
+                )
+                SELECT coalesce(sum(entries), 0) FROM applied
+                """
+            ),
+            {"batch_size": batch_size},
+        )
+        return int(result.scalar_one())
 
     async def get_wallet_by_id(self, id: int) -> Optional[OutWallets]:
-        result = await self.db.get(Wallet, id)
-        return self._to_dto(result) if result else None
+        q = self._with_balance().where(Wallet.id == id)
+        result = await self.db.execute(q)
+        row = result.first()
+        return self._to_dto(row[0], row[1]) if row else None
 
     async def get_wallet_by_user_id(self, user_id: int) -> Optional[OutWallets]:
         q = (
-            select(Wallet)
+            self._with_balance()
             .where(Wallet.user_id == user_id)
             .limit(1)
         )
         result = await self.db.execute(q)
-        result = result.scalars().first()
-        return self._to_dto(result) if result else None
+        row = result.first()
+        return self._to_dto(row[0], row[1]) if row else None
 
 
 class PaymentRepository(AsyncPaymentRepository):
@@ -115,6 +177,16 @@ class PaymentRepository(AsyncPaymentRepository):
         self.db.add(m)
         await self.db.flush()
 
+        if m.idempotency_key:
+            # занятый ключ -> IntegrityError (unique_violation), транзакция платежа откатывается
+            await self.db.execute(
+                pg_insert(PaymentIdempotency).values(
+                    idempotency_key=m.idempotency_key,
+                    payment_id=m.id,
+                    payment_created_at=m.created_at,
+                )
+            )
+
         return CreatePaymentsOut(
             id=str(m.id),
             user_id=m.user_id,
@@ -148,6 +220,49 @@ class PaymentRepository(AsyncPaymentRepository):
 
         return self._to_dto(result)
 
+    async def update_payments_if_init(self, update_data: UpdatePayments) -> Optional[PaymentsOut]:
+        """
+        Применяет ответ провайдера только к платежу в статусе INIT.
+        Если вебхук или восстановление успели раньше — строка не меняется, возвращается None.
+        """
+        values = {"status": update_data.status}
+
+        if update_data.payment_id is not None:
+            values["yookassa_payment_id"] = update_data.payment_id
+
+        if update_data.confirmation_type and update_data.confirmation_url:
+            values["confirmation_url"] = update_data.confirmation_url
+            values["confirmation_type"] = update_data.confirmation_type
+
+        stmt = (
+            update(Payments)
+            .where(
+                (Payments.id == update_data.id) &
+                (Payments.status == "INIT")
+            )
+            .values(**values)
+            .returning(Payments)
+        )
+
+        result = await self.db.execute(stmt)
+        result = result.scalar_one_or_none()
+
+        return self._to_dto(result) if result else None
+
+    async def get_stale_init_payments(self, created_before: datetime, limit: int = 100) -> List[PaymentsOut]:
+        q = (
+            select(Payments)
+            .where(
+                (Payments.status == "INIT") &
+                (Payments.created_at < created_before)
+            )
+            .order_by(Payments.created_at)
+            .limit(limit)
+        )
+        result = await self.db.execute(q)
+        result = result.scalars().all()
+        return [self._to_dto(r) for r in result]
+
     async def get_payments_by_user_id(self, user_id: int) -> Optional[List[PaymentsOut]]:
 
         q = (
@@ -171,6 +286,7 @@ class PaymentRepository(AsyncPaymentRepository):
                 (Payments.status != "canceled")
             )
             .order_by(Payments.created_at.desc())
+            .limit(1)
         )
         result = await self.db.execute(q)
         result = result.scalars().first()
@@ -178,7 +294,10 @@ class PaymentRepository(AsyncPaymentRepository):
         return self._to_dto(result) if result else None
 
     async def get_payments_by_id(self, payments_id: str) -> Optional[PaymentsOut]:
-        result = await self.db.get(Payments, payments_id)
+        # db.get не подходит: первичный ключ составной (id, created_at) из-за партиций
+        q = select(Payments).where(Payments.id == payments_id)
+        result = await self.db.execute(q)
+        result = result.scalar_one_or_none()
         return result if result else None
 
     async def get_payments_by_idempotency_id(self, idempotency_id: str) -> Optional[PaymentsOut]:
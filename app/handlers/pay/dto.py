@@ -0,0 +1,15 @@
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any
+
+
+@dataclass
+class WebhookEvent:
+    """Нормализованное уведомление YooKassa (см. parse_webhook_payload)"""
+    payment_obj: Dict[str, Any] = field(default_factory=dict)
+    idempotence_key: Optional[str] = None
+    ext_payment_id: Optional[str] = None
+    raw_status: str = ""
+    status: Optional[str] = None
+    raw_amount: Optional[Any] = None
+    confirmation_url: Optional[str] = None
+    confirmation_type: Optional[str] = None
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Protocol, List, Optional, Dict, Any
 
 from app.handlers.pay.schemas import CreatePaymentsOut, PaymentsOut, CreatePaymentsService, UpdatePayments, \
@@ -53,6 +54,9 @@ class AsyncWalletRepository(Protocol):
     async def get_wallet_by_user_id(self, user_id: int) -> Optional[OutWallets]:
         ...
 
+    async def compact_entries(self, batch_size: int) -> int:
+        ...
+
 
 class AsyncPaymentRepository(Protocol):
 
@@ -74,6 +78,12 @@ class AsyncPaymentRepository(Protocol):
     async def get_payments_by_user_id_last(self, user_id: int) -> Optional[PaymentsOut]:
         ...
 
+    async def update_payments_if_init(self, update_data: UpdatePayments) -> Optional[PaymentsOut]:
+        ...
+
+    async def get_stale_init_payments(self, created_before: datetime, limit: int = 100) -> List[PaymentsOut]:
+        ...
+
 
 class AsyncWalletService(Protocol):
     async def create_wallet_or_get_wallet(self, check_data: CheckSessionAccessToken) -> OutWallets:
@@ -96,6 +106,9 @@ class AsyncWalletService(Protocol):
     async def update_wallets_user_internal(self, update_data: UpdateWalletsService) -> OutWallets:
         ...
 
+    async def compact_ledger(self) -> int:
+        ...
+
 
 class AsyncPaymentService(Protocol):
 
@@ -125,6 +138,9 @@ class AsyncPaymentService(Protocol):
     async def webhook_pay(self):
         ...
 
+    async def recover_init_payments(self) -> Dict[str, int]:
+        ...
+
 
 class AsyncApiPaymentService(Protocol):
 
@@ -134,7 +150,7 @@ class AsyncApiPaymentService(Protocol):
     async def get_payments_by_idemp(self, idemp: str) -> Optional[Any]:
         ...
 
-    async def get_payments(self, created_at) -> List[Dict[str, Any]]:
+    async def get_payments(self, created_at, raise_errors: bool = False) -> List[Dict[str, Any]]:
         ...
 
     async def create_payment(
@@ -22,6 +22,7 @@ from app.handlers.pay.schemas import (
     UpdateWalletsService,
     OutWallets,
 )
+from app.handlers.pay.service import wallet_entry_client_key
 from app.handlers.session.schemas import CheckSessionAccessToken
 from app.main import logger
 from app.method.get_token import get_token
@@ -96,6 +97,7 @@ async def create_payment(
         capture=capture,
         email=email,
         metadata_payments=metadata_payments,
+        idempotency_key=request.headers.get("idempotency-key"),
     )
 
     return await payment_service.create_payments(create_data=create_data, check_data=csat)
@@ -157,6 +159,7 @@ async def create_payment_single(
         capture=capture,
         email=email,
         metadata_payments=metadata_payments,
+        idempotency_key=request.headers.get("idempotency-key"),
     )
 
     return await payment_service.create_payments_single(create_data=create_data, check_data=csat)
@@ -351,6 +354,12 @@ async def update_wallet(
         access_token=access_token,
     )
 
+    if update_data.idempotency_key is None:
+        update_data.idempotency_key = request.headers.get("idempotency-key")
+    if update_data.idempotency_key is not None:
+        # хэш фиксированной длины: ключ до 255 символов помещается в wallet_entries.idempotency_key
+        update_data.idempotency_key = wallet_entry_client_key(update_data.idempotency_key)
+
     return await wallet_service.update_wallets_user(update_data=update_data, check_data=csat)
 
 
@@ -370,6 +379,12 @@ async def update_wallet(
 
     await auth_service.login_via_bots(log_in_user, ip, user_agent=user_agent)
 
+    if update_data.idempotency_key is None:
+        update_data.idempotency_key = request.headers.get("idempotency-key")
+    if update_data.idempotency_key is not None:
+        # хэш фиксированной длины: ключ до 255 символов помещается в wallet_entries.idempotency_key
+        update_data.idempotency_key = wallet_entry_client_key(update_data.idempotency_key)
+
     return await wallet_service.update_wallets_user_internal(update_data)
 
 
@@ -17,6 +17,10 @@ class CreateWallets(BaseModel):
 class UpdateWallets(BaseModel):
     id: int = Field(..., alias="Id")
     amount: Decimal = Field(..., alias="Amount")
+    reason: Optional[str] = Field(None, alias="Reason")
+    # ключ записи журнала: повтор с тем же ключом не меняет баланс; длина — как у wallet_entries,
+    # ключи клиента приходят сюда уже как client:<sha256> (71 символ)
+    idempotency_key: Optional[str] = Field(None, alias="IdempotencyKey", max_length=128)
 
     class Config:
         validate_by_name = True
@@ -26,6 +30,7 @@ class UpdateWalletsService(BaseModel):
     id: int = Field(..., alias="Id")
     amount: Decimal = Field(..., alias="Amount")
     reason: Optional[str] = Field(None, alias="Reason")
+    idempotency_key: Optional[str] = Field(None, alias="IdempotencyKey")
 
     class Config:
         validate_by_name = True
@@ -38,6 +43,8 @@ class OutWallets(BaseModel):
     user_id: int = Field(..., alias="UserId")
     balance: Decimal = Field(..., alias="Balance")
     updated_at: datetime = Field(..., alias="UpdatedAt")
+    # изменение баланса: True — запись добавлена, False — повтор с уже использованным ключом
+    applied: Optional[bool] = Field(None, alias="Applied")
 
     class Config:
         validate_by_name = True
@@ -58,6 +65,8 @@ class CreatePaymentsService(BaseModel):
     capture: bool = Field(..., alias="Capture")
     email: Optional[EmailStr] = Field(None)
     metadata_payments: Optional[dict] = Field(None, alias="MetadataPayments")
+    # заголовок Idempotency-Key клиента
+    idempotency_key: Optional[str] = Field(None, alias="IdempotencyKey")
 
     class Config:
         validate_by_name = True
@@ -6,20 +6,17 @@ import uuid
 from datetime import time
 import datetime as dt
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
-import aiohttp
-from yookassa import Payment, Webhook
 from typing import Optional, List, Dict, Any
-import yookassa
 from fastapi import HTTPException, status
 from sqlalchemy.exc import IntegrityError
 import ipaddress
-from yookassa.domain.common.user_agent import Version
-from yookassa import Configuration
 
 from app.core.abs.unit_of_work import IUnitOfWorkWallet, IUnitOfWorkPayment
 from app.core.config import settings, logger
+from app.core.metrics import track_outbound
 from app.handlers.auth.interfaces import AsyncAuthService
 from app.handlers.pay.crud import PaymentRepository
+from app.handlers.pay.dto import WebhookEvent
 from app.handlers.pay.interfaces import AsyncPaymentService, AsyncWalletService, AsyncApiPaymentService
 from app.handlers.pay.schemas import CreatePaymentsService, UpdatePayments, CreatePaymentsOut, PaymentsOut, \
     CreateWallets, \
@@ -29,6 +26,129 @@ from app.handlers.session.schemas import CheckSessionAccessToken
 from app.method.decorator import transactional
 
 
+def yookassa_sdk():
+    """
+    SDK YooKassa импортируется при первом обращении к API, а не при старте приложения:
+    он тянет requests и собственные модели и заметно удлиняет холодный старт.
+    """
+    import yookassa
+    return yookassa
+
+
+def provider_rejection(error: Exception) -> Optional[Dict[str, Any]]:
+    """
+    Окончательный отказ API YooKassa (4xx, кроме 429) в виде ответа API {"type": "error", ...};
+    None — ошибка транспорта, 5xx, 429 или ответ «ещё обрабатывается»: исход запроса неизвестен.
+    """
+    from yookassa.domain.exceptions import ApiError
+
+    code = getattr(error, "HTTP_CODE", 0)
+    if not isinstance(error, ApiError) or not 400 <= code < 500 or code == 429:
+        return None
+    # SDK передаёт в исключение тело ответа API
+    content = error.args[0] if error.args and isinstance(error.args[0], dict) else {}
+    return {
+        "type": "error",
+        "id": content.get("id"),
+        "code": content.get("code") or code,
+        "description": content.get("description") or str(error),
+        "parameter": content.get("parameter"),
+    }
+
+
+def parse_webhook_payload(payload: Dict[str, Any], headers: Dict[str, str]) -> WebhookEvent:
+    """
+    Достаёт из уведомления объект платежа, idempotence key, внешний id, статус и сумму.
+    Чистая функция без обращений к БД — вынесена из webhook_api, чтобы её можно было мерить отдельно.
+    """
+    # --- extract payment object (defensive) ---
+    payment_obj = {}
+    if isinstance(payload, dict):
+        payment_obj = payload.get("object") or payload.get("payment") or payload
+        # unwrap nested object.object
+        if isinstance(payment_obj, dict) and payment_obj.get("object"):
+            payment_obj = payment_obj.get("object")
+    else:
+        payload = {}
+    if not isinstance(payment_obj, dict):
+        payment_obj = {}
+
+    # --- idempotence: from headers or payload.metadata ---
+    idemp = (
+            headers.get("Idempotence-Key")
+            or headers.get("Idempotence-key")
+            or headers.get("idempotence-key")
+            or (payment_obj.get("metadata") or {}).get("idempotence_key")
+            or (payload.get("metadata") or {}).get("idempotence_key")
+    )
+
+    # --- external payment id (several places) ---
+    ext_payment_id = (
+            payment_obj.get("id")
+            or payment_obj.get("payment_id")
+            or payment_obj.get("external_id")
+            or (payment_obj.get("metadata") or {}).get("payment_id")
+            or payload.get("id")
+            or payload.get("payment_id")
+    )
+
+    # --- normalize status / event ---
+    raw_status = (payment_obj.get("status") or payload.get("status") or payload.get("event") or "").strip()
+    status_normalized = None
+    if isinstance(raw_status, str) and raw_status:
+        # handle events like "payment.succeeded"
+        if raw_status.startswith("payment.") and "." in raw_status:
+            status_normalized = raw_status.split(".", 1)[1].lower()
+        else:
+            status_normalized = raw_status.lower()
+    # Map boolean flags if provider sets 'paid': True
+    if status_normalized is None and payment_obj.get("paid") is True:
+        status_normalized = "succeeded"
+
+    # amount extraction
+    raw_amount = None
+    if isinstance(payment_obj.get("amount"), dict):
+        raw_amount = payment_obj.get("amount", {}).get("value")
+    raw_amount = raw_amount or payment_obj.get("sum") or payment_obj.get("amount")
+
+    confirmation = payment_obj.get("confirmation") or {}
+    return WebhookEvent(
+        payment_obj=payment_obj,
+        idempotence_key=idemp,
+        ext_payment_id=ext_payment_id,
+        raw_status=raw_status,
+        status=status_normalized,
+        raw_amount=raw_amount,
+        confirmation_url=confirmation.get("confirmation_url"),
+        confirmation_type=confirmation.get("type"),
+    )
+
+
+def payment_idempotency_key(user_id: int, client_key: str) -> str:
+    """Ключ платежа из Idempotency-Key клиента: в пределах пользователя, не длиннее 64 символов (лимит YooKassa)"""
+    return hashlib.sha256(f"{user_id}:{client_key}".encode()).hexdigest()
+
+
+def wallet_entry_client_key(client_key: str) -> str:
+    """
+    Ключ записи журнала из Idempotency-Key клиента: отдельное пространство от служебных
+    ключей (payment:<id>, subtraction:<id>:<дата>) и фиксированная длина под wallet_entries
+    """
+    return "client:" + hashlib.sha256(client_key.encode()).hexdigest()
+
+
+def payment_update_from_provider(local_id: str, api_payment: Dict[str, Any]) -> UpdatePayments:
+    """Ответ YooKassa на создание платежа -> обновление локальной строки"""
+    confirmation = api_payment.get("confirmation") or {}
+    return UpdatePayments(
+        id=local_id,
+        status=api_payment.get("status"),
+        payment_id=api_payment.get("id"),
+        confirmation_url=confirmation.get("confirmation_url"),
+        confirmation_type=confirmation.get("type"),
+    )
+
+
 class SqlAlchemyServicePayment(AsyncPaymentService):
     def __init__(self, uow: IUnitOfWorkPayment, session_service: AsyncSessionService,
                  payment_service_api: AsyncApiPaymentService, wallet_service: AsyncWalletService,
@@ -39,176 +159,211 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
         self.user_service = user_service
         self.payment_service_api = payment_service_api
 
-    @transactional()
     async def create_payments_single(self, create_data: CreatePaymentsService,
                                      check_data: CheckSessionAccessToken) -> (
             CreatePaymentsOut | PaymentsOut):
-        session = await self.session_service.validate_access_token_session(check_data)
-        if session is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ошибка целостности данных"
-            )
-
-        user_data = await self.user_service.get_users_internal(session.user_id)
+        return await self._create_payment(create_data, check_data, {"type_payment": "single"})
 
-        if not user_data.email and not create_data.email:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Нету почты"
-            )
-
-        if create_data.email:
-            user_data.email = create_data.email
-
-        result = await self.uow.payment_repo.get_payments_by_user_id_last(create_data.user_id)
-        if result is not None:
-            if (result.status == "pending" or result.status == "waiting_for_capture") and (
-                    result.amount == create_data.amount):
-                return result
-
-        idempotence_key = str(uuid.uuid4())
-        result = await self.uow.payment_repo.create_payments(CreatePayments(
-            user_id=create_data.user_id,
-            wallet_id=create_data.wallet_id,
-            amount=create_data.amount,
-            return_url=create_data.return_url,
-            confirmation_type=create_data.confirmation_type,
-            description=create_data.description,
-            currency=create_data.currency,
-            capture=create_data.capture,
-            metadata_payments={"type_payment": "single"},
-            idempotency_key=idempotence_key,
-        )
-        )
-
-        api_payment = await self.payment_service_api.create_payment(
-            email=user_data.email,
-            amount=create_data.amount,
-            return_url=create_data.return_url,
-            description=create_data.description,
-            user_id=str(create_data.user_id),
-            payment_id=result.id,
-            idemp=idempotence_key,
-        )
-
-        if api_payment.get("type") == "error":
-            await self.uow.payment_repo.update_payments(UpdatePayments(
-                id=result.id,
-                status="failed",
-            ))
-            raise HTTPException(
-                status_code=502,
-                detail=api_payment.get("description")
-            )
+    async def create_payments(self, create_data: CreatePaymentsService, check_data: CheckSessionAccessToken) -> (
+            CreatePaymentsOut | PaymentsOut):
+        return await self._create_payment(create_data, check_data, create_data.metadata_payments)
 
-        confirmation = api_payment.get("confirmation") or {}
-        confirmation_url = confirmation.get("confirmation_url")
-        confirmation_type = confirmation.get("type")
+    async def _create_payment(self, create_data: CreatePaymentsService, check_data: CheckSessionAccessToken,
+                              metadata_payments: Optional[Dict[str, Any]]) -> CreatePaymentsOut | PaymentsOut:
+        """
+        Создание платежа в три шага, чтобы не держать соединение из пула на время запроса к YooKassa:
+          1. короткая транзакция — строка платежа в статусе INIT;
+          2. запрос к провайдеру без открытой транзакции;
+          3. короткая транзакция — ответ провайдера применяется, только если платёж всё ещё INIT.
+        Если процесс упал или провайдер не ответил между шагами, строку INIT подбирает
+        tasks.recover_init_payments (recover_init_payments). Повтор с тем же Idempotency-Key,
+        заставший платёж в INIT, выполняет шаги 2 и 3 заново с тем же ключом у провайдера.
+        """
+        try:
+            session = await self.session_service.validate_access_token_session(check_data)
+            if session is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Ошибка целостности данных"
+                )
 
-        update_data = await self.uow.payment_repo.update_payments(UpdatePayments(
-            id=result.id,
-            status=api_payment.get("status"),
-            payment_id=api_payment.get("id"),
-            confirmation_url=confirmation_url,
-            confirmation_type=confirmation_type,
-        ))
+            user_data = await self.user_service.get_users_internal(session.user_id)
 
-        response_obj = CreatePaymentsOut(
-            id=str(result.id),
-            user_id=result.user_id,
-            confirmation_url=update_data.confirmation_url,
-            confirmation_type=update_data.confirmation_type,
-            status=update_data.status,
-            wallet_id=result.wallet_id,
-            currency=result.currency,
-        )
-        return response_obj
+            if not user_data.email and not create_data.email:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Нету почты"
+                )
 
-    @transactional()
-    async def create_payments(self, create_data: CreatePaymentsService, check_data: CheckSessionAccessToken) -> (
-            CreatePaymentsOut | PaymentsOut):
-        session = await self.session_service.validate_access_token_session(check_data)
-        if session is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Ошибка целостности данных"
+            if create_data.email:
+                user_data.email = create_data.email
+
+            # шаг 1: фиксируем INIT, транзакция закрывается на выходе из uow
+            async with self.uow:
+                if create_data.idempotency_key:
+                    # ключ клиента (Idempotency-Key) становится ключом платежа и у YooKassa;
+                    # повторы отсекает middleware, здесь — случай, когда его запись в Redis утеряна
+                    idempotence_key = payment_idempotency_key(create_data.user_id, create_data.idempotency_key)
+                    existing = None
+                    found = await self.uow.payment_repo.get_payments_by_idempotency_id(idempotence_key)
+                    if found is not None:
+                        existing = CreatePaymentsOut(
+                            id=str(found.id),
+                            user_id=found.user_id,
+                            confirmation_url=found.confirmation_url,
+                            confirmation_type=found.confirmation_type,
+                            status=found.status,
+                            wallet_id=found.wallet_id,
+                            currency=found.currency,
+                        )
+                        if existing.status != "INIT":
+                            return existing
+                else:
+                    result = await self.uow.payment_repo.get_payments_by_user_id_last(create_data.user_id)
+                    if result is not None:
+                        if (result.status == "pending" or result.status == "waiting_for_capture") and (
+                                result.amount == create_data.amount):
+                            return result
+
+                    idempotence_key = str(uuid.uuid4())
+                    existing = None
+                if existing is not None:
+                    # платёж ещё INIT — первая попытка не получила ответа провайдера (или ещё ждёт его):
+                    # повторяем шаг 2 с тем же ключом, YooKassa вернёт тот же платёж, а не создаст второй
+                    result = existing
+                else:
+                    try:
+                        result = await self.uow.payment_repo.create_payments(CreatePayments(
+                            user_id=create_data.user_id,
+                            wallet_id=create_data.wallet_id,
+                            amount=create_data.amount,
+                            return_url=create_data.return_url,
+                            confirmation_type=create_data.confirmation_type,
+                            description=create_data.description,
+                            currency=create_data.currency,
+                            capture=create_data.capture,
+                            metadata_payments=metadata_payments,
+                            idempotency_key=idempotence_key,
+                        )
+                        )
+                    except IntegrityError:
+                        # ключ занят параллельным запросом (payment_idempotency); 409 не сохраняется
+                        # middleware — повтор с тем же ключом найдёт созданный платёж
+                        raise HTTPException(
+                            status_code=status.HTTP_409_CONFLICT,
+                            detail="Платёж с этим ключом уже создаётся, повторите запрос"
+                        )
+
+            # шаг 2: соединение с БД не удерживается
+            api_payment = await self.payment_service_api.create_payment(
+                email=user_data.email,
+                amount=create_data.amount,
+                return_url=create_data.return_url,
+                description=create_data.description,
+                user_id=str(create_data.user_id),
+                payment_id=result.id,
+                idemp=idempotence_key,
             )
 
-        user_data = await self.user_service.get_users_internal(session.user_id)
+            if "error" in api_payment:
+                # таймаут/обрыв: платёж у провайдера мог создаться — строка остаётся INIT до восстановления
+                logger.warning("create_payment: нет ответа провайдера для платежа %s: %s",
+                               result.id, api_payment.get("error"))
+                raise HTTPException(
+                    status_code=status.HTTP_502_BAD_GATEWAY,
+                    detail="Платёжный сервис не ответил, статус платежа будет уточнён"
+                )
 
-        if not user_data.email and not create_data.email:
-            raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail="Нету почты"
+            # шаг 3
+            if api_payment.get("type") == "error":
+                # отказ провайдера окончательный; исключение бросается после commit
+                async with self.uow:
+                    await self.uow.payment_repo.update_payments_if_init(UpdatePayments(
+                        id=result.id,
+                        status="failed",
+                    ))
+                raise HTTPException(
+                    status_code=502,
+                    detail=api_payment.get("description")
+                )
+
+            async with self.uow:
+                update_data = await self.uow.payment_repo.update_payments_if_init(
+                    payment_update_from_provider(result.id, api_payment)
+                )
+                if update_data is None:
+                    # вебхук успел обновить платёж раньше — отдаём актуальное состояние
+                    update_data = await self.uow.payment_repo.get_payments_by_id(result.id)
+
+            response_obj = CreatePaymentsOut(
+                id=str(result.id),
+                user_id=result.user_id,
+                confirmation_url=update_data.confirmation_url,
+                confirmation_type=update_data.confirmation_type,
+                status=update_data.status,
+                wallet_id=result.wallet_id,
+                currency=result.currency,
             )
+            return response_obj
 
-        if create_data.email:
-            user_data.email = create_data.email
-
-        result = await self.uow.payment_repo.get_payments_by_user_id_last(create_data.user_id)
-        if result is not None:
-            if (result.status == "pending" or result.status == "waiting_for_capture") and (
-                    result.amount == create_data.amount):
-                return result
-
-        idempotence_key = str(uuid.uuid4())
-        result = await self.uow.payment_repo.create_payments(CreatePayments(
-            user_id=create_data.user_id,
-            wallet_id=create_data.wallet_id,
-            amount=create_data.amount,
-            return_url=create_data.return_url,
-            confirmation_type=create_data.confirmation_type,
-            description=create_data.description,
-            currency=create_data.currency,
-            capture=create_data.capture,
-            metadata_payments=create_data.metadata_payments,
-            idempotency_key=idempotence_key,
-        )
-        )
-
-        api_payment = await self.payment_service_api.create_payment(
-            email=user_data.email,
-            amount=create_data.amount,
-            return_url=create_data.return_url,
-            description=create_data.description,
-            user_id=str(create_data.user_id),
-            payment_id=result.id,
-            idemp=idempotence_key,
-        )
-
-        if api_payment.get("type") == "error":
-            await self.uow.payment_repo.update_payments(UpdatePayments(
-                id=result.id,
-                status="failed",
-            ))
+        except HTTPException:
+            # просто пробрасываем дальше, чтобы не превращать в 500
+            raise
+        except Exception as e:
+            logger.exception("create_payment failed: %s", e)
             raise HTTPException(
-                status_code=502,
-                detail=api_payment.get("description")
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Внутренняя ошибка сервера: {str(e)}"
             )
 
-        confirmation = api_payment.get("confirmation") or {}
-        confirmation_url = confirmation.get("confirmation_url")
-        confirmation_type = confirmation.get("type")
-
-        update_data = await self.uow.payment_repo.update_payments(UpdatePayments(
-            id=result.id,
-            status=api_payment.get("status"),
-            payment_id=api_payment.get("id"),
-            confirmation_url=confirmation_url,
-            confirmation_type=confirmation_type,
-        ))
+    async def recover_init_payments(self) -> Dict[str, int]:
+        """
+        Разбор платежей, зависших в INIT (процесс упал или провайдер не ответил на шаге 2).
+        Платежи провайдера от момента создания до текущего ищутся по metadata.payment_id; найденный ответ
+        применяется как на шаге 3. Не найденные дольше PAYMENT_INIT_GIVEUP_SECONDS — failed.
+        """
+        now = dt.datetime.now(dt.timezone.utc)
+        report = {"checked": 0, "recovered": 0, "failed": 0}
 
-        response_obj = CreatePaymentsOut(
-            id=str(result.id),
-            user_id=result.user_id,
-            confirmation_url=update_data.confirmation_url,
-            confirmation_type=update_data.confirmation_type,
-            status=update_data.status,
-            wallet_id=result.wallet_id,
-            currency=result.currency,
-        )
-        return response_obj
+        async with self.uow:
+            stale = await self.uow.payment_repo.get_stale_init_payments(
+                now - dt.timedelta(seconds=settings.PAYMENT_INIT_STALE_SECONDS),
+                limit=settings.PAYMENT_INIT_RECOVERY_BATCH,
+            )
+        if not stale:
+            return report
+
+        # одна выборка у провайдера на весь интервал; ошибка — ничего не помечаем failed.
+        # Верхняя граница — текущий момент: повторный запрос клиента мог создать платёж
+        # у провайдера намного позже created_at локальной записи
+        window = {
+            "gte": (min(p.created_at for p in stale) - dt.timedelta(minutes=1)).isoformat(),
+            "lt": (now + dt.timedelta(minutes=1)).isoformat(),
+        }
+        remote = {}
+        for item in await self.payment_service_api.get_payments(window, raise_errors=True):
+            local_id = (item.get("metadata") or {}).get("payment_id")
+            if local_id:
+                remote[str(local_id)] = item
+
+        giveup_before = now - dt.timedelta(seconds=settings.PAYMENT_INIT_GIVEUP_SECONDS)
+        for payment in stale:
+            report["checked"] += 1
+            api_payment = remote.get(str(payment.id))
+            async with self.uow:
+                if api_payment is not None:
+                    if await self.uow.payment_repo.update_payments_if_init(
+                            payment_update_from_provider(payment.id, api_payment)):
+                        report["recovered"] += 1
+                elif payment.created_at < giveup_before:
+                    if await self.uow.payment_repo.update_payments_if_init(UpdatePayments(
+                            id=payment.id,
+                            status="failed",
+                    )):
+                        report["failed"] += 1
+
+        logger.info("recover_init_payments: %s", report)
+        return report
 
     # todo - необходимо дописать момент, чтобы он позволял нам переводить статусы именно от программы
     @transactional()
@@ -270,47 +425,13 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
                 except Exception:
                     logger.warning("Invalid remote_addr sent to webhook: %s", remote_addr)
 
-            # --- extract payment object (defensive) ---
-            payment_obj = {}
-            if isinstance(payload, dict):
-                payment_obj = payload.get("object") or payload.get("payment") or payload
-                # unwrap nested object.object
-                if isinstance(payment_obj, dict) and payment_obj.get("object"):
-                    payment_obj = payment_obj.get("object")
-            if not isinstance(payment_obj, dict):
-                payment_obj = {}
-
-            # --- idempotence: from headers or payload.metadata ---
-            idemp = (
-                    headers.get("Idempotence-Key")
-                    or headers.get("Idempotence-key")
-                    or headers.get("idempotence-key")
-                    or payment_obj.get("metadata", {}).get("idempotence_key")
-                    or payload.get("metadata", {}).get("idempotence_key")
-            )
-            logger.debug("Webhook: extracted idempotence: %s", idemp)
-
-            # --- external payment id (several places) ---
-            ext_payment_id = (
-                    payment_obj.get("id")
-                    or payment_obj.get("payment_id")
-                    or payment_obj.get("external_id")
-                    or payment_obj.get("metadata", {}).get("payment_id")
-                    or payload.get("id")
-                    or payload.get("payment_id")
-            )
-            logger.debug("Webhook: extracted external payment id: %s", ext_payment_id)
-
-            # --- normalize status / event ---
-            raw_status = (payment_obj.get("status") or payload.get("status") or payload.get("event") or "").strip()
-            status_normalized = None
-            if isinstance(raw_status, str) and raw_status:
-                # handle events like "payment.succeeded"
-                if raw_status.startswith("payment.") and "." in raw_status:
-                    status_normalized = raw_status.split(".", 1)[1].lower()
-                else:
-                    status_normalized = raw_status.lower()
-            logger.debug("Webhook: raw_status=%s normalized=%s", raw_status, status_normalized)
+            event = parse_webhook_payload(payload, headers)
+            idemp = event.idempotence_key
+            ext_payment_id = event.ext_payment_id
+            raw_status = event.raw_status
+            status_normalized = event.status
+            logger.debug("Webhook: idempotence=%s ext_id=%s raw_status=%s normalized=%s",
+                         idemp, ext_payment_id, raw_status, status_normalized)
 
             # --- try find local payment by idempotence first ---
             local_payment = None
@@ -370,17 +491,9 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
             # --- success states set ---
             success_states = {"succeeded", "paid", "success", "completed"}
             try:
-                # Map boolean flags if provider sets 'paid': True
-                if status_normalized is None and payment_obj.get("paid") is True:
-                    status_normalized = "succeeded"
-
                 if status_normalized in success_states:
                     # amount extraction
-                    raw_amount = None
-                    if isinstance(payment_obj.get("amount"), dict):
-                        raw_amount = payment_obj.get("amount", {}).get("value")
-                    raw_amount = raw_amount or payment_obj.get("sum") or payment_obj.get("amount") or getattr(
-                        local_payment, "amount", None)
+                    raw_amount = event.raw_amount or getattr(local_payment, "amount", None)
 
                     try:
                         dec_amount = Decimal(str(raw_amount)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
@@ -397,8 +510,8 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
                             id=str(getattr(local_payment, "id")),
                             status=raw_status,
                             payment_id=ext_payment_id,
-                            confirmation_url=(payment_obj.get("confirmation") or {}).get("confirmation_url"),
-                            confirmation_type=(payment_obj.get("confirmation") or {}).get("type"),
+                            confirmation_url=event.confirmation_url,
+                            confirmation_type=event.confirmation_type,
                         ))
                         return None
 
@@ -409,10 +522,12 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
                         pass
                     else:
                         # credit wallet
+                        # ключ записи журнала: повторный вебхук не зачислит платёж второй раз
                         await self.wallet_service.update_wallets_user_internal(UpdateWalletsService(
                             id=wallet_id,
                             amount=dec_amount,
-                            reason="plus"
+                            reason="plus",
+                            idempotency_key=f"payment:{getattr(local_payment, 'id')}",
                         ))
 
                     # update local payment (use str(id) to avoid UUID->str issues)
@@ -420,8 +535,8 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
                         id=str(getattr(local_payment, "id")),
                         status=raw_status,
                         payment_id=ext_payment_id,
-                        confirmation_url=(payment_obj.get("confirmation") or {}).get("confirmation_url"),
-                        confirmation_type=(payment_obj.get("confirmation") or {}).get("type"),
+                        confirmation_url=event.confirmation_url,
+                        confirmation_type=event.confirmation_type,
                     ))
 
                     logger.info("Webhook: payment %s (local id=%s) succeeded — wallet %s credited %s", ext_payment_id,
@@ -433,8 +548,8 @@ class SqlAlchemyServicePayment(AsyncPaymentService):
                         id=str(getattr(local_payment, "id")),
                         status=raw_status,
                         payment_id=ext_payment_id,
-                        confirmation_url=(payment_obj.get("confirmation") or {}).get("confirmation_url"),
-                        confirmation_type=(payment_obj.get("confirmation") or {}).get("type"),
+                        confirmation_url=event.confirmation_url,
+                        confirmation_type=event.confirmation_type,
                     ))
                     logger.info("Webhook: payment %s (local id=%s) updated to status '%s'", ext_payment_id,
                                 getattr(local_payment, "id"), raw_status)
@@ -503,7 +618,9 @@ class SqlAlchemyServiceWallet(AsyncWalletService):
 
         result = await self.uow.wallet_repo.update_wallets_user(UpdateWallets(
             id=update_data.id,
-            amount=update_data.amount * hash_table[update_data.reason]
+            amount=update_data.amount * hash_table[update_data.reason],
+            reason=update_data.reason,
+            idempotency_key=update_data.idempotency_key,
         ))
         return result
 
@@ -522,7 +639,9 @@ class SqlAlchemyServiceWallet(AsyncWalletService):
 
         result = await self.uow.wallet_repo.update_wallets_user(UpdateWallets(
             id=update_data.id,
-            amount=update_data.amount * hash_table[update_data.reason]
+            amount=update_data.amount * hash_table[update_data.reason],
+            reason=update_data.reason,
+            idempotency_key=update_data.idempotency_key,
         ))
         return result
 
@@ -537,6 +656,21 @@ class SqlAlchemyServiceWallet(AsyncWalletService):
         result = await self.uow.wallet_repo.get_wallet_by_id(id)
         return result
 
+    async def compact_ledger(self) -> int:
+        """
+        Свёртка журнала wallet_entries в снимки wallets.balance (celery beat, tasks.compact_wallet_ledger).
+        Каждая пачка — отдельная короткая транзакция.
+        """
+        total = 0
+        for _ in range(settings.WALLET_COMPACT_MAX_BATCHES):
+            async with self.uow:
+                compacted = await self.uow.wallet_repo.compact_entries(settings.WALLET_COMPACT_BATCH_SIZE)
+            total += compacted
+            if compacted < settings.WALLET_COMPACT_BATCH_SIZE:
+                break
+        logger.info("compact_ledger: свёрнуто записей %s", total)
+        return total
+
 
 class ApiError(Exception):
     def __init__(self, status: Optional[int] = None, body: Optional[Any] = None):
@@ -565,8 +699,11 @@ class SqlAlchemyServicePaymentApi:
             raise ValueError("YooKassa: SHOP_ID и SECRET_KEY обязательны для инициализации")
 
         # безопасно устанавливаем конфигурацию SDK
-        Configuration.account_id = str(self.shop_id).strip()
-        Configuration.secret_key = str(self.secret_key).strip()
+        sdk = yookassa_sdk()
+        sdk.Configuration.account_id = str(self.shop_id).strip()
+        sdk.Configuration.secret_key = str(self.secret_key).strip()
+        if settings.YOOKASSA_API_URL:
+            sdk.Configuration.api_url = settings.YOOKASSA_API_URL
 
         # # инициализируем вебхуки 1 раз на процесс (или вызывать из startup handler)
         # if not SqlAlchemyServicePaymentApi._webhook_initialized:
@@ -581,7 +718,7 @@ class SqlAlchemyServicePaymentApi:
             return
 
         try:
-            webhooks = Webhook.list()
+            webhooks = yookassa_sdk().Webhook.list()
             # проверяем, есть ли уже webhook с таким URL и event'ом
             exists = any(
                 getattr(wh, "url", "") == self.webhook_url and getattr(wh, "event", "") in (
@@ -594,9 +731,9 @@ class SqlAlchemyServicePaymentApi:
                 return
 
             # создаём только необходимые
-            Webhook.add()
-            Webhook.add({"event": "payment.succeeded", "url": self.webhook_url})
-            Webhook.add({"event": "payment.canceled", "url": self.webhook_url})
+            yookassa_sdk().Webhook.add()
+            yookassa_sdk().Webhook.add({"event": "payment.succeeded", "url": self.webhook_url})
+            yookassa_sdk().Webhook.add({"event": "payment.canceled", "url": self.webhook_url})
             logger.info("YooKassa webhooks добавлены: %s", self.webhook_url)
 
         except Exception:
@@ -611,7 +748,7 @@ class SqlAlchemyServicePaymentApi:
         try:
             # попробуем сразу запросить список с фильтром по metadata.payment_id (если SDK/сервер это поддерживает)
             params = {"limit": 1, "metadata.payment_id": local_payment_id}
-            res = await asyncio.to_thread(Payment.list, params)
+            res = await asyncio.to_thread(yookassa_sdk().Payment.list, params)
             items = getattr(res, "items", None)
             if items:
                 first = items[0]
@@ -627,7 +764,7 @@ class SqlAlchemyServicePaymentApi:
                 params = {"limit": 50}
                 if cursor:
                     params["cursor"] = cursor
-                res = await asyncio.to_thread(Payment.list, params)
+                res = await asyncio.to_thread(yookassa_sdk().Payment.list, params)
                 items = getattr(res, "items", []) or []
                 for p in items:
                     md = getattr(p, "metadata", {}) or {}
@@ -654,7 +791,7 @@ class SqlAlchemyServicePaymentApi:
         try:
             # Попробуем сначала фильтрацией по metadata.idempotence_key
             params = {"limit": 1, "metadata.idempotence_key": idemp}
-            res = await asyncio.to_thread(Payment.list, params)
+            res = await asyncio.to_thread(yookassa_sdk().Payment.list, params)
             items = getattr(res, "items", None)
             if items:
                 # вернём все найденные (SDK мог вернуть только одну страницу)
@@ -664,7 +801,7 @@ class SqlAlchemyServicePaymentApi:
                 cursor = getattr(res, "next_cursor", None)
                 while cursor:
                     params = {"limit": 50, "cursor": cursor}
-                    res = await asyncio.to_thread(Payment.list, params)
+                    res = await asyncio.to_thread(yookassa_sdk().Payment.list, params)
                     for it in getattr(res, "items", []) or []:
                         results.append(dict(it))
                     cursor = getattr(res, "next_cursor", None)
@@ -680,7 +817,7 @@ class SqlAlchemyServicePaymentApi:
                 params = {"limit": 50}
                 if cursor:
                     params["cursor"] = cursor
-                res = await asyncio.to_thread(Payment.list, params)
+                res = await asyncio.to_thread(yookassa_sdk().Payment.list, params)
                 items = getattr(res, "items", []) or []
                 for p in items:
                     md = getattr(p, "metadata", {}) or {}
@@ -699,13 +836,14 @@ class SqlAlchemyServicePaymentApi:
 
         return results
 
-    async def get_payments(self, created_at) -> List[Dict[str, Any]]:
+    async def get_payments(self, created_at, raise_errors: bool = False) -> List[Dict[str, Any]]:
         """
         Возвращает список платежей в диапазоне created_at.
         Параметр created_at может быть:
           - dict с ключами 'gte' и/или 'lt' значениями в ISO-формате,
           - кортеж/список (gte, lt),
           - строкой (в таком случае будет использован created_at.gte)
+        raise_errors=True — ошибка API пробрасывается, а не возвращается неполный список.
         """
         cursor = None
         data = {
@@ -735,7 +873,7 @@ class SqlAlchemyServicePaymentApi:
                 params = dict(data)
                 if cursor:
                     params["cursor"] = cursor
-                res = await asyncio.to_thread(Payment.list, params)
+                res = await asyncio.to_thread(yookassa_sdk().Payment.list, params)
                 items = getattr(res, "items", []) or []
                 for p in items:
                     results.append(dict(p))
@@ -743,6 +881,8 @@ class SqlAlchemyServicePaymentApi:
                 if not cursor:
                     break
         except Exception as e:
+            if raise_errors:
+                raise
             print("get_payments error:", e)
 
         return results
@@ -818,19 +958,24 @@ class SqlAlchemyServicePaymentApi:
         }
 
         try:
-            # Первый вариант — попробовать передать idempotence_key как аргумент (некоторые версии SDK поддерживают это)
-            if idemp:
-                try:
-                    res = await asyncio.to_thread(Payment.create, paydata, idemp)
-                except TypeError:
-                    # SDK не принимает idempotence_key в сигнатуре -> fallback
-                    res = await asyncio.to_thread(Payment.create, paydata)
-            else:
-                res = await asyncio.to_thread(Payment.create, paydata)
+            with track_outbound("yookassa", "payment_create"):
+                # Первый вариант — попробовать передать idempotence_key как аргумент (некоторые версии SDK поддерживают это)
+                if idemp:
+                    try:
+                        res = await asyncio.to_thread(yookassa_sdk().Payment.create, paydata, idemp)
+                    except TypeError:
+                        # SDK не принимает idempotence_key в сигнатуре -> fallback
+                        res = await asyncio.to_thread(yookassa_sdk().Payment.create, paydata)
+                else:
+                    res = await asyncio.to_thread(yookassa_sdk().Payment.create, paydata)
 
             return dict(res)
         except Exception as e:
-            # В продакшне используйте нормальный логгер и более детальную обработку (например, парсинг ошибок SDK)
-            print("create_payment error:", e)
-            # Можно вернуть структуру с описанием ошибки, чтобы вызывающая сторона не падала
+            rejection = provider_rejection(e)
+            if rejection is not None:
+                # API ответил отказом — платёж у провайдера не создан
+                logger.warning("create_payment: провайдер отклонил платёж %s: %s", payment_id, rejection)
+                return rejection
+            # таймаут, обрыв, 5xx/429 — результат неизвестен, вызывающая сторона оставит платёж INIT
+            logger.warning("create_payment: ошибка запроса к провайдеру для платежа %s: %s", payment_id, e)
             return {"error": str(e)}
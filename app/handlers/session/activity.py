@@ -0,0 +1,129 @@
+# app/handlers/session/activity.py
+"""
+Отложенная запись активности сессий (last_used_at).
+
+Проверка access токена только отмечает сессию в памяти процесса (dict id -> время), без
+записи в БД. Фоновая задача из lifespan раз в SESSION_ACTIVITY_FLUSH_SECONDS применяет все
+отметки одним UPDATE sessions ... FROM (VALUES ...). При падении процесса теряются отметки
+последних секунд — для учёта активности это допустимо.
+
+Если задан SESSION_IDLE_TIMEOUT_SECONDS, та же задача закрывает сессии, не использовавшиеся
+дольше этого времени, и отзывает их подписанные токены. Отзыв идёт до коммита: если Redis
+недоступен, закрытие откатывается и сессии будут закрыты следующим проходом.
+"""
+import asyncio
+import datetime as dt
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import update, values, column, func, BigInteger, DateTime
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.method.access_token import revoke_many_session_tokens
+from app.models.sessions.models import Session as SessionModel
+
+logger = logging.getLogger("uvicorn")
+
+# строк в одном UPDATE ... FROM (VALUES ...)
+FLUSH_CHUNK = 1000
+
+
+class SessionActivityTracker:
+    def __init__(self):
+        self._pending: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_sweep = 0.0
+
+    def touch(self, session_id: int) -> None:
+        # без фоновой задачи отметки некому записывать — не копим их
+        if settings.SESSION_ACTIVITY_ENABLED:
+            self._pending[session_id] = time.time()
+
+    def last_seen(self, session_id: int) -> Optional[float]:
+        """Отметка, ещё не записанная в БД"""
+        return self._pending.get(session_id)
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        rows = [(sid, dt.datetime.fromtimestamp(ts, dt.timezone.utc)) for sid, ts in pending.items()]
+        try:
+            async with AsyncSessionLocal() as db:
+                for i in range(0, len(rows), FLUSH_CHUNK):
+                    v = values(
+                        column("id", BigInteger), column("ts", DateTime(timezone=True)), name="v"
+                    ).data(rows[i:i + FLUSH_CHUNK])
+                    # условие по времени — чтобы другой воркер не откатил более свежую отметку
+                    await db.execute(
+                        update(SessionModel)
+                        .where(SessionModel.id == v.c.id, SessionModel.last_used_at < v.c.ts)
+                        .values(last_used_at=v.c.ts)
+                        .execution_options(synchronize_session=False)
+                    )
+                await db.commit()
+        except Exception:
+            # возвращаем отметки, не затирая более новые
+            for sid, ts in pending.items():
+                if self._pending.get(sid, 0) < ts:
+                    self._pending[sid] = ts
+            raise
+        return len(rows)
+
+    async def expire_idle(self) -> List[int]:
+        """Закрывает сессии без активности дольше SESSION_IDLE_TIMEOUT_SECONDS"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(SessionModel)
+                .where(
+                    SessionModel.is_active.is_(True),
+                    SessionModel.last_used_at < func.now() - dt.timedelta(seconds=settings.SESSION_IDLE_TIMEOUT_SECONDS),
+                )
+                .values(is_active=False, logged_out_at=func.now())
+                .returning(SessionModel.id)
+                .execution_options(synchronize_session=False)
+            )
+            expired = list(result.scalars().all())
+            # исключение (RedisError) откатывает закрытие — ни одна сессия не закрыта без отзыва
+            await revoke_many_session_tokens(expired)
+            await db.commit()
+        return expired
+
+    async def run(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(settings.SESSION_ACTIVITY_FLUSH_SECONDS)
+            try:
+                await self.flush()
+                if settings.SESSION_IDLE_TIMEOUT_SECONDS and \
+                        time.monotonic() - self._last_sweep >= settings.SESSION_IDLE_SWEEP_SECONDS:
+                    self._last_sweep = time.monotonic()
+                    expired = await self.expire_idle()
+                    if expired:
+                        logger.info("Закрыто неактивных сессий: %s", len(expired))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Активность сессий: ошибка записи")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run(), name="session-activity")
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # последние отметки перед остановкой
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Активность сессий: ошибка записи при остановке")
+
+
+SESSION_ACTIVITY = SessionActivityTracker()
@@ -4,22 +4,36 @@ from datetime import timedelta
 import time
 
 from app.handlers.session.schemas import *
+from app.core.config import settings
+from app.method.access_token import mint_access_token
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from sqlalchemy import select, update
+from sqlalchemy import select, update, any_, bindparam, func, text, Text
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from app.models.sessions.models import Session as SessionModel, RefreshToken as RefreshTokenModel, \
     OAuthClient as OAuthClientModel
 
 from app.handlers.session.interfaces import AsyncSessionRepository, AsyncRefreshTokenRepository, \
     AsyncOauthClientRepository
 
-from typing import TYPE_CHECKING, Optional, List
+from typing import Optional, List, Dict, Tuple
 
-if TYPE_CHECKING:
-    from app.models.auth.models import User as UserModel, Role as RoleModel
+from app.models.auth.models import User as UserModel, Role as RoleModel
 
 import hashlib
+import secrets
+
+
+def device_fingerprint(user_agent: Optional[str]) -> str:
+    """Отпечаток устройства для переиспользования сессии; та же формула в миграции 8c4e2b7a9d31"""
+    return hashlib.sha256((user_agent or "").encode()).hexdigest()
+
+
+def _new_refresh_token() -> Tuple[str, str]:
+    """Случайный refresh токен: (plaintext для клиента, sha256 для хранения)"""
+    plaintext = secrets.token_urlsafe(32)
+    return plaintext, hashlib.sha256(plaintext.encode()).hexdigest()
 
 
 class SessionRepository(AsyncSessionRepository):
@@ -78,7 +92,7 @@ class SessionRepository(AsyncSessionRepository):
         result = await self.db.execute(stmt)
         result = result.scalar_one_or_none()
 
-        return self._to_dto(result) if result else None
+        return await self._to_dto(result) if result else None
 
     async def open_session(self, session_data: OpenSession) -> OutSession:
         m = SessionModel()
@@ -86,6 +100,7 @@ class SessionRepository(AsyncSessionRepository):
         m.ip_address = session_data.id_address
         m.user_agent = session_data.user_agent
         m.client_id = session_data.client_id
+        m.device_fingerprint = device_fingerprint(session_data.user_agent)
         m.is_active = True
         m.created_at = dt.datetime.now(dt.timezone.utc)
         m.last_used_at = dt.datetime.now(dt.timezone.utc)
@@ -98,6 +113,101 @@ class SessionRepository(AsyncSessionRepository):
         self.db.add(m)
         await self.db.flush()
 
+        if settings.ACCESS_TOKEN_STATELESS:
+            # в подписанный токен входит id сессии — он известен только после flush
+            m.access_token = mint_access_token(m.user_id, m.id, m.client_id, m.ip_address)
+            await self.db.flush()
+
+        return await self._to_dto(m)
+
+    async def upsert_session(self, session_data: OpenSessionRepo) -> Tuple[OutSession, Optional[str]]:
+        """
+        Вход на уже известном устройстве переиспользует активную сессию (user_id, client_id, отпечаток),
+        выдавая ей новый access токен; иначе создаётся новая. Одна команда INSERT ... ON CONFLICT
+        по уникальному частичному индексу uq_sessions_active_device — без гонки между проверкой и вставкой.
+        :return: (сессия, прежний access токен переиспользованной сессии или None) — прежний нужно отозвать
+        """
+        now = dt.datetime.now(dt.timezone.utc)
+        fingerprint = device_fingerprint(session_data.user_agent)
+        # RETURNING отдаёт уже новую строку — прежний токен читаем заранее под блокировкой строки
+        previous = await self.db.execute(
+            select(SessionModel.access_token)
+            .where(
+                SessionModel.user_id == session_data.user_id,
+                SessionModel.client_id == session_data.client_id,
+                SessionModel.device_fingerprint == fingerprint,
+                SessionModel.is_active.is_(True),
+            )
+            .with_for_update()
+        )
+        previous_token = previous.scalar_one_or_none()
+        timestamp = str(time.time()).encode()
+        stmt = pg_insert(SessionModel).values(
+            user_id=session_data.user_id,
+            client_id=session_data.client_id,
+            ip_address=session_data.id_address,
+            user_agent=session_data.user_agent,
+            device_fingerprint=fingerprint,
+            is_active=True,
+            created_at=now,
+            last_used_at=now,
+            access_token=hashlib.sha256(timestamp).hexdigest(),
+        )
+        stmt = (
+            stmt.on_conflict_do_update(
+                index_elements=[SessionModel.user_id, SessionModel.client_id, SessionModel.device_fingerprint],
+                index_where=text("is_active"),
+                set_={
+                    "ip_address": stmt.excluded.ip_address,
+                    "user_agent": stmt.excluded.user_agent,
+                    "last_used_at": stmt.excluded.last_used_at,
+                    "access_token": stmt.excluded.access_token,
+                },
+            )
+            .returning(SessionModel)
+            .execution_options(populate_existing=True)
+        )
+        result = await self.db.execute(stmt)
+        m = result.scalar_one()
+
+        if settings.ACCESS_TOKEN_STATELESS:
+            m.access_token = mint_access_token(m.user_id, m.id, m.client_id, m.ip_address)
+            await self.db.flush()
+
+        return await self._to_dto(m), previous_token
+
+    async def close_excess_sessions(self, user_id: int, keep: int) -> List[int]:
+        """Закрывает самые давно использованные активные сессии сверх keep; вернёт их id"""
+        oldest = (
+            select(SessionModel.id)
+            .where(SessionModel.user_id == user_id, SessionModel.is_active.is_(True))
+            .order_by(SessionModel.last_used_at.desc(), SessionModel.id.desc())
+            .offset(keep)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(SessionModel)
+            .where(SessionModel.id.in_(oldest))
+            .values(is_active=False, logged_out_at=func.now())
+            .returning(SessionModel.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        return list(result.scalars().all())
+
+    async def reissue_access_token(self, session_id: int) -> Optional[OutSession]:
+        """Новый access токен для активной сессии (при продлении через refresh токен)"""
+        m = await self.db.get(SessionModel, session_id)
+        if m is None or not m.is_active:
+            return None
+
+        if settings.ACCESS_TOKEN_STATELESS:
+            m.access_token = mint_access_token(m.user_id, m.id, m.client_id, m.ip_address)
+        else:
+            timestamp = str(time.time()).encode()
+            m.access_token = hashlib.sha256(timestamp).hexdigest()
+        await self.db.flush()
+
         return await self._to_dto(m)
 
     async def close_session(self, session_id: int) -> None:
@@ -154,7 +264,7 @@ class SessionRepository(AsyncSessionRepository):
     async def get_by_oauth_client_and_user_id(self,id_client: int, id_user: int) -> Optional[OutSession]:
         q = ((select(SessionModel))
              .where((SessionModel.user_id == id_user) & (SessionModel.is_active == True) &
-                    (SessionModel.id == id_client))
+                    (SessionModel.client_id == id_client))
              .order_by(SessionModel.created_at.desc()).limit(1))
         result = await self.db.execute(q)
         result = result.scalars().first()
@@ -166,6 +276,43 @@ class SessionRepository(AsyncSessionRepository):
         sessions = result.scalars().all()
         return [await self._to_dto(r) for r in sessions]
 
+    async def get_active_by_access_tokens(self, access_tokens: List[str]) \
+            -> Dict[str, Tuple[OutSession, Optional[str]]]:
+        """
+        Активные сессии по списку токенов одним запросом вместе с ролью пользователя.
+        Refresh токены не подгружаются (в отличие от _to_dto) — для интроспекции они не нужны.
+        :return: {access_token: (сессия, имя роли)}
+        """
+        if not access_tokens:
+            return {}
+        # один параметр-массив вместо IN (...) — план запроса не зависит от размера пачки
+        tokens = bindparam("access_tokens", list(access_tokens), type_=ARRAY(Text))
+        stmt = (
+            select(SessionModel, RoleModel.name)
+            .outerjoin(UserModel, UserModel.id == SessionModel.user_id)
+            .outerjoin(RoleModel, RoleModel.id == UserModel.role_id)
+            .where(
+                SessionModel.access_token == any_(tokens),
+                SessionModel.is_active.is_(True),
+            )
+        )
+        result = await self.db.execute(stmt)
+        found: Dict[str, Tuple[OutSession, Optional[str]]] = {}
+        for m, role_name in result.all():
+            found[m.access_token] = (OutSession(
+                id=m.id,
+                user_id=m.user_id,
+                client_id=m.client_id,
+                access_token=m.access_token,
+                is_active=m.is_active,
+                logged_out_at=m.logged_out_at,
+                created_at=m.created_at,
+                last_used_at=m.last_used_at,
+                ip_address=m.ip_address,
+                user_agent=m.user_agent
+            ), role_name)
+        return found
+
     async def get_by_access_token_session(self, access_token: str) -> Optional[OutSession]:
 
         q = select(SessionModel).where(
@@ -219,17 +366,14 @@ class RefreshTokenRepository(AsyncRefreshTokenRepository):
         m.created_at = dt.datetime.now(dt.timezone.utc)
         m.used_at = None
 
-        timestamp = str(time.time()).encode()
-        m.token_hash = hashlib.sha256(timestamp).hexdigest()
+        plaintext, m.token_hash = _new_refresh_token()
 
         self.db.add(m)
         await self.db.flush()
-        return self._to_dto(m, plaintext=timestamp.decode())
+        return self._to_dto(m, plaintext=plaintext)
 
     async def update_refresh_token(self, refresh_token_data: UpdateRefreshToken) -> OutRefreshToken:
-        # todo - нужно поменять генерацию токена, у него есть проблемы
-        timestamp = str(time.time()).encode()
-        new_token = hashlib.sha256(timestamp).hexdigest()
+        plaintext, new_token = _new_refresh_token()
 
         stmt = (
             update(RefreshTokenModel)
@@ -247,10 +391,85 @@ class RefreshTokenRepository(AsyncRefreshTokenRepository):
         result = await self.db.execute(stmt)
         result = result.scalar_one_or_none()
 
-        return self._to_dto(result, plaintext=timestamp.decode())
+        return self._to_dto(result, plaintext=plaintext)
+
+    async def rotate_refresh_token(self, token_hash: str, user_id: int, oauth_client: str) \
+            -> Optional[Tuple[OutSession, OutRefreshToken]]:
+        """
+        Проверка и ротация refresh токена одним UPDATE ... FROM ... RETURNING:
+        токен ищется по уникальному token_hash вместе с активной сессией пользователя и OAuth клиентом,
+        не отозван и не истёк — и сразу получает новое значение. Параллельный повтор того же токена
+        не пройдёт: строка уже обновлена (или заблокирована до конца этой транзакции).
+        :return: (сессия, refresh токен с новым plaintext) или None
+        """
+        plaintext, new_hash = _new_refresh_token()
+        stmt = (
+            update(RefreshTokenModel)
+            .where(
+                RefreshTokenModel.token_hash == token_hash,
+                RefreshTokenModel.revoked.is_(False),
+                RefreshTokenModel.expires_at > func.now(),
+                RefreshTokenModel.session_id == SessionModel.id,
+                SessionModel.is_active.is_(True),
+                SessionModel.user_id == user_id,
+                SessionModel.client_id == OAuthClientModel.id,
+                OAuthClientModel.client_id == oauth_client,
+            )
+            .values(token_hash=new_hash, used_at=func.now())
+            .returning(
+                RefreshTokenModel.id, RefreshTokenModel.session_id, RefreshTokenModel.revoked,
+                RefreshTokenModel.created_at, RefreshTokenModel.expires_at, RefreshTokenModel.used_at,
+                SessionModel.user_id, SessionModel.client_id, SessionModel.access_token, SessionModel.is_active,
+                SessionModel.logged_out_at, SessionModel.created_at.label("session_created_at"),
+                SessionModel.last_used_at, SessionModel.ip_address, SessionModel.user_agent,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        row = result.first()
+        if row is None:
+            return None
+
+        refresh_token = OutRefreshToken(
+            id=row.id,
+            session_id=row.session_id,
+            revoked=row.revoked,
+            created_at=row.created_at,
+            expires_at=row.expires_at,
+            used_at=row.used_at,
+            token_hash=plaintext,
+        )
+        session = OutSession(
+            id=row.session_id,
+            user_id=row.user_id,
+            client_id=row.client_id,
+            access_token=row.access_token,
+            refresh_token=plaintext,
+            is_active=row.is_active,
+            logged_out_at=row.logged_out_at,
+            created_at=row.session_created_at,
+            last_used_at=row.last_used_at,
+            ip_address=row.ip_address,
+            user_agent=row.user_agent
+        )
+        return session, refresh_token
+
+    async def revoke_session_refresh_tokens(self, session_id: int) -> int:
+        """Отзывает все действующие refresh токены сессии; вернёт их число"""
+        stmt = (
+            update(RefreshTokenModel)
+            .where(RefreshTokenModel.session_id == session_id, RefreshTokenModel.revoked.is_not(True))
+            .values(revoked=True)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.db.execute(stmt)
+        return result.rowcount
 
     async def get_by_id_refresh_token(self, id_refresh_token: int) -> Optional[OutRefreshToken]:
-        result = await self.db.get(RefreshTokenModel, id_refresh_token)
+        # db.get не подходит: первичный ключ составной (id, created_at) из-за партиций
+        stmt = select(RefreshTokenModel).where(RefreshTokenModel.id == id_refresh_token)
+        result = await self.db.execute(stmt)
+        result = result.scalar_one_or_none()
         return self._to_dto(result) if result else None
 
     async def get_by_session_id_refresh(self, id_session: int, offset: int = 0, limit: int = 50) -> list[
@@ -1,4 +1,4 @@
-from typing import Protocol, List, Optional
+from typing import Protocol, List, Optional, Dict, Tuple
 from app.handlers.session.schemas import (
     OpenSession,
     OutSession,
@@ -7,7 +7,7 @@ from app.handlers.session.schemas import (
     OutRefreshToken,
     RefreshSession,
     LogoutSession, CreateRefreshToken, UpdateRefreshToken, CreateOauthClient, OutOauthClient, UpdateOauthClient,
-    CheckOauthClient, OpenSessionRepo
+    CheckOauthClient, OpenSessionRepo, BatchCheckAccessToken, OutBatchIntrospection
 )
 import datetime
 
@@ -20,6 +20,19 @@ class AsyncSessionRepository(Protocol):
     async def close_session(self, session_id: int) -> None:
         ...
 
+    async def upsert_session(self, session_data: OpenSessionRepo) -> Tuple[OutSession, Optional[str]]:
+        ...
+
+    async def close_excess_sessions(self, user_id: int, keep: int) -> List[int]:
+        ...
+
+    async def reissue_access_token(self, session_id: int) -> Optional[OutSession]:
+        ...
+
+    async def get_active_by_access_tokens(self, access_tokens: List[str]) \
+            -> Dict[str, Tuple[OutSession, Optional[str]]]:
+        ...
+
     async def refresh_session(self, refresh_data: RefreshSession) -> Optional[OutSession]:
         ...
 
@@ -57,6 +70,13 @@ class AsyncRefreshTokenRepository(Protocol):
     async def get_by_session_id_refresh(self, id_session: int) -> list[Optional[OutRefreshToken]]:
         ...
 
+    async def revoke_session_refresh_tokens(self, session_id: int) -> int:
+        ...
+
+    async def rotate_refresh_token(self, token_hash: str, user_id: int, oauth_client: str) \
+            -> Optional[Tuple[OutSession, OutRefreshToken]]:
+        ...
+
 
 class AsyncOauthClientRepository(Protocol):
 
@@ -101,6 +121,9 @@ class AsyncSessionService(Protocol):
     async def logout_session(self, logout_data: LogoutSession) -> Optional[OutSession]:
         ...
 
+    async def introspect_access_tokens(self, batch: BatchCheckAccessToken) -> OutBatchIntrospection:
+        ...
+
 
 class AsyncRefreshTokenService(Protocol):
 
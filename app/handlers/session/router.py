@@ -4,7 +4,7 @@ from app.handlers.auth.dependencies import AuthServiceDep
 from app.handlers.auth.schemas import LogInUser, UserCreate, LogOutUser, AuthResponse,RoleUser
 from app.handlers.session.dependencies import SessionServiceDep, OauthClientServiceDep
 from app.handlers.session.schemas import OpenSession, CloseSession, OutSession, CheckSessionAccessToken, \
-    CheckSessionRefreshToken, OutOauthClient, CheckOauthClient
+    CheckSessionRefreshToken, OutOauthClient, CheckOauthClient, BatchCheckAccessToken, OutBatchIntrospection
 from app.method.get_token import get_token
 
 router = APIRouter(prefix="/session", tags=["session"])
@@ -40,6 +40,22 @@ async def valid_server_session(
     return await session_service.validate_access_token_session(csat)
 
 
+@router.post("/access_token/batch", response_model=OutBatchIntrospection, response_model_exclude_none=True)
+async def valid_server_sessions_batch(
+        session_service: SessionServiceDep,
+        batch: BatchCheckAccessToken = Body(...),
+):
+    """
+    Пакетная проверка access токенов для внутренних сервисов (вместо вызова /access_token
+    на каждый запрос). Ошибка одного токена не роняет пачку — для него valid=false и error.
+    withRoles=true добавляет роль пользователя и признак администратора.
+    :param session_service:
+    :param batch:
+    :return:
+    """
+    return await session_service.introspect_access_tokens(batch)
+
+
 @router.post("/refresh_token",response_model=OutSession)
 async def validate_session(session_service: SessionServiceDep, user_id: int,
                            refresh_token: str, oauth_client: str, request: Request):
@@ -1,5 +1,5 @@
 import datetime as dt
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -77,6 +77,14 @@ class LogoutSession(BaseModel):
         validate_by_name = True
 
 
+class BatchCheckAccessToken(BaseModel):
+    items: List[CheckSessionAccessToken] = Field(..., alias="items")
+    with_roles: bool = Field(False, alias="withRoles")
+
+    class Config:
+        validate_by_name = True
+
+
 # ---- Response / Output ---- SESSION
 class OutSession(BaseModel):
     id: int = Field(..., alias="sessionId")
@@ -96,6 +104,27 @@ class OutSession(BaseModel):
         from_attributes = True
 
 
+class OutTokenIntrospection(BaseModel):
+    access_token: str = Field(..., alias="accessToken")
+    valid: bool = Field(..., alias="valid")
+    error: Optional[str] = Field(None, alias="error")
+    session_id: Optional[int] = Field(None, alias="sessionId")
+    user_id: Optional[int] = Field(None, alias="userId")
+    client_id: Optional[int] = Field(None, alias="clientId")
+    role_name: Optional[str] = Field(None, alias="roleName")
+    is_admin: Optional[bool] = Field(None, alias="isAdmin")
+
+    class Config:
+        validate_by_name = True
+
+
+class OutBatchIntrospection(BaseModel):
+    results: List[OutTokenIntrospection] = Field(..., alias="results")
+
+    class Config:
+        validate_by_name = True
+
+
 # ---- Request / Input ---- RefreshToken
 
 class CreateRefreshToken(BaseModel):
@@ -1,4 +1,3 @@
-import asyncio
 import datetime
 import hashlib
 import logging
@@ -7,17 +6,24 @@ import datetime as dt
 from typing import Optional, List
 
 from fastapi import HTTPException, status
+from redis.exceptions import RedisError
 from sqlalchemy.exc import IntegrityError
 import ipaddress
 
 from app.core.abs.unit_of_work import IUnitOfWorkSession
+from app.core.config import settings
+from app.method.access_token import is_stateless_token, verify_access_token, ip_matches, \
+    is_session_revoked, revoke_session_tokens, revoke_access_token
+from app.handlers.auth.dto import ADMIN_ROLES
 from app.method.decorator import transactional
+from app.handlers.session.activity import SESSION_ACTIVITY
 from app.models.sessions.models import RefreshToken as RefreshTokenModel
 
 from app.handlers.session.interfaces import AsyncRefreshTokenService, AsyncOauthClientService, AsyncSessionService
 from app.handlers.session.schemas import OpenSession, OutSession, CheckOauthClient, CreateOauthClient, OutOauthClient, \
     CheckSessionAccessToken, CheckSessionRefreshToken, OutRefreshToken, UpdateOauthClient, CreateRefreshToken, \
-    UpdateRefreshToken, RefreshSession, LogoutSession, OpenSessionRepo
+    UpdateRefreshToken, RefreshSession, LogoutSession, OpenSessionRepo, BatchCheckAccessToken, OutBatchIntrospection, \
+    OutTokenIntrospection
 
 
 # todo: заменить генерацию токена на безопасную для продакшена
@@ -65,26 +71,24 @@ class SqlAlchemyServiceSession(AsyncSessionService):
                         detail="Клиента с таким наименованием нету"
                     )
 
-                session: Optional[OutSession] = await self.uow.sessions.get_by_oauth_client_and_user_id(
-                    id_client=client_data_oauth.id, id_user=session_data.user_id)
-
-                if session is None:
-                    # Создаем сессию
-                    session = await self.uow.sessions.open_session(OpenSessionRepo(
-                        user_id=session_data.user_id,
-                        client_id=client_data_oauth.id,
-                        id_address=session_data.id_address,
-                        user_agent=session_data.user_agent,
-                    ))
-
-                if session.client_id != client_data_oauth.client_id:
-                    # создаем новую сессию
-                    session = await self.uow.sessions.open_session(OpenSessionRepo(
-                        user_id=session_data.user_id,
-                        client_id=client_data_oauth.id,
-                        id_address=session_data.id_address,
-                        user_agent=session_data.user_agent,
-                    ))
+                # Повторный вход с того же устройства переиспользует активную сессию
+                session, previous_token = await self.uow.sessions.upsert_session(OpenSessionRepo(
+                    user_id=session_data.user_id,
+                    client_id=client_data_oauth.id,
+                    id_address=session_data.id_address,
+                    user_agent=session_data.user_agent,
+                ))
+
+                if previous_token is not None:
+                    # сессия переиспользована: прежние access и refresh токены больше не действуют
+                    await self.uow.refresh_tokens.revoke_session_refresh_tokens(session.id)
+                    await self._revoke_access_token(session.id, previous_token)
+
+                # Лимит активных сессий пользователя: самые давние закрываются
+                closed_sessions: List[int] = []
+                if settings.SESSION_MAX_ACTIVE_PER_USER:
+                    closed_sessions = await self.uow.sessions.close_excess_sessions(
+                        session_data.user_id, settings.SESSION_MAX_ACTIVE_PER_USER)
 
                 # Создаем refresh token
                 session_id: int = session.id
@@ -96,9 +100,13 @@ class SqlAlchemyServiceSession(AsyncSessionService):
                 # Обновляем сессию
                 session.refresh_token = refresh_token.token_hash
 
+                # токены вытесненных сессий отзываются до коммита: без отзыва они не закрываются
+                for closed_id in closed_sessions:
+                    await self._revoke_tokens(closed_id)
+
                 # Коммитим транзакцию
                 await self.uow.commit()
-                return session
+            return session
         except IntegrityError as e:
             # Откатываем транзакцию при ошибке целостности
             raise HTTPException(
@@ -115,10 +123,46 @@ class SqlAlchemyServiceSession(AsyncSessionService):
                 detail=f"Внутренняя ошибка сервера: {str(e)}"
             )
 
+    @staticmethod
+    async def _revoke_tokens(id_session: int, access_token: Optional[str] = None) -> None:
+        """
+        Отзывает подписанные токены сессии (иначе они действительны до exp). Вызывается внутри
+        транзакции до коммита: если Redis недоступен, исключение откатывает закрытие сессии и
+        запрос можно повторить. Сессии с непрозрачным токеном проверяются по БД — отзыв не нужен.
+        """
+        if access_token is not None and not is_stateless_token(access_token):
+            return
+        try:
+            await revoke_session_tokens(id_session)
+        except RedisError as e:
+            logging.error("Не удалось отозвать access токены сессии %s: %s", id_session, e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Не удалось отозвать токены сессии, повторите запрос"
+            )
+
+    @staticmethod
+    async def _revoke_access_token(id_session: int, access_token: Optional[str]) -> None:
+        """
+        Отзывает один прежний подписанный токен живой сессии (новый вход, продление). Как и
+        _revoke_tokens, вызывается до коммита: при недоступном Redis операция откатывается.
+        """
+        if not is_stateless_token(access_token):
+            return
+        try:
+            await revoke_access_token(access_token)
+        except RedisError as e:
+            logging.error("Не удалось отозвать прежний access токен сессии %s: %s", id_session, e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Не удалось отозвать прежний токен, повторите запрос"
+            )
+
     async def close_session(self, id_session: int) -> None:
         try:
             async with self.uow:
                 await self.uow.sessions.close_session(id_session)
+                await self._revoke_tokens(id_session)
 
                 await self.uow.commit()
         except IntegrityError as e:
@@ -141,8 +185,62 @@ class SqlAlchemyServiceSession(AsyncSessionService):
                 detail=f"Внутренняя ошибка сервера: {str(e)} -- тут 3"
             )
 
+    @staticmethod
+    def _is_idle(session: OutSession) -> bool:
+        """Сессия простаивает дольше SESSION_IDLE_TIMEOUT_SECONDS (с учётом ещё не записанных отметок)"""
+        if not settings.SESSION_IDLE_TIMEOUT_SECONDS or session.last_used_at is None:
+            return False
+        last_used = session.last_used_at.timestamp()
+        pending = SESSION_ACTIVITY.last_seen(session.id)
+        if pending is not None:
+            last_used = max(last_used, pending)
+        return dt.datetime.now(dt.timezone.utc).timestamp() - last_used > settings.SESSION_IDLE_TIMEOUT_SECONDS
+
+    async def _validate_stateless_token(self, check_access_token_data: CheckSessionAccessToken) -> OutSession:
+        """Проверка подписанного токена (v1.*) без БД: подпись, срок, пользователь, подсеть IP, отзыв"""
+        access_token = check_access_token_data.access_token
+        claims = verify_access_token(access_token)
+        if claims is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Отсутствует данные")
+
+        if claims.get("uid") != check_access_token_data.user_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ошибка целостности данных")
+
+        if not ip_matches(claims, check_access_token_data.ip_address):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ошибка целостности данных")
+
+        try:
+            revoked = await is_session_revoked(claims["sid"], access_token)
+        except RedisError as e:
+            # без списка отзыва статус сессии берём из БД
+            logging.warning("Redis недоступен, проверка access токена по БД: %s", e)
+            try:
+                async with self.uow:
+                    session = await self.uow.sessions.get_by_access_token_session(access_token)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Внутренняя ошибка сервера: {str(e)}"
+                )
+            revoked = session is None
+
+        if revoked:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Отсутствует данные")
+
+        SESSION_ACTIVITY.touch(claims["sid"])
+        return OutSession(
+            id=claims["sid"],
+            user_id=claims["uid"],
+            client_id=claims.get("cid"),
+            access_token=access_token,
+            is_active=True,
+        )
+
     async def validate_access_token_session(self, check_access_token_data: CheckSessionAccessToken) -> Optional[
         OutSession]:
+        if is_stateless_token(check_access_token_data.access_token):
+            return await self._validate_stateless_token(check_access_token_data)
+
         try:
             async with self.uow:
 
@@ -171,6 +269,10 @@ class SqlAlchemyServiceSession(AsyncSessionService):
                     if current_ip not in session_net:
                         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ошибка целостности данных")
 
+                if self._is_idle(session):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Отсутствует данные")
+                SESSION_ACTIVITY.touch(session.id)
+
                 # timestamp = str(time()).encode()
                 #
                 # session.access_token = hashlib.sha256(timestamp).hexdigest()
@@ -200,58 +302,97 @@ class SqlAlchemyServiceSession(AsyncSessionService):
 
         return session
 
+    @classmethod
+    def _introspect_one(cls, item: CheckSessionAccessToken, session: Optional[OutSession],
+                        role_name: Optional[str], with_roles: bool) -> OutTokenIntrospection:
+        """Те же проверки, что в validate_access_token_session, но без исключений — результат на токен"""
+        def _invalid(error: str) -> OutTokenIntrospection:
+            return OutTokenIntrospection(access_token=item.access_token, valid=False, error=error)
+
+        if session is None:
+            return _invalid("Отсутствует данные")
+        if session.user_id != item.user_id:
+            return _invalid("Ошибка целостности данных")
+
+        if is_stateless_token(item.access_token):
+            claims = verify_access_token(item.access_token)
+            if claims is None or not ip_matches(claims, item.ip_address):
+                return _invalid("Ошибка целостности данных")
+        elif session.ip_address and item.ip_address:
+            try:
+                session_net = ipaddress.ip_network(f"{session.ip_address}/24", strict=False)
+                if ipaddress.ip_address(item.ip_address) not in session_net:
+                    return _invalid("Ошибка целостности данных")
+            except ValueError:
+                return _invalid("Ошибка целостности данных")
+
+        # простаивающую сессию не продлеваем: отметка активности только у действительной
+        if cls._is_idle(session):
+            return _invalid("Отсутствует данные")
+        SESSION_ACTIVITY.touch(session.id)
+        return OutTokenIntrospection(
+            access_token=item.access_token,
+            valid=True,
+            session_id=session.id,
+            user_id=session.user_id,
+            client_id=session.client_id,
+            role_name=role_name if with_roles else None,
+            is_admin=(role_name in ADMIN_ROLES) if with_roles else None,
+        )
+
+    async def introspect_access_tokens(self, batch: BatchCheckAccessToken) -> OutBatchIntrospection:
+        """
+        Пакетная проверка access токенов для внутренних сервисов: все токены и роли их владельцев
+        одним запросом, результат по каждому токену в порядке запроса
+        """
+        if len(batch.items) > settings.SESSION_INTROSPECTION_BATCH_MAX:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Не более {settings.SESSION_INTROSPECTION_BATCH_MAX} токенов за запрос"
+            )
+
+        # подписанные токены с неверной подписью или истёкшие в БД не ищем
+        tokens = {
+            item.access_token for item in batch.items
+            if not is_stateless_token(item.access_token) or verify_access_token(item.access_token) is not None
+        }
+        try:
+            async with self.uow:
+                found = await self.uow.sessions.get_active_by_access_tokens(list(tokens))
+        except HTTPException:
+            # просто пробрасываем дальше, чтобы не превращать в 500
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Внутренняя ошибка сервера: {str(e)}"
+            )
+
+        results = []
+        for item in batch.items:
+            session, role_name = found.get(item.access_token, (None, None))
+            results.append(self._introspect_one(item, session, role_name, batch.with_roles))
+        return OutBatchIntrospection(results=results)
+
     async def validate_refresh_token_session(
             self, check_refresh_token_data: CheckSessionRefreshToken
     ) -> OutSession:
         try:
             async with self.uow:
-                session = await self.uow.sessions.get_by_id_user_session(check_refresh_token_data.user_id)
-                if session is None:
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Отсутствует данные")
-
-                # важная проверка на клиента
-                client_data_oauth: Optional[OutOauthClient] = await self.uow.oauth_clients.get_by_client_id_oauth(
-                    check_refresh_token_data.oauth_client)
-
-                if client_data_oauth is None:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Клиента с таким наименованием нету"
-                    )
-
-                refresh_datas = await self.refresh_service.get_by_id_session_refresh(session.id)
-
-                if not refresh_datas:
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Отсутствует данные")
-
-                # создаём задачи для параллельной проверки токенов
-                tasks = [
-                    self.refresh_service.check(rd.id, check_refresh_token_data.refresh_token)
-                    for rd in refresh_datas if not rd.revoked
-                ]
-
-                # запускаем все проверки параллельно
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                # берём первый успешный токен
-                refresh_data: Optional[OutRefreshToken] = None
-                for r in results:
-                    if isinstance(r, HTTPException):
-                        continue
-                    refresh_data = r
-                    break
-
-                if refresh_data is None:
+                # токен, сессия, пользователь и клиент проверяются и токен ротируется одним запросом
+                rotated = await self.uow.refresh_tokens.rotate_refresh_token(
+                    token_hash=hashlib.sha256(check_refresh_token_data.refresh_token.encode()).hexdigest(),
+                    user_id=check_refresh_token_data.user_id,
+                    oauth_client=check_refresh_token_data.oauth_client,
+                )
+                if rotated is None:
                     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
-                                        detail=f"Нет действительного refresh токена -- {print([r for r in results])}")
-
-                # Проверка пользователя
-                if session.user_id != check_refresh_token_data.user_id:
-                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Ошибка целостности данных")
+                                        detail="Нет действительного refresh токена")
+                session, refresh_data = rotated
 
+                # Проверки ниже откатывают ротацию: исключение внутри uow -> rollback
                 # Проверка IP
                 if session.ip_address and check_refresh_token_data.ip_address:
-                    import ipaddress
                     session_net = ipaddress.ip_network(f"{session.ip_address}/24", strict=False)
                     current_ip = ipaddress.ip_address(check_refresh_token_data.ip_address)
                     if current_ip not in session_net:
@@ -264,6 +405,15 @@ class SqlAlchemyServiceSession(AsyncSessionService):
 
                 # Подставляем «живой» токен
                 session.refresh_token = refresh_data.token_hash
+
+                if settings.ACCESS_TOKEN_STATELESS:
+                    # подписанный access токен ограничен по сроку — при продлении выдаём новый
+                    reissued = await self.uow.sessions.reissue_access_token(session.id)
+                    if reissued is None:
+                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Отсутствует данные")
+                    # прежний токен отзываем до коммита: при недоступном Redis ротация откатится
+                    await self._revoke_access_token(session.id, session.access_token)
+                    session.access_token = reissued.access_token
         except HTTPException:
             # просто пробрасываем дальше, чтобы не превращать в 500
             raise
@@ -325,6 +475,8 @@ class SqlAlchemyServiceSession(AsyncSessionService):
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail="Ошибка целостности данных"
                     )
+
+                await self._revoke_tokens(session.id, logout_data.access_token)
         except HTTPException:
             # просто пробрасываем дальше, чтобы не превращать в 500
             raise
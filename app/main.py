@@ -1,17 +1,24 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import importlib
-import importlib.util
 import json
 import logging
 import os
-import pkgutil
-import sys
-import time
 import traceback
 from contextlib import asynccontextmanager
-from pathlib import Path
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.idempotency import IdempotencyGuard, load_routes as load_idempotency_routes
+from app.core.metrics import HTTP_REQUEST_DURATION, render_metrics
+from app.core.rate_limit import RateLimiter, load_rules
+from app.core.route_manifest import load_route_manifest, discover_route_modules
+from app.core.sql_profiler import start_profile, stop_profile
 
 logger = logging.getLogger("uvicorn")
 logger.setLevel(logging.DEBUG)
@@ -20,12 +27,35 @@ logger.setLevel(logging.DEBUG)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 🚀 выполняется при старте
-    import_all_routes(app, "app.handlers")
+    lifespan_started = time.perf_counter()
+    routes_report = import_all_routes(app, "app.handlers")
+
+    mail_worker = None
+    if settings.MAIL_OUTBOX_ENABLED:
+        from app.core.mail_outbox import MailOutboxWorker
+        mail_worker = MailOutboxWorker()
+        mail_worker.start()
+
+    session_activity = None
+    if settings.SESSION_ACTIVITY_ENABLED:
+        from app.handlers.session.activity import SESSION_ACTIVITY
+        session_activity = SESSION_ACTIVITY
+        session_activity.start()
+
+    log_startup_report(routes_report, lifespan_started)
 
     yield  # ← здесь приложение работает
 
     # 🛑 выполняется при завершении
     # можно добавить, например, закрытие соединений с БД
+    from app.core.redis import close_redis
+    from app.core.outbound import close_http_session
+    if mail_worker is not None:
+        await mail_worker.stop()
+    if session_activity is not None:
+        await session_activity.stop()
+    await close_redis()
+    await close_http_session()
 
 
 app = FastAPI(
@@ -159,60 +189,122 @@ async def simple_logger_middleware(request: Request, call_next):
         raise
 
 
-def import_all_routes(app: FastAPI, package_name: str):
-    logger = __import__("logging").getLogger("uvicorn")
-
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
     try:
-        pkg = importlib.import_module(package_name)
-    except ModuleNotFoundError as e:
-        logger.warning(f"Пакет {package_name} не найден: {e}")
-        logger.debug("sys.path:\n" + "\n".join(repr(p) for p in sys.path))
-        return
-    except Exception as e:
-        logger.error(f"Ошибка при импорте пакета {package_name}: {e}\n{traceback.format_exc()}")
-        return
-
-    # логируем путь, по которому пакет найден
-    if not hasattr(pkg, "__path__"):
-        logger.warning(f"{package_name} не является пакетом (нет __path__)")
-        return
-
-    pkg_paths = list(pkg.__path__)  # может быть несколько
-    logger.info(f"{package_name}.__path__: {pkg_paths}")
-
-    # для отладки — покажем содержимое каждой папки в __path__
-    for p in pkg_paths:
-        try:
-            p_path = Path(p).resolve()
-            listing = sorted([x.name for x in p_path.iterdir()])
-            logger.info(f"Содержимое {p_path}: {listing}")
-        except Exception as e:
-            logger.warning(f"Не удалось прочитать {p}: {e}")
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # шаблон маршрута (/payment/get_by_id), а не сырой путь — иначе метки разрастаются
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or "<unmatched>"
+        HTTP_REQUEST_DURATION.labels(request.method, route_path, str(status_code)).observe(
+            time.perf_counter() - start
+        )
+
+
+if settings.RATE_LIMIT_ENABLED:
+    rate_limiter = RateLimiter(load_rules())
+
+    @app.middleware("http")
+    async def rate_limit_middleware(request: Request, call_next):
+        decision = await rate_limiter.check(request)
+        if decision is None:
+            return await call_next(request)
+        if not decision.allowed:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Слишком много запросов, повторите позже"},
+                headers=decision.headers(),
+            )
+        response = await call_next(request)
+        response.headers.update(decision.headers())
+        return response
 
-    # перечисляем подмодули (папки/файлы) и пытаемся импортировать {package}.{name}.router
-    for finder, name, ispkg in pkgutil.iter_modules(pkg.__path__):
-        module_name = f"{package_name}.{name}.router"
-        logger.debug(f"Попытка импортировать: {module_name} (ispkg={ispkg})")
+
+if settings.IDEMPOTENCY_ENABLED:
+    # объявлен после лимитера — выполняется раньше него, повторы не расходуют лимит
+    idempotency_guard = IdempotencyGuard(load_idempotency_routes())
+
+    @app.middleware("http")
+    async def idempotency_middleware(request: Request, call_next):
+        return await idempotency_guard.dispatch(request, call_next)
+
+
+if settings.SQL_PROFILER_ENABLED:
+    @app.middleware("http")
+    async def sql_profiler_middleware(request: Request, call_next):
+        profile, token = start_profile()
         try:
-            # быстрый pre-check: есть ли spec?
-            spec = importlib.util.find_spec(module_name)
-            if spec is None:
-                logger.debug(f"find_spec вернул None для {module_name}")
-            else:
-                logger.debug(f"spec.origin={getattr(spec, 'origin', None)}; loader={getattr(spec, 'loader', None)}")
+            response = await call_next(request)
+        finally:
+            stop_profile(token)
+
+        repeated = profile.repeated(settings.SQL_PROFILER_REPEAT_THRESHOLD)
+        response.headers["X-DB-Query-Count"] = str(profile.count)
+        response.headers["X-DB-Time-Ms"] = f"{profile.total_time * 1000:.1f}"
+        if repeated:
+            response.headers["X-DB-N-Plus-One"] = str(len(repeated))
+            logger.warning(
+                "Возможный N+1: %s %s — %s запросов за %.1f мс; повторы: %s",
+                request.method, request.url.path, profile.count, profile.total_time * 1000,
+                "; ".join(f"{n}x {fp[:200]}" for fp, n in repeated),
+            )
+        return response
+
 
+def import_all_routes(app: FastAPI, package_name: str) -> dict:
+    """
+    Подключает роутеры {package}.{name}.router. Список модулей берётся из манифеста,
+    собранного при сборке образа (app/core/route_manifest.py), иначе — сканированием каталога.
+    Возвращает отчёт для лога старта: источник списка и время импорта каждого модуля.
+    """
+    modules = load_route_manifest(package_name)
+    source = "manifest"
+    if modules is None:
+        modules = discover_route_modules(package_name)
+        source = "scan"
+
+    timings = {}
+    for module_name in modules:
+        start = time.perf_counter()
+        try:
             module = importlib.import_module(module_name)
-            if hasattr(module, "router"):
-                app.include_router(module.router)
-                logger.info(f"✅ Подключен роутер: {module_name} → {module.router}")
-            else:
-                logger.warning(f"Модуль {module_name} импортирован, но не содержит 'router'")
         except ModuleNotFoundError as e:
             # подробный лог, чтоб понять, какой именно модуль не найден (имя в e.name)
             logger.warning(f"ModuleNotFoundError при импорте {module_name}: {e}; e.name={getattr(e, 'name', None)}")
             logger.debug(traceback.format_exc())
+            continue
         except Exception as e:
             logger.error(f"[import_all_routes] Ошибка при импорте {module_name}: {e}\n{traceback.format_exc()}")
+            continue
+        timings[module_name] = time.perf_counter() - start
+
+        if hasattr(module, "router"):
+            app.include_router(module.router)
+            logger.debug(f"Подключен роутер: {module_name}")
+        else:
+            logger.warning(f"Модуль {module_name} импортирован, но не содержит 'router'")
+
+    return {"source": source, "timings": timings}
+
+
+def log_startup_report(routes_report: dict, lifespan_started: float) -> None:
+    now = time.perf_counter()
+    timings = routes_report["timings"]
+    slowest = sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:3]
+    logger.info(
+        "Старт: %.0f мс с импорта app.main (импорт модуля %.0f мс, lifespan %.0f мс); "
+        "роутеров %s (%s) за %.0f мс; самые долгие: %s",
+        (now - _IMPORT_STARTED) * 1000,
+        (_IMPORT_FINISHED - _IMPORT_STARTED) * 1000,
+        (now - lifespan_started) * 1000,
+        len(timings), routes_report["source"], sum(timings.values()) * 1000,
+        ", ".join(f"{name.rsplit('.', 2)[-2]} {t * 1000:.0f} мс" for name, t in slowest) or "-",
+    )
 
 
 @app.get("/")
@@ -220,6 +312,15 @@ async def root():
     return {"message": "Hello World"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+_IMPORT_FINISHED = time.perf_counter()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,143 @@
+"""
+Подписанные access токены: v1.<claims>.<подпись HMAC-SHA256>.
+
+В claims — uid, sid (id сессии), cid (id OAuth клиента), net (подсеть IP, к которой привязан
+токен) и exp. Проверка подписи и срока идёт в процессе, без запроса в БД.
+
+Отзыв (logout / закрытие сессии) — ключ session:revoked:<sid> в Redis с TTL, равным сроку
+жизни токена: после exp токен недействителен и без него, поэтому список не растёт. Прежний
+токен живой сессии (после выдачи нового по refresh) отзывается отдельно — ключ
+token:revoked:<sha256 токена> до его exp.
+"""
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+PREFIX = "v1."
+REVOKED_KEY_PREFIX = "session:revoked"
+REVOKED_TOKEN_KEY_PREFIX = "token:revoked"
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@lru_cache(maxsize=1)
+def _keys() -> List[bytes]:
+    # отдельный ключ от TOKEN_SECRET, чтобы подписи не пересекались с itsdangerous токенами;
+    # первый — текущий (им подписываем), остальные принимаются после ротации
+    secrets = [settings.TOKEN_SECRET, *reversed(settings.TOKEN_SECRET_FALLBACKS)]
+    return [hashlib.sha256(b"access-token:" + s.encode()).digest() for s in secrets]
+
+
+def _signature(key: bytes, body: str) -> bytes:
+    return hmac.new(key, body.encode("ascii"), hashlib.sha256).digest()
+
+
+def ip_prefix(ip: Optional[str]) -> Optional[str]:
+    """Подсеть, к которой привязывается токен: /24 для IPv4, /64 для IPv6"""
+    if not ip:
+        return None
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        # адрес клиента не IP (testclient, unix сокет, имя прокси) — токен без привязки к подсети
+        return None
+    prefix = 24 if addr.version == 4 else 64
+    return str(ipaddress.ip_network(f"{addr}/{prefix}", strict=False))
+
+
+def is_stateless_token(token: Optional[str]) -> bool:
+    return bool(token) and token.startswith(PREFIX)
+
+
+def mint_access_token(user_id: int, session_id: int, client_id: Optional[int], ip: Optional[str]) -> str:
+    now = int(time.time())
+    claims = {
+        "uid": user_id,
+        "sid": session_id,
+        "cid": client_id,
+        "net": ip_prefix(ip),
+        "iat": now,
+        "exp": now + settings.ACCESS_TOKEN_TTL_SECONDS,
+    }
+    body = PREFIX + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{body}.{_b64encode(_signature(_keys()[0], body))}"
+
+
+def verify_access_token(token: str) -> Optional[Dict[str, Any]]:
+    """Вернёт claims, если подпись верна и токен не истёк; иначе None"""
+    body, sep, sig = token.rpartition(".")
+    if not sep or not body.startswith(PREFIX):
+        return None
+    try:
+        signature = _b64decode(sig)
+        if not any(hmac.compare_digest(signature, _signature(key, body)) for key in _keys()):
+            return None
+        claims = json.loads(_b64decode(body[len(PREFIX):]))
+    except ValueError:
+        return None
+    if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+def ip_matches(claims: Dict[str, Any], ip: Optional[str]) -> bool:
+    net = claims.get("net")
+    if not net or not ip:
+        return True
+    try:
+        return ipaddress.ip_address(ip) in ipaddress.ip_network(net)
+    except ValueError:
+        return False
+
+
+def _revoked_key(session_id: int) -> str:
+    return f"{REVOKED_KEY_PREFIX}:{session_id}"
+
+
+async def revoke_session_tokens(session_id: int) -> None:
+    await get_redis().set(_revoked_key(session_id), 1, ex=settings.ACCESS_TOKEN_TTL_SECONDS)
+
+
+async def revoke_many_session_tokens(session_ids: List[int]) -> None:
+    """Отзыв токенов нескольких сессий одним обращением к Redis (pipeline)"""
+    if not session_ids:
+        return
+    pipe = get_redis().pipeline(transaction=False)
+    for session_id in session_ids:
+        pipe.set(_revoked_key(session_id), 1, ex=settings.ACCESS_TOKEN_TTL_SECONDS)
+    await pipe.execute()
+
+
+def _revoked_token_key(token: str) -> str:
+    return f"{REVOKED_TOKEN_KEY_PREFIX}:{hashlib.sha256(token.encode()).hexdigest()}"
+
+
+async def revoke_access_token(token: str) -> None:
+    """Отзывает один подписанный токен (сессия остаётся активной)"""
+    claims = verify_access_token(token)
+    if claims is None:
+        return  # подпись неверна или срок истёк — токен и так не примут
+    ttl = int(claims["exp"] - time.time()) + 1
+    await get_redis().set(_revoked_token_key(token), 1, ex=max(ttl, 1))
+
+
+async def is_session_revoked(session_id: int, token: Optional[str] = None) -> bool:
+    """Отозвана ли сессия целиком или (если передан) сам токен — одним запросом в Redis"""
+    keys = [_revoked_key(session_id)]
+    if token is not None:
+        keys.append(_revoked_token_key(token))
+    return bool(await get_redis().exists(*keys))
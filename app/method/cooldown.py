@@ -0,0 +1,52 @@
+"""
+Cooldown на действия пользователя в Redis: один ключ на (действие, субъект) с TTL, равным
+периоду ожидания. Проверка и захват — одна команда SET NX EX, поэтому два параллельных
+запроса не пройдут оба.
+
+В значении ключа хранится время начала cooldown — его можно вернуть клиенту
+(«следующий купон после ...») без обращения к БД.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.redis import get_redis
+
+KEY_PREFIX = "cooldown"
+
+
+def _key(action: str, subject) -> str:
+    return f"{KEY_PREFIX}:{action}:{subject}"
+
+
+async def acquire_cooldown(action: str, subject, seconds: int) -> Optional[datetime]:
+    """
+    Пытается начать cooldown.
+    :return: None — действие разрешено и cooldown запущен; datetime — cooldown уже идёт с этого момента
+    """
+    redis = get_redis()
+    now = datetime.now(timezone.utc)
+    key = _key(action, subject)
+    if await redis.set(key, now.isoformat(), nx=True, ex=seconds):
+        return None
+
+    started = await redis.get(key)
+    # ключ мог истечь между SET и GET — считаем, что cooldown только что начался
+    return datetime.fromisoformat(started) if started else now
+
+
+async def set_cooldown(action: str, subject, started_at: datetime, seconds: int) -> None:
+    """Выставляет cooldown, начавшийся в started_at (например, восстановленный по данным БД)"""
+    remaining = int(seconds - (datetime.now(timezone.utc) - started_at).total_seconds())
+    if remaining > 0:
+        await get_redis().set(_key(action, subject), started_at.isoformat(), ex=remaining)
+
+
+async def release_cooldown(action: str, subject) -> None:
+    """Снимает cooldown — если действие, под которое он был взят, не выполнилось"""
+    await get_redis().delete(_key(action, subject))
+
+
+async def cooldown_retry_after(action: str, subject) -> int:
+    """Сколько секунд осталось до конца cooldown (0 — нет cooldown)"""
+    ttl = await get_redis().ttl(_key(action, subject))
+    return max(ttl, 0)
@@ -4,11 +4,16 @@ import bisect
 from typing import List, Tuple, Dict, Optional
 import asyncio
 
+ALPHABET = string.ascii_uppercase + string.digits
+# байты >= _CODE_BYTE_LIMIT отбрасываем, иначе b % 36 смещает распределение в пользу первых символов
+_CODE_BYTE_LIMIT = 256 - 256 % len(ALPHABET)
+
 
 class PromoGenerator:
     """
     Генератор промокодов с весами, переведённый на шкалу 1..10000.
     По умолчанию чаще выдаёт процентные купоны и реже — крупные фиксированные суммы.
+    Экземпляр после создания не меняется — используйте общий PROMO_GENERATOR.
     """
 
     def __init__(
@@ -20,8 +25,8 @@ class PromoGenerator:
             code_len: int = 8,  # длина строки промокода
     ):
         assert 0.0 <= pct_category_share <= 1.0
-        self.percents = list(percents)
-        self.fixed = list(fixed)
+        self.percents = tuple(percents)
+        self.fixed = tuple(fixed)
         self.pct_category_share = pct_category_share
         self.total_scale = total_scale
         self.code_len = code_len
@@ -71,14 +76,59 @@ class PromoGenerator:
             cum.append(s)
 
         # Сохраняем
-        self._entries = [(entries[i][0], entries[i][1]) for i in range(len(entries))]
-        self._thresholds = cum  # длина == len(_entries)
+        self._entries = tuple((entries[i][0], entries[i][1]) for i in range(len(entries)))
+        self._thresholds = tuple(cum)  # длина == len(_entries)
         # Проста защита на случай краевых ошибок
         assert self._thresholds[-1] == self.total_scale
+        # для веса берём 2 байта (0..65535) и отбрасываем хвост, не кратный total_scale
+        self._weight_limit = 65536 - 65536 % self.total_scale
+
+    def _codes_from_bytes(self, raw: bytes, n: int) -> List[str]:
+        """Отображает байты на алфавит с отбраковкой; если байтов не хватило — добирает"""
+        chars = [ALPHABET[b % len(ALPHABET)] for b in raw if b < _CODE_BYTE_LIMIT]
+        need = n * self.code_len
+        while len(chars) < need:
+            chars.extend(ALPHABET[b % len(ALPHABET)] for b in secrets.token_bytes(need - len(chars) + 8)
+                         if b < _CODE_BYTE_LIMIT)
+        joined = ''.join(chars[:need])
+        return [joined[i:i + self.code_len] for i in range(0, need, self.code_len)]
+
+    def _weights_from_bytes(self, raw: bytes, n: int) -> List[int]:
+        """Случайные числа 1..total_scale из пар байт с отбраковкой"""
+        values = [v % self.total_scale + 1
+                  for v in (int.from_bytes(raw[i:i + 2], "big") for i in range(0, len(raw) - 1, 2))
+                  if v < self._weight_limit]
+        while len(values) < n:
+            v = int.from_bytes(secrets.token_bytes(2), "big")
+            if v < self._weight_limit:
+                values.append(v % self.total_scale + 1)
+        return values[:n]
+
+    def generate_batch(self, n: int) -> List[Dict[str, object]]:
+        """
+        Генерирует n купонов за один вызов secrets.token_bytes.
+        Коды внутри пачки могут совпасть (36^8 вариантов) — уникальность проверяет вызывающая сторона.
+        """
+        if n <= 0:
+            return []
+        # запас ~3% на отбраковку: для кода теряется 4/256 байт, для веса — 5536/65536 пар
+        code_bytes = n * self.code_len + n * self.code_len // 32 + 8
+        weight_bytes = 2 * (n + n // 8 + 4)
+        raw = secrets.token_bytes(code_bytes + weight_bytes)
+
+        codes = self._codes_from_bytes(raw[:code_bytes], n)
+        weights = self._weights_from_bytes(raw[code_bytes:], n)
 
-    def _make_code(self) -> str:
-        alphabet = string.ascii_uppercase + string.digits
-        return ''.join(secrets.choice(alphabet) for _ in range(self.code_len))
+        batch = []
+        for code, r in zip(codes, weights):
+            cat, val = self._entries[bisect.bisect_left(self._thresholds, r)]
+            batch.append({
+                "type": cat,
+                "value": val,
+                "code": code,
+                "meta": {"raw_random": r}
+            })
+        return batch
 
     async def generate(self) -> Dict[str, object]:
         """
@@ -91,16 +141,8 @@ class PromoGenerator:
         }
         """
         # не блокирующая операция, но помечаем async для интеграции в event loop
-        # Используем криптографический генератор для веса (secrets)
-        r = secrets.randbelow(self.total_scale) + 1  # 1..total_scale
-        idx = bisect.bisect_left(self._thresholds, r)
-        cat, val = self._entries[idx]
-        code = self._make_code()
-        # Если нужно — можно сделать разные форматы кода в зависимости от типа:
-        # e.g. P-XXXXXXX для процентов, F-XXXXXXX для fixed. Оставлю простой код.
-        return {
-            "type": cat,
-            "value": val,
-            "code": code,
-            "meta": {"raw_random": r}
-        }
+        return self.generate_batch(1)[0]
+
+
+# Общий экземпляр: таблица весов строится один раз на процесс
+PROMO_GENERATOR = PromoGenerator()
@@ -0,0 +1,30 @@
+from functools import lru_cache
+from typing import Any, Optional
+
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+from app.core.config import settings
+
+
+@lru_cache(maxsize=None)
+def get_serializer(salt: str) -> URLSafeTimedSerializer:
+    """
+    Сериализатор на соль, создаётся один раз на процесс.
+    Ключи: старые из TOKEN_SECRET_FALLBACKS + текущий TOKEN_SECRET — подписываем последним,
+    проверяем любым, поэтому после ротации секрета выданные ссылки продолжают работать.
+    """
+    return URLSafeTimedSerializer([*settings.TOKEN_SECRET_FALLBACKS, settings.TOKEN_SECRET], salt=salt)
+
+
+def sign(payload: Any, salt: str) -> str:
+    return get_serializer(salt).dumps(payload)
+
+
+def unsign(token: str, salt: str, max_age: int) -> Optional[Any]:
+    """Вернёт данные токена, если подпись верна и токен не просрочен; иначе None"""
+    try:
+        return get_serializer(salt).loads(token, max_age=max_age)
+    except SignatureExpired:
+        return None  # токен просрочен
+    except BadSignature:
+        return None  # неверная подпись / модифицирован
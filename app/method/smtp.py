@@ -1,11 +1,17 @@
 import os
 import asyncio
+import logging
 from email.message import EmailMessage
-from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 import aiosmtplib
 from typing import Optional
 
+from redis.exceptions import RedisError
+
 from app.core.config import settings
+from app.core.mail_outbox import enqueue_email
+from app.method.signing import sign, unsign
+
+logger = logging.getLogger("uvicorn")
 
 # === Настройки (лучше читать из переменных окружения) ===
 SMTP_HOST = settings.SMTP_HOST
@@ -21,21 +27,22 @@ TOKEN_SALT = settings.TOKEN_SALT
 
 
 # === Генерация / проверка токена ===
-def generate_confirmation_token(new_email: str) -> str:
-    s = URLSafeTimedSerializer(TOKEN_SECRET)
-    return s.dumps(new_email, salt=TOKEN_SALT)
+def generate_confirmation_token(new_email: str, user_id: int) -> str:
+    # id пользователя подписывается вместе с адресом — uid в ссылке нельзя подменить
+    return sign({"uid": int(user_id), "email": new_email}, TOKEN_SALT)
 
 
-def confirm_token(token: str, expiration: int = 3600) -> Optional[str]:
-    """Вернёт адрес email, если токен валиден и не просрочен; иначе None"""
-    s = URLSafeTimedSerializer(TOKEN_SECRET)
-    try:
-        email = s.loads(token, salt=TOKEN_SALT, max_age=expiration)
-    except SignatureExpired:
-        return None  # токен просрочен
-    except BadSignature:
-        return None  # неверная подпись / модифицирован
-    return email
+def confirm_token(token: str, expiration: int = 3600) -> Optional[dict]:
+    """
+    Вернёт {"uid": ..., "email": ...}, если токен валиден и не просрочен; иначе None.
+    Токены старого формата (подписан только email) возвращаются с uid=None.
+    """
+    data = unsign(token, TOKEN_SALT, max_age=expiration)
+    if isinstance(data, str):
+        return {"uid": None, "email": data}
+    if isinstance(data, dict) and data.get("email"):
+        return data
+    return None
 
 
 # === Функция отправки письма (асинхронно) ===
@@ -44,8 +51,8 @@ async def send_email_async(
     subject: str,
     plain_text: str,
     html_text: Optional[str] = None,
-    smtp_host: str = "smtp.timeweb.ru",
-    smtp_port: int = 465,
+    smtp_host: str = SMTP_HOST,
+    smtp_port: int = SMTP_PORT,
     username: str = SMTP_USERNAME,
     password: str = SMTP_PASSWORD,
     from_address: str = FROM_ADDRESS,
@@ -61,11 +68,11 @@ async def send_email_async(
     smtp = aiosmtplib.SMTP(
         hostname=smtp_host,
         port=smtp_port,
-        use_tls=True,      # 🔑 ОБЯЗАТЕЛЬНО
+        use_tls=smtp_port == 465,  # 465 — SSL сразу, 587 — STARTTLS
         timeout=60,
     )
 
-    await smtp.connect()      # SSL сразу
+    await smtp.connect()
     await smtp.login(username, password)
     await smtp.send_message(msg)
     await smtp.quit()
@@ -73,7 +80,7 @@ async def send_email_async(
 
 # === Утилита: отправить письмо-подтверждение при смене email ===
 async def send_confirmation_email_for_change(user_id: str, new_email: str):
-    token = generate_confirmation_token(new_email)
+    token = generate_confirmation_token(new_email, int(user_id))
     confirm_link = f"{CONFIRMATION_BASE_URL}?token={token}&uid={user_id}"
 
     subject = "Подтверждение смены адреса электронной почты"
@@ -95,6 +102,14 @@ async def send_confirmation_email_for_change(user_id: str, new_email: str):
       </body>
     </html>
     """
+    if settings.MAIL_OUTBOX_ENABLED:
+        try:
+            # отправит фоновый воркер — ответ эндпоинта не ждёт SMTP
+            await enqueue_email(to_address=new_email, subject=subject, plain_text=plain, html_text=html)
+            return
+        except RedisError as e:
+            logger.warning("Очередь писем недоступна, отправляем сразу: %s", e)
+
     await send_email_async(
         to_address=new_email,
         subject=subject,
@@ -8,7 +8,7 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     func,
-    text, UniqueConstraint,
+    text, UniqueConstraint, Index,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
@@ -19,6 +19,16 @@ from app.db.base import Base
 
 class CouponUser(Base):
     __tablename__ = "coupon_user"
+    __table_args__ = (
+        # частичный уникальный индекс: код уникален среди активных купонов,
+        # по нему же идёт погашение (UPDATE ... WHERE token_hash = :code AND is_active)
+        Index(
+            "uq_coupon_user_active_token_hash",
+            "token_hash",
+            unique=True,
+            postgresql_where=text("is_active"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
 
@@ -13,7 +13,7 @@ from sqlalchemy import (
     func,
     text,
     Numeric,
-    Index, Integer,
+    Index, Integer, UniqueConstraint,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -29,6 +29,8 @@ class Wallet(Base):
         ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False
     )
+    # снимок баланса: сумма уже свёрнутых записей wallet_entries (compacted = true).
+    # Текущий баланс = balance + сумма несвёрнутых записей (WalletRepository)
     balance: Mapped[Decimal] = mapped_column(Numeric(12, 2), nullable=False, default=Decimal("0.00"))
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),
                                                  onupdate=func.now())
@@ -46,20 +48,59 @@ class Wallet(Base):
     )
 
 
+class WalletEntry(Base):
+    """
+    Журнал изменений баланса (только добавление). Зачисления и списания — вставки, без блокировки
+    строки wallets; фоновая свёртка переносит суммы записей в wallets.balance и помечает их compacted.
+    """
+    __tablename__ = "wallet_entries"
+    __table_args__ = (
+        # повтор операции с тем же ключом (вебхук, списание подписки, Idempotency-Key) не создаёт запись
+        UniqueConstraint("wallet_id", "idempotency_key", name="uq_wallet_entries_wallet_idempotency"),
+        # чтение баланса: сумма несвёрнутых записей кошелька без обращения к таблице
+        Index(
+            "ix_wallet_entries_pending",
+            "wallet_id",
+            postgresql_include=["amount"],
+            postgresql_where=text("NOT compacted"),
+        ),
+        Index("ix_wallet_entries_wallet_created", "wallet_id", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    wallet_id: Mapped[int] = mapped_column(
+        ForeignKey("wallets.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    # со знаком: зачисление > 0, списание < 0
+    amount: Mapped[Decimal] = mapped_column(Numeric(12, 2), nullable=False)
+    reason: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    compacted: Mapped[bool] = mapped_column(Boolean, nullable=False, server_default=text("false"))
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class Payments(Base):
     __tablename__ = "payments"
     __table_args__ = (
         # составной индекс для быстрого поиска "открытых" транзакций по user + status
         Index("idx_payments_user_status", "user_id", "status"),
+        # последние платежи пользователя (get_payments_by_user_id_last) — по индексу в каждой партиции
+        Index("idx_payments_user_created", "user_id", "created_at"),
 
         # частичный уникальный индекс: уникальность только для ненулевых ключей
         # (предотвращает дублирование idempotency_key, но позволяет NULL)
+        # В партиционированной таблице уникальный индекс обязан включать ключ партиции,
+        # поэтому в нём есть created_at; уникальность самого ключа — в payment_idempotency
         Index(
             "uq_payments_idempotency_not_null",
             "idempotency_key",
+            "created_at",
             unique=True,
             postgresql_where=text("idempotency_key IS NOT NULL")
         ),
+        # помесячные партиции по created_at (app/core/partitions.py)
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     id: Mapped[uuid.UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -79,7 +120,7 @@ class Payments(Base):
     currency: Mapped[str] = mapped_column(String(3), nullable=False, default="RUB")
     status: Mapped[str] = mapped_column(String(32), nullable=False,
                                         default="INIT")  # INIT, CREATED, PENDING, SUCCEEDED, FAILED, CANCELED
-    idempotency_key: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, unique=True, index=True)
+    idempotency_key: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
     yookassa_payment_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True, index=True)
     confirmation_url: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     confirmation_type: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
@@ -87,7 +128,9 @@ class Payments(Base):
     description: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     metadata_payments: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
     attempts: Mapped[int] = mapped_column(Integer, default=0)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # ключ партиции, поэтому входит в первичный ключ (id, created_at)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),
+                                                 primary_key=True)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),
                                                  onupdate=func.now())
     closed_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -97,6 +140,22 @@ class Payments(Base):
     wallet: Mapped["Wallet"] = relationship("Wallet", back_populates="payments", lazy="joined")
 
 
+class PaymentIdempotency(Base):
+    """
+    Уникальность ключа идемпотентности платежа. В партиционированной payments уникальный индекс
+    обязан включать created_at и не мешает повтору ключа в другой момент, поэтому ключ занимается
+    здесь — в той же транзакции, что и вставка платежа. Внешнего ключа на payments нет: старые
+    партиции отсоединяются, строки ключей удаляет retention.
+    """
+    __tablename__ = "payment_idempotency"
+
+    idempotency_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    payment_id: Mapped[uuid.UUID] = mapped_column(PG_UUID(as_uuid=True), nullable=False)
+    # created_at платежа — вместе с payment_id это первичный ключ payments
+    payment_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
 class Subtraction(Base):
     __tablename__ = "subtraction"
     __table_args__ = (
@@ -33,6 +33,8 @@ class Session(Base):
     access_token: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     ip_address: Mapped[Optional[str]] = mapped_column(String, nullable=True)
     user_agent: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # sha256 от user_agent — по (user_id, client_id, device_fingerprint) переиспользуется активная сессия
+    device_fingerprint: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
     is_active: Mapped[bool] = mapped_column(Boolean, server_default=text("true"), nullable=False)
 
@@ -71,22 +73,30 @@ class Session(Base):
     __table_args__ = (
         Index('sessions_user_id_is_active_idx', 'user_id', 'is_active'),
         Index('sessions_client_id_index', 'client_id'),
+        # одна активная сессия на пользователя, клиента и устройство — основа upsert при входе
+        Index(
+            'uq_sessions_active_device', 'user_id', 'client_id', 'device_fingerprint',
+            unique=True, postgresql_where=text("is_active"),
+        ),
     )
 
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # первичный ключ партиционированной таблицы включает ключ партиции (created_at)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
     session_id: Mapped[int] = mapped_column(BigInteger, ForeignKey("sessions.id"))
-    token_hash: Mapped[str] = mapped_column(String(255), unique=True)
+    # уникальный индекс только по token_hash в партиционированной таблице невозможен;
+    # токены — 32 случайных байта, поиск по обычному индексу
+    token_hash: Mapped[str] = mapped_column(String(255), index=True)
     expires_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
     revoked: Mapped[bool] = mapped_column(Boolean, server_default=text("false"), nullable=False)
 
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), server_default=func.now(), nullable=False
+        DateTime(timezone=True), server_default=func.now(), nullable=False, primary_key=True
     )
     used_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True), nullable=True
@@ -97,6 +107,8 @@ class RefreshToken(Base):
     # Добавляем индекс для refresh_tokens
     __table_args__ = (
         Index('refresh_tokens_session_id_index', 'session_id'),
+        # помесячные партиции по created_at (app/core/partitions.py)
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
 
@@ -0,0 +1,102 @@
+"""
+Фейковые YooKassa и OpenAI для нагрузочного стенда.
+
+Запуск: python -m benchmarks.load.fake_upstream --port 8099 --latency-ms 150
+В .env приложения под тестом:
+    OPENAI_API_URL=http://127.0.0.1:8099/v1/responses
+    YOOKASSA_API_URL=http://127.0.0.1:8099/v3
+"""
+import argparse
+import asyncio
+import random
+import uuid
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+# созданные платежи — сценарий webhook берёт отсюда idempotence_key/id
+PAYMENTS: dict[str, dict] = {}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+async def _sleep(request: web.Request) -> None:
+    latency = request.app["latency"]
+    if latency:
+        await asyncio.sleep(random.uniform(latency * 0.5, latency * 1.5))
+
+
+async def create_payment(request: web.Request) -> web.Response:
+    await _sleep(request)
+    data = await request.json()
+    payment_id = str(uuid.uuid4())
+    payment = {
+        "id": payment_id,
+        "status": "pending",
+        "paid": False,
+        "test": True,
+        "amount": data.get("amount"),
+        "description": data.get("description"),
+        "metadata": data.get("metadata") or {},
+        "recipient": {"account_id": "bench", "gateway_id": "bench"},
+        "confirmation": {
+            "type": "redirect",
+            "confirmation_url": f"http://127.0.0.1/checkout/{payment_id}",
+        },
+        "created_at": _now(),
+        "refundable": False,
+    }
+    PAYMENTS[payment_id] = payment
+    return web.json_response(payment)
+
+
+async def list_payments(request: web.Request) -> web.Response:
+    await _sleep(request)
+    return web.json_response({"type": "list", "items": list(PAYMENTS.values())[-50:]})
+
+
+async def bench_payments(request: web.Request) -> web.Response:
+    """Служебный список платежей для генерации вебхуков (без задержки)"""
+    return web.json_response(list(PAYMENTS.values()))
+
+
+async def responses(request: web.Request) -> web.Response:
+    await _sleep(request)
+    data = await request.json()
+    return web.json_response({
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(datetime.now(timezone.utc).timestamp()),
+        "model": data.get("model"),
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": "bench"}],
+        }],
+    })
+
+
+def build_app(latency_ms: int) -> web.Application:
+    app = web.Application()
+    app["latency"] = latency_ms / 1000
+    app.router.add_post("/v3/payments", create_payment)
+    app.router.add_get("/v3/payments", list_payments)
+    app.router.add_get("/_bench/payments", bench_payments)
+    app.router.add_post("/v1/responses", responses)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Фейковые внешние сервисы для нагрузочного стенда")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=int, default=150, help="средняя задержка ответа")
+    args = parser.parse_args()
+    web.run_app(build_app(args.latency_ms), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Нагрузочный прогон основных сценариев API.
+
+Порядок запуска (подробнее — benchmarks/README.md):
+    docker compose -f benchmarks/load/docker-compose.yml up -d
+    python -m benchmarks.load.fake_upstream --port 8099 &
+    SQL_PROFILER_ENABLED=true uvicorn app.main:app --port 9787 --workers 1 &
+    python -m benchmarks.load.run --setup --users 200 --concurrency 20 --subtractions 1000
+"""
+import argparse
+import asyncio
+import platform
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.load import scenarios
+from benchmarks.load.stats import print_report, save_report
+
+ALL_SCENARIOS = ["auth", "telegram", "reads", "payments", "webhooks", "coupons", "billing"]
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.setup:
+        from benchmarks.load.seed import create_schema, seed_reference
+        await create_schema()
+        await seed_reference()
+
+    selected = args.scenarios or ALL_SCENARIOS
+    results = []
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits,
+                                 headers={"User-Agent": scenarios.USER_AGENT}) as client:
+        ctx = scenarios.BenchContext(
+            client=client,
+            concurrency=args.concurrency,
+            users_count=args.users,
+            client_id=args.client_id,
+            bot_token=args.bot_token,
+            upstream_url=args.upstream_url,
+        )
+
+        # пользователи с токенами нужны почти всем HTTP сценариям
+        if set(selected) & {"auth", "reads", "payments", "webhooks", "coupons"}:
+            results += await scenarios.register_and_login(ctx)
+            if not ctx.users:
+                raise SystemExit("Не удалось зарегистрировать ни одного пользователя — проверьте стенд")
+        if "telegram" in selected:
+            results += await scenarios.telegram_register(ctx)
+        if "reads" in selected:
+            results += await scenarios.validated_reads(ctx, rounds=args.read_rounds)
+        if "payments" in selected or "webhooks" in selected:
+            results += await scenarios.payment_create(ctx)
+        if "webhooks" in selected:
+            results += await scenarios.webhook_burst(ctx, repeats=args.webhook_repeats)
+        if "coupons" in selected:
+            results += await scenarios.coupon_create_use(ctx)
+
+    if "billing" in selected:
+        results += await scenarios.nightly_billing(args.subtractions)
+
+    summaries = [r.summary() for r in results]
+    print_report(summaries)
+    if args.output:
+        save_report(args.output, summaries, meta={
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "subtractions": args.subtractions,
+            "base_url": args.base_url,
+        })
+        print(f"Отчёт сохранён: {args.output}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:9787")
+    parser.add_argument("--upstream-url", default="http://127.0.0.1:8099", help="адрес fake_upstream")
+    parser.add_argument("--scenarios", nargs="*", choices=ALL_SCENARIOS)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--read-rounds", type=int, default=5)
+    parser.add_argument("--webhook-repeats", type=int, default=2)
+    parser.add_argument("--subtractions", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--setup", action="store_true", help="создать схему и справочники стенда")
+    parser.add_argument("--client-id", default="bench")
+    parser.add_argument("--bot-token", default="123456:bench-bot-token")
+    parser.add_argument("--output", help="путь для JSON отчёта (для сравнения прогонов)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
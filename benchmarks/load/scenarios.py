@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import List, Optional, Callable, Awaitable
+from urllib.parse import urlencode
+
+import httpx
+
+from benchmarks.load.stats import ScenarioResult
+
+USER_AGENT = "glavreklama-bench/1.0"
+PASSWORD = "bench-password"
+
+
+@dataclass
+class BenchUser:
+    id: int
+    access_token: str
+    wallet_id: Optional[int] = None
+
+
+@dataclass
+class BenchContext:
+    client: httpx.AsyncClient
+    concurrency: int
+    users_count: int
+    client_id: str
+    bot_token: str
+    upstream_url: str
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex[:8])
+    users: List[BenchUser] = field(default_factory=list)
+
+
+async def _timed(result: ScenarioResult, call: Awaitable[httpx.Response]) -> httpx.Response:
+    start = time.perf_counter()
+    try:
+        response = await call
+    except httpx.HTTPError:
+        result.add(time.perf_counter() - start, 599, None)
+        raise
+    queries = response.headers.get("x-db-query-count")
+    result.add(time.perf_counter() - start, response.status_code, int(queries) if queries else None)
+    return response
+
+
+async def _run_many(ctx: BenchContext, name: str, count: int,
+                    job: Callable[[ScenarioResult, int], Awaitable[None]]) -> ScenarioResult:
+    """Выполняет count задач с ограничением по параллельности и собирает статистику"""
+    result = ScenarioResult(name)
+    semaphore = asyncio.Semaphore(ctx.concurrency)
+
+    async def _one(i: int):
+        async with semaphore:
+            try:
+                await job(result, i)
+            except httpx.HTTPError:
+                pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(count)), return_exceptions=True)
+    result.wall_time = time.perf_counter() - start
+    return result
+
+
+def _auth(user: BenchUser) -> dict:
+    return {"Authorization": f"Bearer {user.access_token}"}
+
+
+async def register_and_login(ctx: BenchContext) -> List[ScenarioResult]:
+    register = ScenarioResult("register")
+    login = ScenarioResult("login")
+    semaphore = asyncio.Semaphore(ctx.concurrency)
+
+    async def _one(i: int):
+        username = f"bench_{ctx.run_id}_{i}"
+        async with semaphore:
+            await _timed(register, ctx.client.post(
+                "/auth/register", params={"oauth_client": ctx.client_id},
+                json={"userName": username, "passUser": PASSWORD, "metaData": {"type": "executor"}},
+            ))
+            response = await _timed(login, ctx.client.post(
+                "/auth/login", params={"oauth_client": ctx.client_id},
+                json={"userName": username, "passUser": PASSWORD},
+            ))
+        if response.status_code == 200:
+            data = response.json()
+            ctx.users.append(BenchUser(id=data["userData"]["idUser"], access_token=data["tokenUser"]["access_token"]))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(ctx.users_count)), return_exceptions=True)
+    register.wall_time = login.wall_time = time.perf_counter() - start
+    return [register, login]
+
+
+def telegram_init_data(bot_token: str, tg_user_id: int, username: str) -> str:
+    """Подписывает initData так же, как это делает Telegram WebApp"""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": uuid.uuid4().hex,
+        "user": json.dumps({"id": tg_user_id, "first_name": "Bench", "username": username}, separators=(",", ":")),
+    }
+    data_check_string = "\n".join(sorted(f"{k}={v}" for k, v in fields.items()))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+async def telegram_register(ctx: BenchContext) -> List[ScenarioResult]:
+    base_id = int(time.time()) * 1000
+
+    async def job(result: ScenarioResult, i: int):
+        payload = telegram_init_data(ctx.bot_token, base_id + i, f"tg_{ctx.run_id}_{i}")
+        await _timed(result, ctx.client.post(
+            "/auth/register_provider", params={"oauth_client": ctx.client_id}, data={"payload": payload},
+        ))
+
+    return [await _run_many(ctx, "telegram_register", ctx.users_count, job)]
+
+
+async def validated_reads(ctx: BenchContext, rounds: int = 5) -> List[ScenarioResult]:
+    async def job(result: ScenarioResult, i: int):
+        user = ctx.users[i % len(ctx.users)]
+        await _timed(result, ctx.client.post(
+            "/payment/get_by_user_id", params={"user_id": user.id}, headers=_auth(user),
+        ))
+
+    return [await _run_many(ctx, "validated_reads", len(ctx.users) * rounds, job)]
+
+
+async def payment_create(ctx: BenchContext) -> List[ScenarioResult]:
+    async def wallet_job(result: ScenarioResult, i: int):
+        user = ctx.users[i]
+        response = await _timed(result, ctx.client.post(
+            "/payment/create_or_get_wallet", params={"user_id": user.id}, headers=_auth(user),
+        ))
+        if response.status_code == 200 and response.json():
+            user.wallet_id = response.json()["Id"]
+
+    wallets = await _run_many(ctx, "wallet_create_or_get", len(ctx.users), wallet_job)
+
+    async def job(result: ScenarioResult, i: int):
+        user = ctx.users[i]
+        if user.wallet_id is None:
+            return
+        await _timed(result, ctx.client.post(
+            "/payment/create_payment", headers=_auth(user),
+            params={
+                "user_id": user.id, "wallet_id": user.wallet_id, "amount": 100 + i % 7,
+                "return_url": "http://127.0.0.1/return", "email": f"bench{i}@example.com",
+            },
+        ))
+
+    return [wallets, await _run_many(ctx, "payment_create", len(ctx.users), job)]
+
+
+async def webhook_burst(ctx: BenchContext, repeats: int = 2) -> List[ScenarioResult]:
+    """Уведомления о платежах, созданных сценарием payment_create; repeats > 1 — дубли, как шлёт YooKassa"""
+    async with httpx.AsyncClient(base_url=ctx.upstream_url) as upstream:
+        payments = (await upstream.get("/_bench/payments")).json()
+
+    notifications = []
+    for p in payments:
+        obj = dict(p, status="succeeded", paid=True)
+        notifications.append({"type": "notification", "event": "payment.succeeded", "object": obj})
+    notifications = notifications * repeats
+
+    async def job(result: ScenarioResult, i: int):
+        await _timed(result, ctx.client.post("/payment/webhook", json=notifications[i]))
+
+    return [await _run_many(ctx, "webhook_burst", len(notifications), job)]
+
+
+async def coupon_create_use(ctx: BenchContext) -> List[ScenarioResult]:
+    create = ScenarioResult("coupon_create")
+    use = ScenarioResult("coupon_use")
+    semaphore = asyncio.Semaphore(ctx.concurrency)
+
+    async def _one(user: BenchUser):
+        async with semaphore:
+            response = await _timed(create, ctx.client.post(
+                "/coupon/create_coupon", params={"name": "bench", "user_id": user.id}, headers=_auth(user),
+            ))
+            data = response.json() if response.status_code == 200 else None
+            if isinstance(data, dict) and data.get("tokenHash"):
+                await _timed(use, ctx.client.post(
+                    "/coupon/used_coupon", params={"token": data["tokenHash"], "user_id": user.id},
+                    headers=_auth(user),
+                ))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one(u) for u in ctx.users), return_exceptions=True)
+    create.wall_time = use.wall_time = time.perf_counter() - start
+    return [create, use]
+
+
+async def nightly_billing(subtractions: int) -> List[ScenarioResult]:
+    """
+    Ночной прогон списаний в процессе стенда (как его выполняет celery).
+    Одна «операция» — весь прогон; запросы считаются через профилировщик SQL.
+    """
+    from app.core.sql_profiler import install_sql_profiler, start_profile, stop_profile
+    from app.db.session import engine
+    from benchmarks.load.seed import seed_subtractions
+    from task_celery.pay_task.dependencies import build_subtraction_service
+
+    await seed_subtractions(subtractions)
+    # при SQL_PROFILER_ENABLED профилировщик уже подключён в app/db/session.py — повтор не задвоит счёт
+    install_sql_profiler(engine)
+
+    result = ScenarioResult("nightly_billing")
+    service = await build_subtraction_service()
+    profile, token = start_profile()
+    start = time.perf_counter()
+    try:
+        await service.auto_payment_service()
+    finally:
+        stop_profile(token)
+    elapsed = time.perf_counter() - start
+    result.add(elapsed, 200, profile.count)
+    result.wall_time = elapsed
+    print(f"nightly_billing: {subtractions} списаний за {elapsed:.2f} с, "
+          f"{profile.count} запросов ({profile.count / max(subtractions, 1):.1f} на списание)")
+    return [result]
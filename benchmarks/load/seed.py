@@ -0,0 +1,82 @@
+"""
+Подготовка базы стенда: схема, справочники, OAuth клиент и синтетические списания.
+Работает с той БД, на которую указывает .env приложения — запускать только на стенде.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app.core.partitions import ensure_partitions
+from app.db.base import Base, import_all_models
+from app.db.session import engine
+
+BENCH_CLIENT_ID = "bench"
+BENCH_CLIENT_SECRET = "bench-secret"
+BENCH_BOT_TOKEN = "123456:bench-bot-token"
+
+
+# таблицы, которые в проде партиционированы миграцией 9e7b3a1f6c58
+PARTITIONED_TABLES = ("payments", "refresh_tokens")
+
+
+async def create_schema() -> None:
+    """
+    Схема по моделям плюс то, что в проде создают миграции: create_all создаёт партиционированные
+    payments и refresh_tokens без партиций (вставка в них падает) и не создаёт payments_archive
+    """
+    import_all_models()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for table in PARTITIONED_TABLES:
+            await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+        # как в миграции 5d9f1e3c7a42: колонки payments + archived_at последней
+        await conn.execute(text("CREATE TABLE IF NOT EXISTS payments_archive (LIKE payments INCLUDING DEFAULTS)"))
+        await conn.execute(text(
+            "ALTER TABLE payments_archive ADD COLUMN IF NOT EXISTS "
+            "archived_at timestamptz NOT NULL DEFAULT now()"
+        ))
+
+    # помесячные партиции текущего месяца и вперёд — как задача tasks.maintain_partitions
+    today = datetime.now(timezone.utc).date()
+    for table in PARTITIONED_TABLES:
+        await ensure_partitions(table, today)
+
+
+async def seed_reference() -> None:
+    """Роли, которые использует регистрация (2 — employer, 3 — executor), и OAuth клиент стенда"""
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO roles (id, name, description) VALUES "
+            "(1, 'Admin', 'bench'), (2, 'Employer', 'bench'), (3, 'Executor', 'bench') "
+            "ON CONFLICT DO NOTHING"
+        ))
+        await conn.execute(text(
+            "INSERT INTO oauth_clients (name, client_id, client_secret, client_bot_token, is_confidential, revoked) "
+            "VALUES ('bench', :client_id, :secret, :bot_token, false, false) "
+            "ON CONFLICT (client_id) DO UPDATE SET client_bot_token = EXCLUDED.client_bot_token"
+        ), {"client_id": BENCH_CLIENT_ID, "secret": BENCH_CLIENT_SECRET, "bot_token": BENCH_BOT_TOKEN})
+
+
+async def seed_subtractions(count: int, amount: Decimal = Decimal("10.00")) -> None:
+    """
+    Создаёт count пользователей с кошельком и активным списанием, у которого next_run уже наступил.
+    Повторный запуск пересоздаёт данные (пользователи bench_sub_*).
+    """
+    next_run = datetime.now(timezone.utc) - timedelta(minutes=1)
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM users WHERE user_name LIKE 'bench_sub_%'"))
+        await conn.execute(text(
+            "INSERT INTO users (user_name, status) "
+            "SELECT 'bench_sub_' || g, true FROM generate_series(1, :count) AS g"
+        ), {"count": count})
+        await conn.execute(text(
+            "INSERT INTO wallets (user_id, balance) "
+            "SELECT id, :balance FROM users WHERE user_name LIKE 'bench_sub_%'"
+        ), {"balance": amount * 100})
+        await conn.execute(text(
+            "INSERT INTO subtraction (id, user_id, card, amount_value, currency, billing_period, next_run, "
+            "status, attempts) "
+            "SELECT gen_random_uuid(), id, false, :amount, 'RUB', '1 month', :next_run, 'active', 0 "
+            "FROM users WHERE user_name LIKE 'bench_sub_%'"
+        ), {"amount": amount, "next_run": next_run})
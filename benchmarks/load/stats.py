@@ -0,0 +1,63 @@
+import json
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Any
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль методом nearest-rank (как в большинстве нагрузочных инструментов)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    queries: List[int] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+    wall_time: float = 0.0
+
+    def add(self, latency: float, status: int, query_count: Optional[int]) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400:
+            self.errors += 1
+        if query_count is not None:
+            self.queries.append(query_count)
+
+    def summary(self) -> Dict[str, Any]:
+        count = len(self.latencies)
+        return {
+            "scenario": self.name,
+            "requests": count,
+            "errors": self.errors,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "rps": round(count / self.wall_time, 1) if self.wall_time else None,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(self.latencies, 99) * 1000, 2),
+            "max_ms": round(max(self.latencies) * 1000, 2) if self.latencies else 0.0,
+            # None — приложение запущено без SQL_PROFILER_ENABLED
+            "queries_per_request": round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+        }
+
+
+def print_report(summaries: List[Dict[str, Any]]) -> None:
+    header = f"{'scenario':<22}{'req':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/req':>8}"
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        qpr = "-" if s["queries_per_request"] is None else f"{s['queries_per_request']:.1f}"
+        rps = "-" if s["rps"] is None else f"{s['rps']:.1f}"
+        print(f"{s['scenario']:<22}{s['requests']:>7}{s['errors']:>6}{rps:>9}"
+              f"{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{qpr:>8}")
+
+
+def save_report(path: str, summaries: List[Dict[str, Any]], meta: Dict[str, Any]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "scenarios": summaries}, f, ensure_ascii=False, indent=2)
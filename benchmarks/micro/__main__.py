@@ -0,0 +1,39 @@
+"""
+Микро-бенчмарки CPU-горячих помощников.
+
+    python -m benchmarks.micro                       # прогон всех кейсов
+    python -m benchmarks.micro --save main           # сохранить базовую линию baselines/main.json
+    python -m benchmarks.micro --compare main        # сравнить с базовой линией
+    python -m benchmarks.micro promo dto --compare main --fail-on-regression
+"""
+import argparse
+import sys
+
+from benchmarks.micro import cases  # noqa: F401 — регистрирует кейсы
+from benchmarks.micro.runner import run_cases, save_baseline, compare
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Микро-бенчмарки CPU-горячих помощников")
+    parser.add_argument("cases", nargs="*", help="префиксы имён кейсов (по умолчанию — все)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность одного замера, с")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--save", metavar="NAME", help="сохранить результаты как базовую линию")
+    parser.add_argument("--compare", metavar="NAME", help="сравнить с сохранённой базовой линией")
+    parser.add_argument("--threshold", type=float, default=0.10, help="допустимое замедление (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    results = run_cases(args.cases, min_time=args.min_time, repeat=args.repeat)
+
+    if args.save:
+        print(f"Базовая линия сохранена: {save_baseline(args.save, results)}")
+    if args.compare:
+        regressed = compare(args.compare, results, args.threshold)
+        if regressed and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
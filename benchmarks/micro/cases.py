@@ -0,0 +1,165 @@
+"""
+Кейсы микро-бенчмарков. Тяжёлые импорты — внутри setup, чтобы отсутствие .env или
+зависимости пропускало только соответствующий кейс.
+"""
+import uuid
+from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from benchmarks.micro.runner import bench
+
+NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+# --- PromoGenerator ---
+
+@bench("promo.init")
+def _promo_init():
+    from app.method.generator_promo import PromoGenerator
+    return PromoGenerator
+
+
+@bench("promo.generate", is_async=True)
+def _promo_generate():
+    from app.method.generator_promo import PromoGenerator
+    gen = PromoGenerator()
+    return gen.generate
+
+
+@bench("promo.generate_batch_1000")
+def _promo_generate_batch():
+    from app.method.generator_promo import PROMO_GENERATOR
+    return lambda: PROMO_GENERATOR.generate_batch(1000)
+
+
+# --- Telegram initData ---
+
+@bench("telegram.check_init_data", is_async=True)
+def _telegram_check():
+    from app.method.initdatatelegram import check_telegram_init_data
+    from benchmarks.load.scenarios import telegram_init_data
+
+    bot_token = "123456:bench-bot-token"
+    init_data = telegram_init_data(bot_token, 777000, "bench_user")
+
+    async def run():
+        await check_telegram_init_data(init_data, bot_token)
+
+    return run
+
+
+# --- AES (PBKDF2 200k итераций — ожидаемо сотни мс) ---
+
+@bench("aes.encrypt", is_async=True)
+def _aes_encrypt():
+    from app.method.aes import encrypt
+
+    async def run():
+        await encrypt("sk-bench-key-0123456789", "client-secret")
+
+    return run
+
+
+@bench("aes.decrypt", is_async=True)
+def _aes_decrypt():
+    import asyncio
+    from app.method.aes import encrypt, decrypt
+
+    token = asyncio.run(encrypt("sk-bench-key-0123456789", "client-secret"))
+
+    async def run():
+        await decrypt(token, "client-secret")
+
+    return run
+
+
+# --- нормализация вебхука YooKassa ---
+
+@bench("webhook.parse_payload")
+def _webhook_parse():
+    from app.handlers.pay.service import parse_webhook_payload
+
+    payload = {
+        "type": "notification",
+        "event": "payment.succeeded",
+        "object": {
+            "id": "2d0e0d0c-000f-5000-9000-1b68e7b15f3f",
+            "status": "succeeded",
+            "paid": True,
+            "amount": {"value": "100.00", "currency": "RUB"},
+            "metadata": {"payment_id": str(uuid.uuid4()), "idempotence_key": str(uuid.uuid4())},
+            "confirmation": {"type": "redirect", "confirmation_url": "https://yoomoney.ru/checkout"},
+        },
+    }
+    headers = {"content-type": "application/json", "user-agent": "YooKassa"}
+    return lambda: parse_webhook_payload(payload, headers)
+
+
+# --- _to_dto репозиториев ---
+
+@bench("dto.user")
+def _dto_user():
+    from app.handlers.auth.crud import UserRepository
+
+    m = SimpleNamespace(id=1, user_name="bench", email="bench@example.com", first_name="B", last_name="Ench",
+                        role_id=3)
+    return lambda: UserRepository._to_dto(m)
+
+
+@bench("dto.payment")
+def _dto_payment():
+    from app.handlers.pay.crud import PaymentRepository
+
+    m = SimpleNamespace(
+        id=uuid.uuid4(), user_id=1, wallet_id=1, amount_value=Decimal("100.00"),
+        confirmation_url="https://yoomoney.ru/checkout", confirmation_type="redirect", status="pending",
+        yookassa_payment_id="2d0e0d0c", currency="RUB", idempotency_key=str(uuid.uuid4()),
+        metadata_payments={"type_payment": "single"}, created_at=NOW, updated_at=NOW, closed_at=None,
+    )
+    return lambda: PaymentRepository._to_dto(m)
+
+
+@bench("dto.wallet")
+def _dto_wallet():
+    from app.handlers.pay.crud import WalletRepository
+
+    m = SimpleNamespace(id=1, user_id=1, balance=Decimal("1000.00"), updated_at=NOW)
+    return lambda: WalletRepository._to_dto(m)
+
+
+@bench("dto.coupon", is_async=True)
+def _dto_coupon():
+    from app.handlers.coupon.crud import CouponRepository
+
+    repo = CouponRepository(db=None)
+    m = SimpleNamespace(id=1, name="bench", user_id=1, description="10", promo_count=False, status=True,
+                        token_hash="ABCD1234", created_at=NOW)
+
+    async def run():
+        await repo._to_dto(m)
+
+    return run
+
+
+@bench("dto.refresh_token")
+def _dto_refresh_token():
+    from app.handlers.session.crud import RefreshTokenRepository
+
+    m = SimpleNamespace(id=1, session_id=1, revoked=False, created_at=NOW, expires_at=NOW + timedelta(days=1),
+                        used_at=None, token_hash="0" * 64)
+    return lambda: RefreshTokenRepository._to_dto(m)
+
+
+@bench("dto.oauth_client", is_async=True)
+def _dto_oauth_client():
+    from app.handlers.session.crud import OauthClientRepository
+
+    m = SimpleNamespace(id=1, name="bench", client_id="bench", client_secret="secret", redirect_url=None,
+                        grant_types=["authorization_code"], scopes=[], is_confidential=False, created_at=NOW,
+                        updated_at=None, revoked=False, client_bot_token=None)
+
+    async def run():
+        await OauthClientRepository._to_dto(m)
+
+    return run
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Any, Optional, List
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[], Callable]
+    is_async: bool
+
+
+REGISTRY: Dict[str, Case] = {}
+
+
+def bench(name: str, is_async: bool = False):
+    """
+    Регистрирует кейс. Декорируемая функция — setup: готовит данные и возвращает
+    функцию без аргументов (или корутинную функцию при is_async=True), которую и меряем.
+    """
+
+    def decorator(setup: Callable[[], Callable]):
+        REGISTRY[name] = Case(name=name, setup=setup, is_async=is_async)
+        return setup
+
+    return decorator
+
+
+def _time_loops(fn: Callable, is_async: bool, loops: int, loop: asyncio.AbstractEventLoop) -> float:
+    if is_async:
+        async def _inner():
+            start = time.perf_counter()
+            for _ in range(loops):
+                await fn()
+            return time.perf_counter() - start
+
+        return loop.run_until_complete(_inner())
+
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - start
+
+
+def measure(case: Case, min_time: float = 0.2, repeat: int = 7) -> Dict[str, Any]:
+    """Калибрует число повторов под min_time, затем снимает repeat замеров времени одной операции"""
+    fn = case.setup()
+    loop = asyncio.new_event_loop()
+    try:
+        loops = 1
+        while True:
+            elapsed = _time_loops(fn, case.is_async, loops, loop)
+            if elapsed >= min_time or loops >= 1_000_000:
+                break
+            loops *= 2 if elapsed * 2 >= min_time else 10
+
+        samples = [_time_loops(fn, case.is_async, loops, loop) / loops for _ in range(repeat)]
+    finally:
+        loop.close()
+
+    return {
+        "loops": loops,
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples),
+    }
+
+
+def run_cases(names: Optional[List[str]], min_time: float, repeat: int) -> Dict[str, Dict[str, Any]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, case in REGISTRY.items():
+        if names and not any(name.startswith(n) for n in names):
+            continue
+        try:
+            results[name] = measure(case, min_time=min_time, repeat=repeat)
+        except Exception as e:
+            # кейсу нужен .env или зависимость, которой нет в окружении — не валим весь прогон
+            print(f"{name:<40} пропущен: {type(e).__name__}: {e}")
+            continue
+        r = results[name]
+        print(f"{name:<40} {_fmt(r['median']):>12} ± {_fmt(r['stdev']):>10}  ({r['loops']} loops)")
+    return results
+
+
+def _fmt(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def save_baseline(name: str, results: Dict[str, Dict[str, Any]]) -> Path:
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    meta = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "commit": _git_commit(),
+    }
+    path.write_text(json.dumps({"meta": meta, "results": results}, indent=2), encoding="utf-8")
+    return path
+
+
+def compare(name: str, results: Dict[str, Dict[str, Any]], threshold: float) -> bool:
+    """Печатает сравнение с базовой линией. Возвращает True, если есть регрессии больше threshold"""
+    path = BASELINE_DIR / f"{name}.json"
+    if not path.exists():
+        raise SystemExit(
+            f"Базовая линия {path} не найдена. Снимите её на этой машине: "
+            f"python -m benchmarks.micro --save {name} (см. benchmarks/README.md)"
+        )
+    baseline = json.loads(path.read_text(encoding="utf-8"))
+    base_results = baseline["results"]
+    print()
+    print(f"Сравнение с {path.name} (commit {baseline['meta'].get('commit')}, "
+          f"python {baseline['meta'].get('python')})")
+    header = f"{'case':<40}{'baseline':>12}{'current':>12}{'ratio':>8}"
+    print(header)
+    print("-" * len(header))
+
+    regressed = False
+    for case_name, current in results.items():
+        base = base_results.get(case_name)
+        if base is None:
+            print(f"{case_name:<40}{'-':>12}{_fmt(current['median']):>12}{'new':>8}")
+            continue
+        ratio = current["median"] / base["median"] if base["median"] else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressed = True
+        elif ratio < 1 - threshold:
+            mark = "  faster"
+        print(f"{case_name:<40}{_fmt(base['median']):>12}{_fmt(current['median']):>12}{ratio:>7.2f}x{mark}")
+    return regressed
@@ -1,5 +1,6 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_ready
 
 from app.core.config import settings
 
@@ -7,7 +8,7 @@ celery = Celery(
     "billing",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=["task_celery.pay_task.task"],
+    include=["task_celery.pay_task.task", "task_celery.gpt_task.task", "task_celery.retention_task.task"],
 )
 
 celery.conf.update(
@@ -18,6 +19,8 @@ celery.conf.update(
     result_serializer="json",
     task_acks_late=True,
     worker_prefetch_multiplier=1,
+    # запросы к OpenAI долгие — отдельная очередь и отдельный воркер, чтобы не задерживать billing
+    task_routes={"tasks.run_gpt_prompt": {"queue": "gpt"}},
 )
 
 celery.conf.beat_schedule = {
@@ -26,6 +29,33 @@ celery.conf.beat_schedule = {
         "schedule": crontab(hour=3, minute=0),     # каждый день в 03:00 Europe/Moscow
         "options": {"queue": "billing"},           # опционально: очередь для billing
     },
+    "recover-init-payments-every-5-min": {
+        "task": "tasks.recover_init_payments",
+        "schedule": crontab(minute="*/5"),         # платежи, зависшие в INIT между шагами создания
+        "options": {"queue": "billing"},
+    },
+    "compact-wallet-ledger-every-10-min": {
+        "task": "tasks.compact_wallet_ledger",
+        "schedule": crontab(minute="*/10"),        # чтение баланса суммирует только несвёрнутые записи
+        "options": {"queue": "billing"},
+    },
+    "daily-retention-04-30": {
+        "task": "tasks.run_retention",
+        "schedule": crontab(hour=4, minute=30),    # ночью, после автосписаний
+    },
+    "daily-partitions-04-00": {
+        "task": "tasks.maintain_partitions",
+        "schedule": crontab(hour=4, minute=0),     # партиции на месяцы вперёд, отсоединение старых
+    },
 }
 
-celery.conf.timezone = "Europe/Moscow"
\ No newline at end of file
+celery.conf.timezone = "Europe/Moscow"
+
+
+@worker_ready.connect
+def _start_metrics_server(**kwargs):
+    # метрики billing отдаются отдельным портом; дочерние процессы prefork
+    # пишут в PROMETHEUS_MULTIPROC_DIR, а сервер в главном процессе их агрегирует
+    if settings.CELERY_METRICS_PORT:
+        from app.core.metrics import start_metrics_server
+        start_metrics_server(settings.CELERY_METRICS_PORT)
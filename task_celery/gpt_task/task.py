@@ -0,0 +1,36 @@
+from task_celery.celery_config import celery
+from task_celery.loop import loop
+from app.core.outbound import GatewayRejected
+from app.handlers.gpt.jobs import release_job_slot
+from app.handlers.gpt.openai_client import complete_prompt
+
+
+@celery.task(name="tasks.run_gpt_prompt", bind=True, acks_late=True, track_started=True,
+             max_retries=5, soft_time_limit=180, time_limit=200)
+def run_gpt_prompt(self, model: str, system_prompt: str, image_url, user_id: int, client_id, use_cache: bool = True):
+    from app.main import logger
+
+    retrying = False
+    try:
+        result = loop.run_until_complete(
+            complete_prompt(model, system_prompt, image_url, user_id, client_id, use_cache)
+        )
+        # учётные данные прокси не должны попадать в result backend
+        result.pop("proxy_auth", None)
+        return result
+    except GatewayRejected as exc:
+        # шлюз воркера перегружен — задача остаётся в очереди, а не падает
+        if self.request.retries < self.max_retries:
+            retrying = True
+            raise self.retry(exc=exc, countdown=exc.retry_after)
+        raise
+    except Exception as exc:
+        logger.exception("run_gpt_prompt failed: %s", exc)
+        raise
+    finally:
+        if not retrying:
+            try:
+                loop.run_until_complete(release_job_slot(user_id))
+            except Exception as exc:
+                # счётчик всё равно истечёт по TTL
+                logger.warning("release_job_slot failed: %s", exc)
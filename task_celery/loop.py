@@ -0,0 +1,11 @@
+"""
+Общий event loop для всех модулей задач.
+
+Движок БД и клиент Redis держат соединения, привязанные к loop, в котором они открыты.
+Воркер обслуживает несколько очередей (например, celery,billing) в одном процессе, поэтому
+у всех задач должен быть один loop — иначе соединение из пула попадёт в чужой loop.
+"""
+import asyncio
+
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
@@ -5,10 +5,10 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.abs.unit_of_work import IUnitOfWorkSubtraction
-from app.db.session import get_db
-from app.handlers.pay.UOW import SqlAlchemyUnitOfWorkWallet
+from app.db.session import get_db, AsyncSessionLocal
+from app.handlers.pay.UOW import SqlAlchemyUnitOfWorkWallet, SqlAlchemyUnitOfWorkPayment
 from app.handlers.pay.dependencies import walletServiceDep
-from app.handlers.pay.service import SqlAlchemyServiceWallet
+from app.handlers.pay.service import SqlAlchemyServiceWallet, SqlAlchemyServicePayment, SqlAlchemyServicePaymentApi
 from app.handlers.session.UOW import SqlAlchemyUnitOfWork
 from app.handlers.session.dependencies import SessionServiceDep
 from app.handlers.session.service import SqlAlchemyServiceSession, SqlAlchemyServiceOauthClient, \
@@ -72,4 +72,22 @@ async def build_subtraction_service() -> SqlAlchemySubtractionService:
     finally:
         await agen.aclose()
 
+def build_payment_recovery_service() -> SqlAlchemyServicePayment:
+    # восстановлению INIT платежей нужны только uow и API провайдера; каждая транзакция
+    # берёт свою сессию из фабрики, поэтому соединение не держится во время запроса к YooKassa
+    return SqlAlchemyServicePayment(
+        uow=SqlAlchemyUnitOfWorkPayment(AsyncSessionLocal),
+        session_service=None,
+        payment_service_api=SqlAlchemyServicePaymentApi(),
+        wallet_service=None,
+        user_service=None,
+    )
+
+def build_wallet_ledger_service() -> SqlAlchemyServiceWallet:
+    # свёртке журнала нужен только uow; каждая пачка — своя сессия из фабрики
+    return SqlAlchemyServiceWallet(
+        uow=SqlAlchemyUnitOfWorkWallet(AsyncSessionLocal),
+        session_service=None,
+    )
+
 subtractionServiceDep = Annotated[SqlAlchemySubtractionService, Depends(get_session_service_subtraction)]
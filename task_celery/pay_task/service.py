@@ -1,4 +1,5 @@
 import math
+import time
 from datetime import datetime
 from decimal import Decimal
 from typing import Optional
@@ -7,6 +8,7 @@ from zoneinfo import ZoneInfo
 from dateutil.relativedelta import relativedelta
 
 from app.core.abs.unit_of_work import IUnitOfWorkSubtraction
+from app.core.metrics import BILLING_BATCH_DURATION, BILLING_SUBTRACTIONS
 from app.handlers.pay.interfaces import AsyncWalletService
 from app.handlers.pay.schemas import UpdateWalletsService
 from app.handlers.session.interfaces import AsyncSessionService
@@ -111,10 +113,12 @@ class SqlAlchemySubtractionService(AsyncSubtractionService):
                 await self.uow.subtraction_repo.update_subtraction_user(up_data)
                 sub.idempotency_key = new_key
 
+            # ключ записи журнала — на каждый плановый запуск: повтор того же запуска не спишет дважды
             up_wal = UpdateWalletsService(
                 id=w.id,
                 amount=sub.amount_value,
                 reason="minus",
+                idempotency_key=f"subtraction:{sub.id}:{(sub.next_run or datetime.now(TZ)):%Y%m%d}",
             )
             try:
                 updated = await self.wallet_service.update_wallets_user_internal(update_data=up_wal)
@@ -142,6 +146,11 @@ class SqlAlchemySubtractionService(AsyncSubtractionService):
                 logger.error("Wallet update returned False for user %s", sub.user_id)
                 return False
 
+            if updated.applied is False:
+                # запись с ключом этого запуска уже есть — списание прошло в прошлой попытке
+                logger.info("Subtraction %s for run %s already debited, advancing next_run", sub.id,
+                            up_wal.idempotency_key)
+
             # 5) успешный дебит: обновляем Subtraction: attempts reset, last_error=None, advance next_run
             new_next = await self._advance_next_run(sub.next_run or datetime.now(TZ), sub.billing_period)
             up_data = SubtractionUpdate(
@@ -181,14 +190,18 @@ class SqlAlchemySubtractionService(AsyncSubtractionService):
         pages = math.ceil(total_pool / BATCH)
 
         for page in range(pages):
+            batch_start = time.perf_counter()
             offset = page * BATCH
             list_subtrc = await self.uow.subtraction_repo.get_subtractions_internal(limit=BATCH, offset=offset)
 
             for sub_trac in list_subtrc:
                 try:
                     # каждое списание должно быть СВОЕЙ транзакцией -> process_subtraction помечен @transactional()
-                    await self.process_subtraction(sub_trac)
+                    result = await self.process_subtraction(sub_trac)
+                    BILLING_SUBTRACTIONS.labels("success" if result else "failed").inc()
                 except Exception as e:
+                    BILLING_SUBTRACTIONS.labels("error").inc()
                     logger.error("Subtraction failed for user %s: %s", sub_trac.user_id, e)
+            BILLING_BATCH_DURATION.observe(time.perf_counter() - batch_start)
         return True
 
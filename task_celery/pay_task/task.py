@@ -1,10 +1,7 @@
-import asyncio
-
 from task_celery.celery_config import celery
-from task_celery.pay_task.dependencies import build_subtraction_service
-
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
+from task_celery.loop import loop
+from task_celery.pay_task.dependencies import build_subtraction_service, build_payment_recovery_service, \
+    build_wallet_ledger_service
 
 
 @celery.task(name="tasks.run_auto_payment", bind=True, acks_late=True)
@@ -24,3 +21,25 @@ def run_auto_payment(self):
     except Exception as exc:
         logger.exception("run_auto_payment failed: %s", exc)
         raise
+
+
+@celery.task(name="tasks.recover_init_payments", bind=True, acks_late=True)
+def recover_init_payments(self):
+    from app.main import logger
+
+    try:
+        return loop.run_until_complete(build_payment_recovery_service().recover_init_payments())
+    except Exception as exc:
+        logger.exception("recover_init_payments failed: %s", exc)
+        raise
+
+
+@celery.task(name="tasks.compact_wallet_ledger", bind=True, acks_late=True)
+def compact_wallet_ledger(self):
+    from app.main import logger
+
+    try:
+        return loop.run_until_complete(build_wallet_ledger_service().compact_ledger())
+    except Exception as exc:
+        logger.exception("compact_wallet_ledger failed: %s", exc)
+        raise
@@ -0,0 +1,27 @@
+from task_celery.celery_config import celery
+from task_celery.loop import loop
+from app.core.partitions import maintain_partitions
+from app.core.retention import run_retention
+
+
+@celery.task(name="tasks.run_retention", bind=True, acks_late=True)
+def run_retention_task(self):
+    from app.main import logger
+
+    try:
+        # отчёт по таблицам уходит в result backend
+        return loop.run_until_complete(run_retention())
+    except Exception as exc:
+        logger.exception("run_retention failed: %s", exc)
+        raise
+
+
+@celery.task(name="tasks.maintain_partitions", bind=True, acks_late=True)
+def maintain_partitions_task(self):
+    from app.main import logger
+
+    try:
+        return loop.run_until_complete(maintain_partitions())
+    except Exception as exc:
+        logger.exception("maintain_partitions failed: %s", exc)
+        raise